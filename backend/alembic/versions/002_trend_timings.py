@@ -0,0 +1,24 @@
+"""Per-stage timings on trend results
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "002"
+down_revision: Union[str, None] = "001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("trend_results", sa.Column("timings_json", postgresql.JSONB(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("trend_results", "timings_json")
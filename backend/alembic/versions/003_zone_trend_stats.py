@@ -0,0 +1,36 @@
+"""Incremental zone trend statistics
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 00:00:00
+
+After upgrading, fill the table once from the existing trend results:
+    python -m app.services.zone_aggregates rebuild
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "003"
+down_revision: Union[str, None] = "002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "zone_trend_stats",
+        sa.Column("zone_key", sa.String(64), primary_key=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("median_delta_pct", sa.Float(), nullable=True),
+        sa.Column("p10_delta_pct", sa.Float(), nullable=True),
+        sa.Column("p90_delta_pct", sa.Float(), nullable=True),
+        sa.Column("sketch_json", postgresql.JSONB(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("zone_trend_stats")
@@ -0,0 +1,38 @@
+"""Stored delta column and indexes for SQL-side zone medians
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 00:00:00
+
+Adding a stored generated column rewrites trend_results (ACCESS EXCLUSIVE lock for
+the duration): run it in a quiet window on large installations.
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "004"
+down_revision: Union[str, None] = "003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "trend_results",
+        sa.Column(
+            "eur_per_kwh_delta_pct",
+            sa.Float(),
+            sa.Computed("(user_trend_json ->> 'eur_per_kwh_delta_pct')::double precision", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index("ix_user_sessions_zone_key_id", "user_sessions", ["zone_key", "id"])
+    op.create_index("ix_trend_results_session_id_delta", "trend_results", ["session_id", "eur_per_kwh_delta_pct"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_trend_results_session_id_delta", table_name="trend_results")
+    op.drop_index("ix_user_sessions_zone_key_id", table_name="user_sessions")
+    op.drop_column("trend_results", "eur_per_kwh_delta_pct")
@@ -0,0 +1,25 @@
+"""Rollup level on zone trend statistics
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("zone_trend_stats", sa.Column("level", sa.String(16), nullable=False, server_default="cap"))
+    op.create_index("ix_zone_trend_stats_level", "zone_trend_stats", ["level"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_zone_trend_stats_level", table_name="zone_trend_stats")
+    op.drop_column("zone_trend_stats", "level")
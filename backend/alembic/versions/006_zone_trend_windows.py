@@ -0,0 +1,49 @@
+"""Zone trend statistics by bill month and rolling windows
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 00:00:00
+
+After upgrading, fill both tables once from the existing trend results:
+    python -m app.services.zone_aggregates rebuild
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "zone_trend_monthly",
+        sa.Column("zone_key", sa.String(64), primary_key=True),
+        sa.Column("month", sa.Date(), primary_key=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("sketch_json", postgresql.JSONB(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_zone_trend_monthly_updated_at", "zone_trend_monthly", ["updated_at"])
+    op.create_table(
+        "zone_trend_windows",
+        sa.Column("zone_key", sa.String(64), primary_key=True),
+        sa.Column("month", sa.Date(), primary_key=True),
+        sa.Column("window_months", sa.Integer(), primary_key=True),
+        sa.Column("level", sa.String(16), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("median_delta_pct", sa.Float(), nullable=True),
+        sa.Column("p10_delta_pct", sa.Float(), nullable=True),
+        sa.Column("p90_delta_pct", sa.Float(), nullable=True),
+        sa.Column("computed_at", sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("zone_trend_windows")
+    op.drop_index("ix_zone_trend_monthly_updated_at", table_name="zone_trend_monthly")
+    op.drop_table("zone_trend_monthly")
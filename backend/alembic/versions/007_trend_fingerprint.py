@@ -0,0 +1,25 @@
+"""Input fingerprint and job id on trend results
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("trend_results", sa.Column("fingerprint", sa.String(64), nullable=True))
+    op.add_column("trend_results", sa.Column("job_id", sa.String(64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("trend_results", "job_id")
+    op.drop_column("trend_results", "fingerprint")
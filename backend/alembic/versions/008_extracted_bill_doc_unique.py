@@ -0,0 +1,35 @@
+"""One extracted bill per document
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 00:00:00
+
+Duplicates left by concurrent extract stages are removed first (the oldest bill of
+each document is kept).
+
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        DELETE FROM extracted_bills b
+        USING extracted_bills keep
+        WHERE b.doc_id = keep.doc_id
+          AND (b.created_at, b.id) > (keep.created_at, keep.id)
+        """
+    )
+    op.drop_index("ix_extracted_bills_doc_id", table_name="extracted_bills")
+    op.create_index("ix_extracted_bills_doc_id", "extracted_bills", ["doc_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_extracted_bills_doc_id", table_name="extracted_bills")
+    op.create_index("ix_extracted_bills_doc_id", "extracted_bills", ["doc_id"])
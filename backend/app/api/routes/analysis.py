@@ -3,14 +3,20 @@ from __future__ import annotations
 
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_db
+from app.api.streaming import sse_response, websocket_progress
+from app.core.admission import AdmissionRejected, source_for_partner_key
+from app.core.progress import make_event, session_topic
+from app.core.security import hash_ip
 from app.db.models import UserSession, UploadedDocument
-from app.workers.tasks import analyze_session
+from app.db.session import get_sessionmaker
+from app.workers import tasks
 
 router = APIRouter(prefix="/analyze", tags=["analysis"])
 
@@ -31,7 +37,12 @@ class StatusResponse(BaseModel):
 
 
 @router.post("/start", response_model=StartResponse)
-def start_analysis(payload: StartRequest, db: Session = Depends(get_db)):
+def start_analysis(
+    payload: StartRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    x_partner_key: str | None = Header(None),
+):
     try:
         sid = uuid.UUID(payload.session_id)
     except ValueError:
@@ -40,11 +51,22 @@ def start_analysis(payload: StartRequest, db: Session = Depends(get_db)):
     if not session:
         raise HTTPException(status_code=404, detail="Sessione non trovata")
     docs = list(db.execute(select(UploadedDocument).where(UploadedDocument.session_id == sid)).scalars().all())
-    docs = [d[0] for d in docs]
-    if len(docs) < 2:
+    if not {"recent", "old"} <= {d.doc_type for d in docs}:
         raise HTTPException(status_code=400, detail="Carica 2 bollette (recent + old) prima di avviare l'analisi")
-    task = analyze_session.delay(str(sid))
-    return StartResponse(job_id=task.id, status="running")
+    if not session.ip_hash:  # sessioni create prima dell'admission control
+        session.ip_hash = hash_ip(request.client.host if request.client else None)
+        db.commit()
+    # job_id tracks the final (trend) stage: "done" only once the result is stored.
+    # Duplicate requests get the job already running (or finished, if the inputs are unchanged).
+    try:
+        submission = tasks.submit_analysis(db, session, docs, source=source_for_partner_key(x_partner_key))
+    except AdmissionRejected as exc:
+        raise HTTPException(
+            status_code=429,
+            detail="Troppe analisi in coda. Riprova tra poco.",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    return StartResponse(job_id=submission.job_id, status="done" if submission.outcome == "unchanged" else "running")
 
 
 @router.get("/status/{job_id}", response_model=StatusResponse)
@@ -67,3 +89,41 @@ def get_status(job_id: str, session_id: str | None = Query(None), db: Session =
         except Exception:
             pass
     return StatusResponse(job_id=job_id, status=status, session_status=session_status)
+
+
+def _initial_session_event(session_id: str) -> dict | None:
+    """Stato già concluso letto dal DB (se l'evento pub/sub è scaduto o mai ricevuto).
+
+    Sessione DB propria e chiusa subito: con Depends(get_db) la connessione resterebbe
+    presa dal pool per tutta la durata dello stream.
+    """
+    try:
+        sid = uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="session_id non valido")
+    with get_sessionmaker()() as db:
+        session = db.get(UserSession, sid)
+        status = session.status if session else None
+    if status is None:
+        raise HTTPException(status_code=404, detail="Sessione non trovata")
+    if status in ("verified", "error"):
+        return make_event(status)
+    return None
+
+
+@router.get("/events/{session_id}")
+def stream_events(session_id: str):
+    """Server-Sent Events: stage transitions of the analysis until verified/error."""
+    initial = _initial_session_event(session_id)
+    return sse_response(session_topic(session_id), initial)
+
+
+@router.websocket("/ws/{session_id}")
+async def stream_events_ws(websocket: WebSocket, session_id: str):
+    """WebSocket variant of /events: one JSON message per stage transition."""
+    try:
+        initial = await run_in_threadpool(_initial_session_event, session_id)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket_progress(websocket, session_topic(session_id), initial)
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import uuid
+from datetime import date
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
@@ -11,6 +12,8 @@ from app.api.deps import get_db
 from app.core.security import verify_token
 from app.db.models import UserSession, TrendResult, Passport, ShareArtifact
 from app.core.config import get_settings
+from app.services.zone_aggregates import stats_key
+from app.services.zone_windows import month_of, zone_series
 
 router = APIRouter(prefix="/result", tags=["result"])
 
@@ -21,6 +24,9 @@ class ResultResponse(BaseModel):
     explanation_short: str
     user_trend_json: dict
     zone_trend_json: dict
+    zone_level: str | None = None  # cap | prefix | region: zone level the user was compared with
+    # rolling-window medians of that zone by bill month: {"3"|"6"|"12": [{month, median, p10, p90, count}]}
+    zone_series: dict[str, list[dict]] = {}
     passport_pdf_url: str | None
     share_image_url: str | None
     share_token: str | None
@@ -48,6 +54,13 @@ def get_result(
         raise HTTPException(status_code=404, detail="Risultato non trovato")
     passport = db.query(Passport).filter(Passport.session_id == sid).first()
     share_art = db.query(ShareArtifact).filter(ShareArtifact.session_id == sid).first()
+    zone_trend = tr.zone_trend_json or {}
+    series = {}
+    if zone_trend.get("zone") or session.zone_key:
+        key = stats_key(zone_trend.get("level") or "cap", zone_trend.get("zone") or session.zone_key)
+        # curve fino al mese della bolletta confrontata (risultati senza finestra: mese dell'analisi)
+        last = date.fromisoformat(f"{zone_trend['month']}-01") if zone_trend.get("month") else month_of(tr.created_at)
+        series = zone_series(db, key, last)
     base = get_settings().BACKEND_URL.rstrip("/")
     passport_url = f"{base}/api/storage/{passport.pdf_path}" if passport and passport.pdf_path else None
     share_url = f"{base}/api/storage/{share_art.share_image_path}" if share_art and share_art.share_image_path else None
@@ -56,7 +69,9 @@ def get_result(
         position=tr.position,
         explanation_short=tr.explanation_short,
         user_trend_json=tr.user_trend_json or {},
-        zone_trend_json=tr.zone_trend_json or {},
+        zone_trend_json=zone_trend,
+        zone_level=zone_trend.get("level"),
+        zone_series=series,
         passport_pdf_url=passport_url,
         share_image_url=share_url,
         share_token=share_art.share_token if share_art else None,
@@ -3,11 +3,12 @@ from __future__ import annotations
 
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_db
+from app.core.security import hash_ip
 from app.db.models import UserSession
 from app.services.zone_aggregates import cap_to_zone_key
 from app.utils.validation import validate_cap
@@ -31,8 +32,8 @@ class SetZoneResponse(BaseModel):
 
 
 @router.post("/start", response_model=StartResponse)
-def start(db: Session = Depends(get_db)):
-    session = UserSession(status="started")
+def start(request: Request, db: Session = Depends(get_db)):
+    session = UserSession(status="started", ip_hash=hash_ip(request.client.host if request.client else None))
     db.add(session)
     db.commit()
     db.refresh(session)
@@ -3,10 +3,12 @@ from __future__ import annotations
 import logging
 import uuid
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File as UploadFileDep, HTTPException, Request, UploadFile
+from fastapi import APIRouter, Depends, File as UploadFileDep, HTTPException, Request, UploadFile
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_db
+from app.api.streaming import sse_response
+from app.core.progress import make_event, submission_topic
 from app.api.schemas import (
     AnalyzeResponse,
     LeadRequest,
@@ -18,19 +20,20 @@ from app.api.schemas import (
 )
 from app.core.config import get_settings
 from app.db.models import Finding, Submission
+from app.db.session import get_sessionmaker
 from app.services.reports import get_report_by_token
 from app.services.submissions import (
     add_file_record,
     build_presigned_targets,
+    claim_analysis_enqueue,
     create_submission,
     get_submission,
     list_files,
     make_storage_path,
-    run_analysis,
     set_analysis_state,
 )
+from app.services.analysis_queue import get_analysis_executor
 from app.storage import get_storage
-from app.db.session import get_sessionmaker
 
 logger = logging.getLogger(__name__)
 
@@ -120,18 +123,8 @@ async def local_presigned_put(path: str, request: Request):
     return {"ok": True, "path": path}
 
 
-def _analysis_task(submission_id: uuid.UUID) -> None:
-    SessionMaker = get_sessionmaker()
-    db = SessionMaker()
-    try:
-        storage = get_storage()
-        run_analysis(db, submission_id, storage)
-    finally:
-        db.close()
-
-
 @router.post("/submissions/{submission_id}/analyze", response_model=AnalyzeResponse)
-def analyze_route(submission_id: uuid.UUID, bg: BackgroundTasks, db: Session = Depends(get_db)):
+def analyze_route(submission_id: uuid.UUID, db: Session = Depends(get_db)):
     sub = get_submission(db, submission_id)
     if not sub:
         raise HTTPException(status_code=404, detail="Submission non trovata")
@@ -143,8 +136,16 @@ def analyze_route(submission_id: uuid.UUID, bg: BackgroundTasks, db: Session = D
     if len(files) > 2:
         raise HTTPException(status_code=400, detail="Massimo 2 bollette consentite")
 
-    set_analysis_state(db, sub, "pending", None)
-    bg.add_task(_analysis_task, submission_id)
+    # dedup: se un'analisi è già accodata/in corso non se ne accoda un'altra
+    if not claim_analysis_enqueue(db, submission_id):
+        return AnalyzeResponse(id=submission_id, analysis_state="running")
+    try:
+        get_analysis_executor().submit(submission_id)
+    except Exception as e:
+        logger.exception("analysis_enqueue_failed", extra={"submission_id": str(submission_id)})
+        db.refresh(sub)
+        set_analysis_state(db, sub, "error", "Coda analisi non disponibile, riprova")
+        raise HTTPException(status_code=503, detail="Servizio di analisi non disponibile, riprova tra poco") from e
     return AnalyzeResponse(id=submission_id, analysis_state="running")
 
 
@@ -164,6 +165,19 @@ def status_route(submission_id: uuid.UUID, db: Session = Depends(get_db)):
     )
 
 
+@router.get("/submissions/{submission_id}/events")
+def events_route(submission_id: uuid.UUID):
+    """Server-Sent Events con l'avanzamento dell'analisi (alternativa al polling di /status)."""
+    # sessione DB chiusa prima dello stream (Depends(get_db) la terrebbe aperta fino alla fine)
+    with get_sessionmaker()() as db:
+        sub = get_submission(db, submission_id)
+        state = sub.analysis_state if sub else None
+    if not sub:
+        raise HTTPException(status_code=404, detail="Submission non trovata")
+    initial = make_event(state) if state in ("done", "error") else None
+    return sse_response(submission_topic(submission_id), initial)
+
+
 @router.get("/report/{share_token}", response_model=ReportOut)
 def report_route(share_token: str, db: Session = Depends(get_db)):
     rep = get_report_by_token(db, share_token)
@@ -0,0 +1,40 @@
+"""SSE / WebSocket delivery of analysis progress events (see app.core.progress)."""
+from __future__ import annotations
+
+import json
+from typing import Any, AsyncIterator
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from app.core.config import get_settings
+from app.core.progress import stream_progress
+
+
+async def _sse_frames(topic: str, initial: dict[str, Any] | None) -> AsyncIterator[str]:
+    # retry: se la connessione cade il browser riprova dopo 3 s (EventSource)
+    yield "retry: 3000\n\n"
+    async for event in stream_progress(topic, initial, keepalive_seconds=get_settings().PROGRESS_KEEPALIVE_SECONDS):
+        if event is None:
+            yield ": keepalive\n\n"
+        else:
+            yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+
+def sse_response(topic: str, initial: dict[str, Any] | None = None) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_frames(topic, initial),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx non deve bufferizzare lo stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def websocket_progress(websocket: WebSocket, topic: str, initial: dict[str, Any] | None = None) -> None:
+    await websocket.accept()
+    try:
+        async for event in stream_progress(topic, initial, keepalive_seconds=get_settings().PROGRESS_KEEPALIVE_SECONDS):
+            await websocket.send_json(event if event is not None else {"stage": "keepalive"})
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
@@ -0,0 +1,4 @@
+"""Offline batch analysis for backfills and partner uploads (`python -m app.batch`)."""
+from app.batch.runner import BatchItem, BatchStats, discover_items, process_item, run_batch
+
+__all__ = ["BatchItem", "BatchStats", "discover_items", "process_item", "run_batch"]
@@ -0,0 +1,236 @@
+"""Batch analysis: extract_fields_from_documents + LLM fallback + run_rules over many bills."""
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from app.batch.llm import BatchLLM, document_text, fill_missing_fields, make_llm
+from app.batch.sinks import Checkpoint
+from app.extraction.pipeline import compute_confidence, extract_fields_from_documents
+from app.rules.engine import run_rules
+
+logger = logging.getLogger(__name__)
+
+MIME_BY_SUFFIX = {".pdf": "application/pdf", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+STAGES = ("read", "extract", "llm", "rules")
+
+
+@dataclass
+class BatchItem:
+    id: str
+    docs: list[tuple[str, str]]  # (kind latest|older, path)
+
+
+def _item_from_row(row: dict[str, Any], base: Path, line: int) -> BatchItem:
+    latest = row.get("latest")
+    if not latest:
+        raise ValueError(f"manifest row {line}: 'latest' is required")
+    docs = [("latest", str((base / latest).resolve()))]
+    if row.get("older"):
+        docs.append(("older", str((base / row["older"]).resolve())))
+    return BatchItem(id=str(row.get("id") or latest), docs=docs)
+
+
+def _manifest_items(path: Path) -> Iterator[BatchItem]:
+    """Manifest: JSONL or CSV with `id`, `latest`, optional `older` (paths relative to the manifest)."""
+    base = path.parent
+    with path.open(encoding="utf-8", newline="") as fh:
+        if path.suffix == ".csv":
+            for line, row in enumerate(csv.DictReader(fh), start=2):
+                yield _item_from_row(row, base, line)
+        else:
+            for line, raw in enumerate(fh, start=1):
+                if raw.strip():
+                    yield _item_from_row(json.loads(raw), base, line)
+
+
+def _directory_items(root: Path) -> Iterator[BatchItem]:
+    """Directory: every bill file is an item; a subdirectory is one customer with up to
+    two bills, sorted by name (first = latest, second = older)."""
+    for entry in sorted(root.iterdir()):
+        if entry.is_dir():
+            files = sorted(p for p in entry.iterdir() if p.suffix.lower() in MIME_BY_SUFFIX)
+            if files:
+                yield BatchItem(id=entry.name, docs=list(zip(("latest", "older"), map(str, files[:2]))))
+        elif entry.suffix.lower() in MIME_BY_SUFFIX:
+            yield BatchItem(id=entry.name, docs=[("latest", str(entry))])
+
+
+def discover_items(source: Path) -> Iterator[BatchItem]:
+    return _directory_items(source) if source.is_dir() else _manifest_items(source)
+
+
+# --- worker side -----------------------------------------------------------------
+
+_llm: BatchLLM | None = None
+
+
+def _init_worker(llm_name: str, stub_latency_seconds: float) -> None:
+    global _llm
+    _llm = make_llm(llm_name, stub_latency_seconds)
+
+
+def process_item(item: BatchItem) -> dict[str, Any]:
+    """Analyse one item; never raises (errors become a record with status "error")."""
+    llm = _llm or BatchLLM()
+    timings: dict[str, float] = {}
+    record: dict[str, Any] = {"id": item.id, "docs": len(item.docs)}
+    try:
+        t = time.perf_counter()
+        docs = []
+        for kind, path in item.docs:
+            p = Path(path)
+            docs.append({"kind": kind, "mime": MIME_BY_SUFFIX.get(p.suffix.lower(), "application/octet-stream"),
+                         "bytes": p.read_bytes()})
+        timings["read"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        fields, confidence = extract_fields_from_documents(docs)
+        timings["extract"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        calls_before, filled = llm.calls, {}
+        for doc in docs:
+            kind_fields = fields.get(doc["kind"])
+            if kind_fields is not None:
+                got = fill_missing_fields(kind_fields, document_text(doc["mime"], doc["bytes"]), llm)
+                if got:
+                    filled[doc["kind"]] = got
+        if filled:
+            confidence = compute_confidence(fields.get("latest") or {}, fields.get("older"), fields.get("meta") or {})
+        timings["llm"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        findings = run_rules(fields)
+        timings["rules"] = time.perf_counter() - t
+
+        record.update(status="ok", confidence=confidence, fields=fields,
+                      findings=[asdict(f) for f in findings],
+                      llm={"backend": llm.name, "calls": llm.calls - calls_before, "filled": filled})
+    except Exception as e:
+        logger.warning("Batch item %s failed: %s", item.id, e)
+        record.update(status="error", error=str(e)[:500])
+    record["timings"] = {k: round(v, 6) for k, v in timings.items()}
+    return record
+
+
+# --- driver ----------------------------------------------------------------------
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+@dataclass
+class BatchStats:
+    items: int = 0
+    docs: int = 0
+    errors: int = 0
+    skipped: int = 0
+    llm_calls: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    stage_seconds: dict[str, list[float]] = field(default_factory=lambda: {s: [] for s in STAGES})
+
+    def add(self, record: dict[str, Any]) -> None:
+        self.items += 1
+        self.docs += record.get("docs", 0)
+        self.errors += record.get("status") != "ok"
+        self.llm_calls += (record.get("llm") or {}).get("calls", 0)
+        for stage, seconds in (record.get("timings") or {}).items():
+            self.stage_seconds.setdefault(stage, []).append(seconds)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "items": self.items,
+            "docs": self.docs,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "llm_calls": self.llm_calls,
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_s": round(self.docs / elapsed, 2) if elapsed > 0 else 0.0,
+            "stages": {
+                stage: {
+                    "mean_ms": round(1000 * sum(v) / len(v), 2),
+                    "p95_ms": round(1000 * _percentile(v, 0.95), 2),
+                    "total_s": round(sum(v), 3),
+                }
+                for stage, v in self.stage_seconds.items() if v
+            },
+        }
+
+
+def run_batch(
+    items: Iterable[BatchItem],
+    sink: Any,
+    checkpoint: Checkpoint | None = None,
+    workers: int = 0,
+    llm: str = "stub",
+    stub_latency_seconds: float = 0.0,
+    report_every_seconds: float = 10.0,
+    on_report: Callable[[dict[str, Any]], None] | None = None,
+) -> BatchStats:
+    """Process `items` (skipping those in `checkpoint`) and write one record each to `sink`.
+
+    workers=0 runs in-process (debugging, tests); otherwise a process pool with at most
+    4 items in flight per worker, so memory stays bounded on large inputs. Items in
+    error are written but not checkpointed: a resumed run retries them.
+    """
+    stats = BatchStats()
+    done = checkpoint.load() if checkpoint else set()
+    ok_ids: set[str] = set()
+    last_report = time.perf_counter()
+
+    def consume(record: dict[str, Any]) -> None:
+        nonlocal last_report
+        stats.add(record)
+        if record.get("status") == "ok":
+            ok_ids.add(record["id"])
+        durable = sink.write(record)
+        if checkpoint:
+            checkpoint.add([i for i in durable if i in ok_ids])
+        if on_report and time.perf_counter() - last_report >= report_every_seconds:
+            last_report = time.perf_counter()
+            on_report(stats.summary())
+
+    def pending_items() -> Iterator[BatchItem]:
+        for item in items:
+            if item.id in done:
+                stats.skipped += 1
+                continue
+            yield item
+
+    try:
+        if workers <= 0:
+            _init_worker(llm, stub_latency_seconds)
+            for item in pending_items():
+                consume(process_item(item))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(llm, stub_latency_seconds)) as pool:
+                in_flight: set[Future] = set()
+                for item in pending_items():
+                    if len(in_flight) >= workers * 4:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for fut in finished:
+                            consume(fut.result())
+                    in_flight.add(pool.submit(process_item, item))
+                for fut in wait(in_flight).done:
+                    consume(fut.result())
+    finally:
+        durable = sink.close()
+        if checkpoint:
+            checkpoint.add([i for i in durable if i in ok_ids])
+    return stats
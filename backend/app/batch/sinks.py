@@ -0,0 +1,116 @@
+"""Result sinks and checkpoint for batch runs.
+
+A sink returns the ids it has made durable; only those go into the checkpoint, so a
+crash never marks as done an item whose result was still in a buffer.
+"""
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+
+class JsonlSink:
+    """One JSON object per line, appended (a resumed run continues the same file)."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = path.open("a", encoding="utf-8")
+
+    def write(self, record: dict[str, Any]) -> list[str]:
+        self._fh.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._fh.flush()
+        return [record["id"]]
+
+    def close(self) -> list[str]:
+        self._fh.close()
+        return []
+
+
+class ParquetSink:
+    """Directory of Parquet files (one per run, row groups of `row_group_size`).
+
+    Nested values (fields, findings, timings) are stored as JSON strings so the schema
+    stays fixed whatever the bills contain. Requires pyarrow.
+    """
+
+    COLUMNS = ("id", "status", "confidence", "docs", "error", "fields", "findings", "timings", "llm")
+
+    def __init__(self, path: Path, row_group_size: int = 200):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:  # pragma: no cover - dipende dall'ambiente
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)") from e
+        self._pa, self._pq = pa, pq
+        path.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.file = path / f"part-{stamp}-{os.getpid()}.parquet"
+        self.row_group_size = row_group_size
+        self._rows: list[dict[str, Any]] = []
+        self._writer = None
+        self._schema = pa.schema([
+            ("id", pa.string()), ("status", pa.string()), ("confidence", pa.int32()), ("docs", pa.int32()),
+            ("error", pa.string()), ("fields", pa.string()), ("findings", pa.string()),
+            ("timings", pa.string()), ("llm", pa.string()),
+        ])
+
+    def _row(self, record: dict[str, Any]) -> dict[str, Any]:
+        row = {k: record.get(k) for k in ("id", "status", "confidence", "docs", "error")}
+        for k in ("fields", "findings", "timings", "llm"):
+            row[k] = json.dumps(record.get(k), ensure_ascii=False, default=str) if k in record else None
+        return row
+
+    def _flush(self) -> list[str]:
+        if not self._rows:
+            return []
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.file, self._schema)
+        table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+        self._writer.write_table(table)
+        ids = [r["id"] for r in self._rows]
+        self._rows = []
+        return ids
+
+    def write(self, record: dict[str, Any]) -> list[str]:
+        self._rows.append(self._row(record))
+        return self._flush() if len(self._rows) >= self.row_group_size else []
+
+    def close(self) -> list[str]:
+        ids = self._flush()
+        if self._writer is not None:
+            self._writer.close()
+        return ids
+
+
+def open_sink(path: Path, fmt: str | None = None):
+    fmt = fmt or ("parquet" if path.suffix == ".parquet" else "jsonl")
+    if fmt == "parquet":
+        return ParquetSink(path)
+    if fmt == "jsonl":
+        return JsonlSink(path)
+    raise ValueError(f"Unknown output format: {fmt} (expected jsonl or parquet)")
+
+
+class Checkpoint:
+    """Append-only list of completed item ids (one per line)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> set[str]:
+        if not self.path.exists():
+            return set()
+        with self.path.open(encoding="utf-8") as fh:
+            return {line.strip() for line in fh if line.strip()}
+
+    def add(self, ids: list[str]) -> None:
+        if not ids:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as fh:
+            fh.write("".join(f"{i}\n" for i in ids))
+            fh.flush()
+            os.fsync(fh.fileno())
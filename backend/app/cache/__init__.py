@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+from app.cache.base import ExtractionCache, NullCache, content_key
+from app.cache.memory import MemoryCache
+from app.core.config import get_settings
+
+__all__ = ["ExtractionCache", "content_key", "get_extraction_cache"]
+
+
+@lru_cache
+def get_extraction_cache() -> ExtractionCache:
+    s = get_settings()
+    backend = s.EXTRACTION_CACHE_BACKEND.lower()
+    if backend == "redis":
+        from app.cache.redis_cache import RedisCache
+
+        return RedisCache(
+            url=s.REDIS_URL,
+            ttl_seconds=s.EXTRACTION_CACHE_TTL_SECONDS,
+            max_entries=s.EXTRACTION_CACHE_MAX_ENTRIES,
+        )
+    if backend == "memory":
+        return MemoryCache(
+            ttl_seconds=s.EXTRACTION_CACHE_TTL_SECONDS,
+            max_entries=s.EXTRACTION_CACHE_MAX_ENTRIES,
+            max_bytes=s.EXTRACTION_CACHE_MAX_BYTES,
+        )
+    return NullCache()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Any
+
+from app.core import metrics
+
+
+def content_key(data: bytes, namespace: str, version: str) -> str:
+    """Chiave content-addressed: SHA-256 dei bytes + versione dell'estrattore."""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{namespace}:{version}:{digest}"
+
+
+class ExtractionCache(ABC):
+    """Cache dei risultati di estrazione (dict JSON-serializzabili)."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def _get(self, key: str) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _set(self, key: str, value: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        value = self._get(key)
+        namespace = key.split(":", 1)[0]
+        if value is None:
+            self.misses += 1
+            metrics.incr("extraction_cache_misses", namespace=namespace)
+        else:
+            self.hits += 1
+            metrics.incr("extraction_cache_hits", namespace=namespace)
+        return value
+
+    def set(self, key: str, value: dict[str, Any]) -> None:
+        self._set(key, value)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class NullCache(ExtractionCache):
+    def _get(self, key: str) -> dict[str, Any] | None:
+        return None
+
+    def _set(self, key: str, value: dict[str, Any]) -> None:
+        return None
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.cache.base import ExtractionCache
+
+
+class MemoryCache(ExtractionCache):
+    """LRU in-process con TTL ed eviction per numero voci e per dimensione (bytes JSON)."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int, max_bytes: int):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, tuple[float, int, str]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, size, payload = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                return None
+            self._data.move_to_end(key)
+        return json.loads(payload)
+
+    def _set(self, key: str, value: dict[str, Any]) -> None:
+        payload = json.dumps(value, default=str)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (time.monotonic() + self.ttl_seconds, size, payload)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from typing import Any
+
+from redis import Redis
+
+from app.cache.base import ExtractionCache
+
+logger = logging.getLogger(__name__)
+
+
+class RedisCache(ExtractionCache):
+    """Cache su Redis: TTL per chiave + indice LRU (sorted set) limitato a `max_entries`.
+
+    Errori Redis non bloccano l'analisi: valgono come miss / set ignorato.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        ttl_seconds: int,
+        max_entries: int,
+        max_entry_bytes: int = 1_000_000,
+        prefix: str = "extcache",
+    ):
+        super().__init__()
+        # timeout brevi: un Redis che non risponde vale come miss, non blocca il task
+        self.client = Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.prefix = prefix
+        self._index = f"{prefix}:index"
+
+    def _k(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _get(self, key: str) -> dict[str, Any] | None:
+        try:
+            raw = self.client.get(self._k(key))
+            if raw is None:
+                self.client.incr(f"{self.prefix}:stats:misses")
+                return None
+            pipe = self.client.pipeline()
+            pipe.zadd(self._index, {key: time.time()})
+            pipe.incr(f"{self.prefix}:stats:hits")
+            pipe.execute()
+            return json.loads(raw)
+        except Exception as e:
+            logger.warning("extraction cache get failed: %s", e)
+            return None
+
+    def _set(self, key: str, value: dict[str, Any]) -> None:
+        payload = json.dumps(value, default=str)
+        if len(payload) > self.max_entry_bytes:
+            return
+        try:
+            pipe = self.client.pipeline()
+            pipe.set(self._k(key), payload, ex=self.ttl_seconds)
+            pipe.zadd(self._index, {key: time.time()})
+            pipe.zcard(self._index)
+            _, _, size = pipe.execute()
+            overflow = int(size) - self.max_entries
+            if overflow > 0:
+                evicted = self.client.zpopmin(self._index, overflow)
+                if evicted:
+                    self.client.delete(*[self._k(k.decode() if isinstance(k, bytes) else k) for k, _ in evicted])
+        except Exception as e:
+            logger.warning("extraction cache set failed: %s", e)
@@ -0,0 +1,212 @@
+"""Admission control for analysis jobs: bounded queue, partner priority, per-IP fair share.
+
+Every admitted job holds a slot until its pipeline finishes (or the slot TTL expires):
+- organic traffic is admitted while the queue is below (1 - ANALYSIS_PARTNER_RESERVE) of
+  ANALYSIS_MAX_QUEUE_DEPTH, partners up to the full depth;
+- a single ip_hash may hold at most ANALYSIS_IP_SHARE of the queue (at least one slot),
+  so one campaign burst cannot fill it for everyone;
+- admitted jobs are sent with a Celery priority (partner first).
+Rejections raise AdmissionRejected, which the API turns into 429 + Retry-After.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.core import metrics
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Priorità messaggi Celery (broker Redis: 0 = massima, step 0/3/6/9)
+PRIORITIES = {"partner": 0, "organic": 6}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int, depth: int):
+        super().__init__(f"analysis not admitted ({reason}, depth={depth})")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.depth = depth
+
+
+@dataclass
+class Admission:
+    job_id: str
+    source: str
+    priority: int
+    depth: int
+
+
+class AdmissionStore(ABC):
+    @abstractmethod
+    def try_admit(self, job_id: str, group: str, depth_limit: int, group_limit: int | None,
+                  ttl_seconds: int) -> tuple[str | None, int]:
+        """Take a slot; returns (rejection reason or None, queue depth before admission)."""
+
+    @abstractmethod
+    def release(self, job_id: str) -> float | None:
+        """Free the job's slot; returns its admission time (epoch seconds) if it held one."""
+
+    @abstractmethod
+    def depth(self) -> int: ...
+
+
+class MemoryAdmissionStore(AdmissionStore):
+    """Single-process store (tests, inline setups)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._slots: dict[str, tuple[str, float]] = {}  # job_id -> (group, admitted_at)
+        self._ttl = 0.0
+
+    def _expire(self, now: float) -> None:
+        if self._ttl:
+            for job_id in [j for j, (_, at) in self._slots.items() if at <= now - self._ttl]:
+                del self._slots[job_id]
+
+    def try_admit(self, job_id: str, group: str, depth_limit: int, group_limit: int | None,
+                  ttl_seconds: int) -> tuple[str | None, int]:
+        now = time.time()
+        with self._lock:
+            self._ttl = ttl_seconds
+            self._expire(now)
+            depth = len(self._slots)
+            if depth >= depth_limit:
+                return "queue_full", depth
+            if group_limit is not None and sum(1 for g, _ in self._slots.values() if g == group) >= group_limit:
+                return "fair_share", depth
+            self._slots[job_id] = (group, now)
+            return None, depth
+
+    def release(self, job_id: str) -> float | None:
+        with self._lock:
+            slot = self._slots.pop(job_id, None)
+        return slot[1] if slot else None
+
+    def depth(self) -> int:
+        with self._lock:
+            self._expire(time.time())
+            return len(self._slots)
+
+
+# Controllo e presa dello slot in un solo passo (nessuna corsa tra API concorrenti).
+# KEYS: coda globale (zset job->ts), coda del gruppo, hash job->gruppo
+# ARGV: job_id, now, ttl, depth_limit, group_limit (-1 = nessun limite), group
+_ADMIT_SCRIPT = """
+local cutoff = tonumber(ARGV[2]) - tonumber(ARGV[3])
+redis.call('zremrangebyscore', KEYS[1], '-inf', cutoff)
+redis.call('zremrangebyscore', KEYS[2], '-inf', cutoff)
+local depth = redis.call('zcard', KEYS[1])
+if depth >= tonumber(ARGV[4]) then return {'queue_full', depth} end
+local group_limit = tonumber(ARGV[5])
+if group_limit >= 0 and redis.call('zcard', KEYS[2]) >= group_limit then return {'fair_share', depth} end
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[1])
+redis.call('zadd', KEYS[2], ARGV[2], ARGV[1])
+redis.call('expire', KEYS[2], ARGV[3])
+redis.call('hset', KEYS[3], ARGV[1], ARGV[6])
+return {'', depth}
+"""
+
+_RELEASE_SCRIPT = """
+local group = redis.call('hget', KEYS[2], ARGV[1])
+local admitted = redis.call('zscore', KEYS[1], ARGV[1])
+redis.call('zrem', KEYS[1], ARGV[1])
+redis.call('hdel', KEYS[2], ARGV[1])
+if group then redis.call('zrem', ARGV[2] .. group, ARGV[1]) end
+return admitted
+"""
+
+
+class RedisAdmissionStore(AdmissionStore):
+    """Slots in Redis sorted sets (score = admission time), shared by all API processes and workers."""
+
+    def __init__(self, url: str, prefix: str = "admission"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.prefix = prefix
+        self._queue = f"{prefix}:queue"
+        self._groups = f"{prefix}:groups"
+
+    def _group_key(self, group: str) -> str:
+        return f"{self.prefix}:group:{group}"
+
+    def try_admit(self, job_id: str, group: str, depth_limit: int, group_limit: int | None,
+                  ttl_seconds: int) -> tuple[str | None, int]:
+        reason, depth = self.client.eval(
+            _ADMIT_SCRIPT, 3, self._queue, self._group_key(group), self._groups,
+            job_id, time.time(), ttl_seconds, depth_limit, -1 if group_limit is None else group_limit, group,
+        )
+        reason = reason.decode() if isinstance(reason, bytes) else reason
+        return reason or None, int(depth)
+
+    def release(self, job_id: str) -> float | None:
+        try:
+            admitted = self.client.eval(_RELEASE_SCRIPT, 2, self._queue, self._groups, job_id,
+                                        f"{self.prefix}:group:")
+        except Exception as e:  # lo slot scade comunque col TTL
+            logger.warning("Admission release failed (%s): %s", job_id, e)
+            return None
+        return float(admitted) if admitted is not None else None
+
+    def depth(self) -> int:
+        return int(self.client.zcard(self._queue))
+
+
+@lru_cache
+def get_admission_store() -> AdmissionStore:
+    s = get_settings()
+    if s.ANALYSIS_DEDUP_BACKEND.lower() == "memory":
+        return MemoryAdmissionStore()
+    return RedisAdmissionStore(s.REDIS_URL)
+
+
+def source_for_partner_key(partner_key: str | None) -> str:
+    """"partner" for a configured X-Partner-Key, "organic" otherwise."""
+    keys = {k.strip() for k in get_settings().ANALYSIS_PARTNER_KEYS.split(",") if k.strip()}
+    return "partner" if partner_key and partner_key in keys else "organic"
+
+
+def admit(job_id: str, source: str, ip_hash: str | None) -> Admission:
+    """Take a queue slot for `job_id` or raise AdmissionRejected."""
+    s = get_settings()
+    max_depth = max(1, s.ANALYSIS_MAX_QUEUE_DEPTH)
+    if source == "partner":
+        depth_limit, group, group_limit = max_depth, "partner", None
+    else:
+        depth_limit = max(1, int(max_depth * (1 - s.ANALYSIS_PARTNER_RESERVE)))
+        group = f"ip:{ip_hash or 'unknown'}"
+        group_limit = max(1, int(max_depth * s.ANALYSIS_IP_SHARE))
+    reason, depth = get_admission_store().try_admit(
+        job_id, group, depth_limit, group_limit, s.ANALYSIS_INFLIGHT_TTL_SECONDS
+    )
+    metrics.set_gauge("analysis_queue_depth", depth if reason else depth + 1)
+    if reason:
+        metrics.incr("analysis_admission_total", source=source, outcome=reason)
+        raise AdmissionRejected(reason, s.ANALYSIS_RETRY_AFTER_SECONDS, depth)
+    metrics.incr("analysis_admission_total", source=source, outcome="admitted")
+    return Admission(job_id=job_id, source=source, priority=PRIORITIES.get(source, PRIORITIES["organic"]),
+                     depth=depth + 1)
+
+
+def release(job_id: str) -> None:
+    """Free the slot when the pipeline ends; records the job's time in the queue."""
+    store = get_admission_store()
+    admitted_at = store.release(job_id)
+    if admitted_at is not None:
+        try:
+            metrics.set_gauge("analysis_queue_depth", store.depth())
+        except Exception:
+            pass
+        metrics.observe("analysis_job_seconds", max(0.0, time.time() - admitted_at))
+
+
+def record_queue_wait(enqueued_at: float | None, stage: str) -> None:
+    """Time a stage message waited in the broker before a worker picked it up."""
+    if enqueued_at:
+        metrics.observe("analysis_queue_wait_seconds", max(0.0, time.time() - enqueued_at), stage=stage)
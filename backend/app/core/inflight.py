@@ -0,0 +1,97 @@
+"""In-flight registry: one running job per key.
+
+`claim(key, owner)` is an atomic set-if-absent with TTL: the first caller owns the key,
+later callers get the owner back (and coalesce onto its job) until `release` or expiry.
+The TTL bounds the damage of a worker that dies without releasing.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class InflightRegistry(ABC):
+    @abstractmethod
+    def claim(self, key: str, owner: str, ttl_seconds: int) -> str | None:
+        """Take `key` for `owner`; returns the current owner if already taken, else None."""
+
+    @abstractmethod
+    def release(self, key: str, owner: str) -> None:
+        """Free `key` only if still held by `owner`."""
+
+
+class MemoryInflightRegistry(InflightRegistry):
+    """Single-process registry (tests, inline setups)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._owners: dict[str, tuple[str, float]] = {}
+
+    def claim(self, key: str, owner: str, ttl_seconds: int) -> str | None:
+        now = time.monotonic()
+        with self._lock:
+            current = self._owners.get(key)
+            if current is not None and current[1] > now:
+                return current[0]
+            self._owners[key] = (owner, now + ttl_seconds)
+            return None
+
+    def release(self, key: str, owner: str) -> None:
+        with self._lock:
+            current = self._owners.get(key)
+            if current is not None and current[0] == owner:
+                del self._owners[key]
+
+
+# DEL solo se il valore è ancora nostro (un lock scaduto e ripreso da altri non va toccato)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisInflightRegistry(InflightRegistry):
+    """Redis registry shared by API processes and workers (SET NX EX + compare-and-delete)."""
+
+    def __init__(self, url: str, prefix: str = "inflight"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.prefix = prefix
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.prefix}:lock:{key}"
+
+    def claim(self, key: str, owner: str, ttl_seconds: int) -> str | None:
+        name = self._lock_key(key)
+        for _ in range(3):
+            if self.client.set(name, owner, nx=True, ex=ttl_seconds):
+                return None
+            current = self.client.get(name)
+            if current is not None:
+                return current.decode()
+            # scaduto tra SET e GET: riprova
+        return None if self.client.set(name, owner, nx=True, ex=ttl_seconds) else owner
+
+    def release(self, key: str, owner: str) -> None:
+        try:
+            self.client.eval(_RELEASE_SCRIPT, 1, self._lock_key(key), owner)
+        except Exception as e:  # il TTL libera comunque il lock
+            logger.warning("In-flight release failed (%s): %s", key, e)
+
+
+@lru_cache
+def get_inflight_registry() -> InflightRegistry:
+    s = get_settings()
+    if s.ANALYSIS_DEDUP_BACKEND.lower() == "memory":
+        return MemoryInflightRegistry()
+    return RedisInflightRegistry(s.REDIS_URL)
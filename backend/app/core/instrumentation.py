@@ -0,0 +1,139 @@
+"""Per-stage timing spans: Prometheus histograms plus per-analysis timings.
+
+    with collect_timings() as timings:      # one analysis (document, session, submission)
+        with span("pdf_parse"):
+            ...
+    meta["timings"] = timings.as_dict()     # {"pdf_parse": {"ms": 12.3, "count": 1}, ...}
+
+Every span feeds the `bollettometro_stage_seconds{stage}` histogram (prometheus_client,
+optional: without it durations go to the in-process counters as sum/count) and, when a
+collector is active in the current context, the analysis' own timings. Threads started
+with `contextvars.copy_context().run` share the caller's collector (see ocr.py).
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+try:  # dipendenza opzionale
+    import prometheus_client
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    prometheus_client = None
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_STAGE_SECONDS = (
+    prometheus_client.Histogram("bollettometro_stage_seconds", "Duration of analysis stages", ["stage"],
+                                buckets=STAGE_BUCKETS)
+    if prometheus_client is not None else None
+)
+
+
+class StageTimings:
+    """Accumulated durations per stage for one analysis (thread-safe: OCR pages run in a pool).
+
+    Nested collectors forward to their parent, so a session-level collector also sees
+    the stages timed inside each document's extraction.
+    """
+
+    def __init__(self, parent: StageTimings | None = None) -> None:
+        self._lock = threading.Lock()
+        self._stages: dict[str, list[float]] = {}
+        self._parent = parent
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._stages.setdefault(stage, []).append(seconds)
+        if self._parent is not None:
+            self._parent.add(stage, seconds)
+
+    def as_dict(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {stage: {"ms": round(sum(v) * 1000, 1), "count": len(v)} for stage, v in self._stages.items()}
+
+
+_current: contextvars.ContextVar[StageTimings | None] = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[StageTimings]:
+    timings = StageTimings(_current.get())
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    if _STAGE_SECONDS is not None:
+        _STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    else:
+        metrics.observe("bollettometro_stage_seconds", seconds, stage=stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - t0)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Prometheus exposition of the stage histograms and the app.core.metrics values.
+
+    With prometheus_client every metric is in its registry (see metrics.py); with
+    PROMETHEUS_MULTIPROC_DIR set (prefork workers, several API processes) they are
+    aggregated across processes. Without it, the in-process counters and gauges.
+    """
+    if prometheus_client is None:
+        return metrics.render_text().encode(), CONTENT_TYPE
+    registry = prometheus_client.REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import CollectorRegistry, multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """GET /metrics on a daemon thread (Celery workers, which have no HTTP server of their own)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body, content_type = render_metrics()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Metrics endpoint on %s:%d/metrics", host, port)
+    return server
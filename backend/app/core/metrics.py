@@ -0,0 +1,117 @@
+"""In-process counters and gauges for operational metrics (thread-safe).
+
+With prometheus_client installed every counter, observation and gauge is also recorded
+in a Prometheus metric of the same name (Counter, Summary, Gauge), created on first use
+with that call's label names. Under PROMETHEUS_MULTIPROC_DIR those are aggregated across
+processes, so values recorded in prefork children reach the parent's /metrics; the
+in-process values below stay per process (logs, tests, /metrics without the extra).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import Counter
+from typing import Any
+
+try:  # dipendenza opzionale
+    import prometheus_client
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters: Counter[tuple[str, tuple[tuple[str, str], ...]]] = Counter()
+_gauges: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+_prometheus: dict[str, Any] = {}
+
+
+def _key(name: str, labels: dict[str, Any]) -> tuple[str, tuple[tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _prometheus_metric(kind: str, name: str, labels: dict[str, Any]) -> Any:
+    """The Prometheus metric mirroring `name` with these labels (None without prometheus_client)."""
+    if prometheus_client is None:
+        return None
+    try:
+        with _lock:
+            metric = _prometheus.get(name)
+            if metric is None:
+                labelnames = sorted(labels)
+                if kind == "gauge":
+                    metric = prometheus_client.Gauge(name, name, labelnames, multiprocess_mode="livemax")
+                else:
+                    cls = prometheus_client.Counter if kind == "counter" else prometheus_client.Summary
+                    metric = cls(name, name, labelnames)
+                _prometheus[name] = metric
+        return metric.labels(**labels) if labels else metric
+    except Exception as e:  # nomi o label incoerenti: resta solo il valore in-process
+        logger.warning("Prometheus metric %s unavailable: %s", name, e)
+        return None
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    with _lock:
+        _counters[_key(name, labels)] += value
+    metric = _prometheus_metric("counter", name, labels)
+    if metric is not None:
+        metric.inc(value)
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """Durations and sizes: `name_sum` / `name_count` counters (mean = sum / count)."""
+    with _lock:
+        _counters[_key(f"{name}_sum", labels)] += value
+        _counters[_key(f"{name}_count", labels)] += 1
+    metric = _prometheus_metric("summary", name, labels)
+    if metric is not None:
+        metric.observe(value)
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+    metric = _prometheus_metric("gauge", name, labels)
+    if metric is not None:
+        metric.set(value)
+
+
+def get_gauge(name: str, **labels: Any) -> float | None:
+    with _lock:
+        return _gauges.get(_key(name, labels))
+
+
+def get_counter(name: str, **labels: Any) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def snapshot() -> dict[str, float]:
+    """Flat view `name{label="v"}` -> value, for logs and debug endpoints."""
+    out: dict[str, float] = {}
+    with _lock:
+        for (name, labels), value in [*_counters.items(), *_gauges.items()]:
+            suffix = ",".join(f'{k}="{v}"' for k, v in labels)
+            out[f"{name}{{{suffix}}}" if suffix else name] = value
+    return out
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_text() -> str:
+    """Prometheus text exposition of counters and gauges (untyped samples)."""
+    lines: list[str] = []
+    with _lock:
+        for (name, labels), value in sorted([*_counters.items(), *_gauges.items()]):
+            suffix = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"{name}{{{suffix}}} {value}" if suffix else f"{name} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
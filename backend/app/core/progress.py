@@ -0,0 +1,287 @@
+"""Analysis progress events: workers publish stage transitions, the API streams them (SSE/WebSocket).
+
+Each topic ("session:<id>", "submission:<id>") has a pub/sub channel plus a "last event"
+key, so a client that connects mid-analysis immediately gets the current stage.
+Publishing is best effort: a broken bus never fails an analysis.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, AsyncIterator
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Stadi noti (pct indicativo per la barra di avanzamento del frontend)
+STAGES: dict[str, tuple[str, int]] = {
+    "queued": ("In coda...", 5),
+    "extracting": ("Lettura bolletta", 25),
+    "ocr": ("Riconoscimento testo", 40),
+    "extracted": ("Bolletta letta", 60),
+    "computing_trend": ("Calcolo andamento", 85),
+    "running": ("Elaborazione bollette...", 30),
+    "verified": ("Completato", 100),
+    "done": ("Completato", 100),
+    "error": ("Si è verificato un errore", 100),
+}
+TERMINAL_STAGES = frozenset({"verified", "done", "error"})
+_DOC_LABELS = {"recent": "recente", "old": "precedente", "latest": "recente", "older": "precedente"}
+
+
+def make_event(stage: str, *, doc: str | None = None, page: int | None = None, pages: int | None = None,
+               detail: str | None = None) -> dict[str, Any]:
+    label, pct = STAGES.get(stage, (stage, 0))
+    if doc:
+        label = f"{label} {_DOC_LABELS.get(doc, doc)}"
+    if page is not None and pages:
+        label = f"{label}: pagina {page}/{pages}"
+    event: dict[str, Any] = {"stage": stage, "label": label, "pct": pct, "terminal": stage in TERMINAL_STAGES,
+                             "ts": time.time()}
+    for key, value in (("doc", doc), ("page", page), ("pages", pages), ("detail", detail)):
+        if value is not None:
+            event[key] = value
+    return event
+
+
+class Subscription(ABC):
+    @abstractmethod
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+
+class ProgressBus(ABC):
+    @abstractmethod
+    def publish(self, topic: str, event: dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def last(self, topic: str) -> dict[str, Any] | None: ...
+
+    @abstractmethod
+    async def subscribe(self, topic: str) -> Subscription: ...
+
+
+class _MemorySubscription(Subscription):
+    def __init__(self, bus: "MemoryProgressBus", topic: str):
+        self.bus, self.topic = bus, topic
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        with self.bus._lock:
+            subs = self.bus._subs.get(self.topic, [])
+            if self in subs:
+                subs.remove(self)
+
+
+class MemoryProgressBus(ProgressBus):
+    """In-process bus: API and worker in the same process (tests, inline executor)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._last: dict[str, dict[str, Any]] = {}
+        self._subs: dict[str, list[_MemorySubscription]] = {}
+
+    def publish(self, topic: str, event: dict[str, Any]) -> None:
+        with self._lock:
+            self._last[topic] = event
+            subs = list(self._subs.get(topic, []))
+        for sub in subs:
+            sub.loop.call_soon_threadsafe(sub.queue.put_nowait, event)
+
+    async def last(self, topic: str) -> dict[str, Any] | None:
+        with self._lock:
+            return self._last.get(topic)
+
+    async def subscribe(self, topic: str) -> Subscription:
+        sub = _MemorySubscription(self, topic)
+        with self._lock:
+            self._subs.setdefault(topic, []).append(sub)
+        return sub
+
+
+class _RedisListener:
+    """One pub/sub connection per process and event loop, fanned out to per-client queues.
+
+    Channels are subscribed while at least one client waits on them (reference counted);
+    a single reader task dispatches their messages and stops when the last client leaves.
+    """
+
+    def __init__(self, client: Any):
+        self.pubsub = client.pubsub()
+        self.queues: dict[str, set[asyncio.Queue[dict[str, Any]]]] = {}
+        self.lock = asyncio.Lock()
+        self.reader: asyncio.Task[None] | None = None
+
+    async def add(self, channel: str) -> asyncio.Queue[dict[str, Any]]:
+        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        async with self.lock:
+            if channel not in self.queues:
+                await self.pubsub.subscribe(channel)
+                self.queues[channel] = set()
+            self.queues[channel].add(queue)
+            if self.reader is None or self.reader.done():
+                self.reader = asyncio.create_task(self._read())
+        return queue
+
+    async def remove(self, channel: str, queue: asyncio.Queue[dict[str, Any]]) -> None:
+        async with self.lock:
+            queues = self.queues.get(channel)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self.queues[channel]
+                try:
+                    await self.pubsub.unsubscribe(channel)
+                except Exception as e:
+                    logger.warning("Progress unsubscribe failed (%s): %s", channel, e)
+
+    async def _read(self) -> None:
+        while self.queues:
+            try:
+                msg = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:  # il client si riconnette e risottoscrive al prossimo comando
+                logger.warning("Progress listener error: %s", e)
+                await asyncio.sleep(1.0)
+                continue
+            if not msg or msg.get("type") != "message":
+                continue
+            channel = msg["channel"].decode() if isinstance(msg["channel"], bytes) else msg["channel"]
+            event = json.loads(msg["data"])
+            for queue in list(self.queues.get(channel, ())):
+                queue.put_nowait(event)
+
+
+class _RedisSubscription(Subscription):
+    def __init__(self, listener: _RedisListener, channel: str, queue: asyncio.Queue[dict[str, Any]]):
+        self.listener, self.channel, self.queue = listener, channel, queue
+
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        await self.listener.remove(self.channel, self.queue)
+
+
+class RedisProgressBus(ProgressBus):
+    """Redis pub/sub (workers publish, every API process can stream).
+
+    Async reads share one client (one connection pool) per process and event loop, and
+    all the streams of that loop share one subscriber connection: the number of Redis
+    connections does not grow with the number of waiting clients.
+    """
+
+    def __init__(self, url: str, ttl_seconds: int = 3600, prefix: str = "progress"):
+        import redis
+
+        self.url = url
+        self.ttl = ttl_seconds
+        self.prefix = prefix
+        self._sync = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self._async: tuple[Any, Any, _RedisListener] | None = None  # (event loop, client, listener)
+
+    def _loop_state(self) -> tuple[Any, _RedisListener]:
+        import redis.asyncio as aioredis
+
+        loop = asyncio.get_running_loop()
+        if self._async is None or self._async[0] is not loop:  # un client asyncio vale per un solo loop
+            client = aioredis.Redis.from_url(self.url)
+            self._async = (loop, client, _RedisListener(client))
+        return self._async[1], self._async[2]
+
+    def _client(self) -> Any:
+        return self._loop_state()[0]
+
+    def _channel(self, topic: str) -> str:
+        return f"{self.prefix}:{topic}"
+
+    def _last_key(self, topic: str) -> str:
+        return f"{self.prefix}:last:{topic}"
+
+    def publish(self, topic: str, event: dict[str, Any]) -> None:
+        payload = json.dumps(event)
+        try:
+            pipe = self._sync.pipeline(transaction=False)
+            pipe.setex(self._last_key(topic), self.ttl, payload)
+            pipe.publish(self._channel(topic), payload)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("Progress publish failed (%s): %s", topic, e)
+
+    async def last(self, topic: str) -> dict[str, Any] | None:
+        raw = await self._client().get(self._last_key(topic))
+        return json.loads(raw) if raw else None
+
+    async def subscribe(self, topic: str) -> Subscription:
+        listener = self._loop_state()[1]
+        channel = self._channel(topic)
+        return _RedisSubscription(listener, channel, await listener.add(channel))
+
+
+@lru_cache
+def get_progress_bus() -> ProgressBus:
+    s = get_settings()
+    if s.PROGRESS_BACKEND.lower() == "memory":
+        return MemoryProgressBus()
+    return RedisProgressBus(s.REDIS_URL, ttl_seconds=s.PROGRESS_TTL_SECONDS)
+
+
+def session_topic(session_id: Any) -> str:
+    return f"session:{session_id}"
+
+
+def submission_topic(submission_id: Any) -> str:
+    return f"submission:{submission_id}"
+
+
+def publish_progress(topic: str, stage: str, **kwargs: Any) -> None:
+    try:
+        get_progress_bus().publish(topic, make_event(stage, **kwargs))
+    except Exception as e:  # mai far fallire un'analisi per un evento di avanzamento
+        logger.warning("Progress publish failed (%s): %s", topic, e)
+
+
+async def stream_progress(
+    topic: str,
+    initial: dict[str, Any] | None = None,
+    keepalive_seconds: float = 15.0,
+) -> AsyncIterator[dict[str, Any] | None]:
+    """Events for `topic` until a terminal stage; None every `keepalive_seconds` of silence.
+
+    Subscribes before reading the last event, so no transition is lost in between.
+    `initial` (e.g. state read from the DB) is used when the bus has no last event.
+    """
+    bus = get_progress_bus()
+    sub = await bus.subscribe(topic)
+    try:
+        current = await bus.last(topic) or initial
+        if current is not None:
+            yield current
+            if current.get("terminal"):
+                return
+        while True:
+            event = await sub.get(keepalive_seconds)
+            yield event
+            if event is not None and event.get("terminal"):
+                return
+    finally:
+        await sub.close()
@@ -26,5 +26,13 @@ def verify_token(token: str) -> Optional[str]:
     return None
 
 
+def hash_ip(ip: str | None) -> Optional[str]:
+    """IP pseudonimizzato (HMAC con SECRET_KEY): serve a raggruppare, non a risalire all'IP."""
+    if not ip:
+        return None
+    key = get_settings().SECRET_KEY.encode()
+    return hmac.new(key, ip.encode(), hashlib.sha256).hexdigest()
+
+
 def generate_share_token() -> str:
     return secrets.token_urlsafe(24)
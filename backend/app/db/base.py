@@ -3,8 +3,8 @@ from __future__ import annotations
 
 import uuid
 
-from sqlalchemy import MetaData, TypeDecorator
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy import CHAR, JSON, MetaData, TypeDecorator
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
 from sqlalchemy.orm import DeclarativeBase
 
 convention = {
@@ -27,16 +27,20 @@ class GUID(TypeDecorator):
     def load_dialect_impl(self, dialect):
         if dialect.name == "postgresql":
             return dialect.type_descriptor(PG_UUID(as_uuid=True))
-        return dialect.type_descriptor(
-            dialect.type_descriptor.__class__(36)
-        )
+        return dialect.type_descriptor(CHAR(36))
 
     def process_bind_param(self, value, dialect):
         if value is None:
             return None
-        if isinstance(value, uuid.UUID):
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value if dialect.name == "postgresql" else str(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
             return value
         return uuid.UUID(str(value))
 
-    def process_result_value(self, value, dialect):
-        return value
+
+# JSONB on Postgres, plain JSON elsewhere (SQLite in tests)
+JSONBCompat = JSON().with_variant(JSONB(), "postgresql")
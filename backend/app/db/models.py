@@ -2,14 +2,13 @@
 from __future__ import annotations
 
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from typing import Any
 
-from sqlalchemy import BigInteger, DateTime, Float, ForeignKey, Integer, String, Text, func
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import BigInteger, Computed, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text, column, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.db.base import Base, GUID
+from app.db.base import Base, GUID, JSONBCompat
 
 
 def utcnow() -> datetime:
@@ -18,6 +17,8 @@ def utcnow() -> datetime:
 
 class UserSession(Base):
     __tablename__ = "user_sessions"
+    # zone -> sessions without touching the table (joined to trend_results for zone stats)
+    __table_args__ = (Index("ix_user_sessions_zone_key_id", "zone_key", "id"),)
 
     id: Mapped[uuid.UUID] = mapped_column(GUID(), primary_key=True, default=uuid.uuid4)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, index=True)
@@ -53,7 +54,7 @@ class ExtractedBill(Base):
 
     id: Mapped[uuid.UUID] = mapped_column(GUID(), primary_key=True, default=uuid.uuid4)
     session_id: Mapped[uuid.UUID] = mapped_column(GUID(), ForeignKey("user_sessions.id", ondelete="CASCADE"), index=True)
-    doc_id: Mapped[uuid.UUID] = mapped_column(GUID(), ForeignKey("uploaded_documents.id", ondelete="CASCADE"), index=True)
+    doc_id: Mapped[uuid.UUID] = mapped_column(GUID(), ForeignKey("uploaded_documents.id", ondelete="CASCADE"), unique=True, index=True)
     period_start: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     period_end: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     issue_date: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -65,8 +66,8 @@ class ExtractedBill(Base):
     taxes: Mapped[float | None] = mapped_column(Float, nullable=True)
     supplier: Mapped[str | None] = mapped_column(String(256), nullable=True)
     tariff_name: Mapped[str | None] = mapped_column(String(256), nullable=True)
-    raw_json: Mapped[dict[str, Any] | None] = mapped_column(JSONB, nullable=True)
-    confidence_json: Mapped[dict[str, Any] | None] = mapped_column(JSONB, nullable=True)
+    raw_json: Mapped[dict[str, Any] | None] = mapped_column(JSONBCompat, nullable=True)
+    confidence_json: Mapped[dict[str, Any] | None] = mapped_column(JSONBCompat, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, index=True)
 
     session: Mapped["UserSession"] = relationship(back_populates="extracted_bills")
@@ -75,18 +76,77 @@ class ExtractedBill(Base):
 
 class TrendResult(Base):
     __tablename__ = "trend_results"
+    # covering index for zone stats: session -> delta without reading the JSON documents
+    __table_args__ = (Index("ix_trend_results_session_id_delta", "session_id", "eur_per_kwh_delta_pct"),)
 
     id: Mapped[uuid.UUID] = mapped_column(GUID(), primary_key=True, default=uuid.uuid4)
     session_id: Mapped[uuid.UUID] = mapped_column(GUID(), ForeignKey("user_sessions.id", ondelete="CASCADE"), unique=True, index=True)
-    user_trend_json: Mapped[dict[str, Any]] = mapped_column(JSONB, nullable=False, default=dict)
-    zone_trend_json: Mapped[dict[str, Any]] = mapped_column(JSONB, nullable=False, default=dict)
+    user_trend_json: Mapped[dict[str, Any]] = mapped_column(JSONBCompat, nullable=False, default=dict)
+    zone_trend_json: Mapped[dict[str, Any]] = mapped_column(JSONBCompat, nullable=False, default=dict)
+    # user_trend_json->>'eur_per_kwh_delta_pct', stored by the database
+    eur_per_kwh_delta_pct: Mapped[float | None] = mapped_column(
+        Float, Computed(column("user_trend_json", JSONBCompat)["eur_per_kwh_delta_pct"].as_float(), persisted=True)
+    )
     position: Mapped[str] = mapped_column(String(16), nullable=False)
     explanation_short: Mapped[str] = mapped_column(Text, nullable=False)
+    # inputs the result was computed from (tasks.analysis_fingerprint) and the job that computed it
+    fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    job_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # {"extract": {doc_type: {stage: {"ms", "count"}}}, "trend": {stage: ...}}
+    timings_json: Mapped[dict[str, Any] | None] = mapped_column(JSONBCompat, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, index=True)
 
     session: Mapped["UserSession"] = relationship(back_populates="trend_result")
 
 
+class ZoneTrendStats(Base):
+    """Zone statistics maintained incrementally on every TrendResult (see zone_aggregates)."""
+
+    __tablename__ = "zone_trend_stats"
+
+    # cap: "20121" (incremental) | prefix: "p:201" | region: "r:Lombardia" (rollups of the cap rows)
+    zone_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    level: Mapped[str] = mapped_column(String(16), nullable=False, default="cap", index=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    median_delta_pct: Mapped[float | None] = mapped_column(Float, nullable=True)
+    p10_delta_pct: Mapped[float | None] = mapped_column(Float, nullable=True)
+    p90_delta_pct: Mapped[float | None] = mapped_column(Float, nullable=True)
+    # KLL sketch of eur_per_kwh_delta_pct (app/utils/quantile_sketch.py)
+    sketch_json: Mapped[dict[str, Any] | None] = mapped_column(JSONBCompat, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+
+class ZoneTrendMonthly(Base):
+    """One CAP's results of one bill month (month of the recent bill's period_end), see zone_windows."""
+
+    __tablename__ = "zone_trend_monthly"
+    # dirty months for the window refresh
+    __table_args__ = (Index("ix_zone_trend_monthly_updated_at", "updated_at"),)
+
+    zone_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)  # first day of the month
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sketch_json: Mapped[dict[str, Any] | None] = mapped_column(JSONBCompat, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+
+class ZoneTrendWindow(Base):
+    """Rolling 3/6/12-month zone statistics ending at `month`, precomputed from the monthly rows."""
+
+    __tablename__ = "zone_trend_windows"
+
+    # primary key order = range read of a zone's curves: zone_key = ? AND month BETWEEN ? AND ?
+    zone_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    window_months: Mapped[int] = mapped_column(Integer, primary_key=True)
+    level: Mapped[str] = mapped_column(String(16), nullable=False, default="cap")
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    median_delta_pct: Mapped[float | None] = mapped_column(Float, nullable=True)
+    p10_delta_pct: Mapped[float | None] = mapped_column(Float, nullable=True)
+    p90_delta_pct: Mapped[float | None] = mapped_column(Float, nullable=True)
+    computed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+
+
 class Passport(Base):
     __tablename__ = "passports"
 
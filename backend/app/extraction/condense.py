@@ -0,0 +1,134 @@
+"""Condensazione del testo bolletta prima dell'estrazione LLM (budget di token)."""
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass
+
+from app.extraction.parsers import AMOUNT_LABELS
+
+try:  # conteggio esatto se disponibile, altrimenti stima
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # pragma: no cover - dipende dall'ambiente
+    _ENCODING = None
+
+# Caratteri per token medi su testo italiano con numeri (tokenizer GPT-4o)
+CHARS_PER_TOKEN = 3.5
+
+# Etichette che portano ai campi estratti: stesso vocabolario di parsers.py più
+# quelle dei campi richiesti solo all'LLM (emissione, trasporto, offerta, ...)
+FIELD_LABELS: list[str] = sorted(
+    {lab for labels in AMOUNT_LABELS.values() for lab in labels}
+    | {
+        "fornitore", "periodo", "dal", "pod", "pdr", "kwh", "smc", "mc", "m3", "m³",
+        "consumo", "letture", "data emissione", "emessa il", "scadenza",
+        "trasporto", "gestione del contatore", "oneri di sistema", "imposte",
+        "offerta", "tariffa", "codice offerta", "indirizzo di fornitura", "cap",
+    },
+    key=len,
+    reverse=True,
+)
+_LABEL_RE = re.compile(r"(?<![a-z])(?:" + "|".join(re.escape(l) for l in FIELD_LABELS) + r")(?![a-z])")
+_NUMBER_RE = re.compile(r"\d")
+_DIGITS_RE = re.compile(r"\d+")
+
+# Righe sempre conservate in testa (intestazione/brand usato per il fornitore)
+HEAD_LINES = 5
+# Decadimento del punteggio per le righe vicine a un'etichetta (tabelle su più righe)
+PROXIMITY_WINDOW = 2
+PROXIMITY_DECAY = 0.5
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class CondensedText:
+    text: str
+    tokens: int
+    original_tokens: int
+    lines_kept: int
+    lines_total: int
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.tokens / self.original_tokens if self.original_tokens else 0.0
+
+
+def _line_score(line: str) -> float:
+    hits = len(_LABEL_RE.findall(line.lower()))
+    if not hits:
+        return 0.0
+    return hits + (1.0 if _NUMBER_RE.search(line) else 0.0)
+
+
+def _dedupe(lines: list[str]) -> list[str]:
+    """Rimuove righe ripetute (intestazioni/piè di pagina ripetuti su ogni pagina).
+
+    Righe identiche sempre; righe uguali a meno dei numeri (es. "Pagina 2 di 4") solo
+    se non contengono etichette, per non fondere importi diversi con la stessa voce.
+    """
+    seen_exact: set[str] = set()
+    seen_shape: set[str] = set()
+    out: list[str] = []
+    for line in lines:
+        if line in seen_exact:
+            continue
+        seen_exact.add(line)
+        if not _LABEL_RE.search(line.lower()):
+            shape = _DIGITS_RE.sub("#", line.lower())
+            if shape in seen_shape:
+                continue
+            seen_shape.add(shape)
+        out.append(line)
+    return out
+
+
+def condense_text(text: str, max_tokens: int) -> CondensedText:
+    """Estratto del testo entro `max_tokens`, con le righe più vicine alle etichette note.
+
+    Le righe selezionate mantengono l'ordine originale, così "il primo totale" resta
+    il primo anche nell'estratto.
+    """
+    original_tokens = count_tokens(text or "")
+    raw = [re.sub(r"[ \t]+", " ", l).strip() for l in (text or "").splitlines()]
+    raw = [l for l in raw if l]
+    lines = _dedupe(raw)
+
+    joined = "\n".join(lines)
+    tokens = count_tokens(joined)
+    if tokens <= max_tokens:
+        return CondensedText(joined, tokens, original_tokens, len(lines), len(raw))
+
+    own = [_line_score(l) for l in lines]
+    scores = list(own)
+    for i, s in enumerate(own):
+        if not s:
+            continue
+        for d in range(1, PROXIMITY_WINDOW + 1):
+            near = s * PROXIMITY_DECAY ** d
+            for j in (i - d, i + d):
+                if 0 <= j < len(lines) and scores[j] < near:
+                    scores[j] = near
+    for i in range(min(HEAD_LINES, len(lines))):
+        scores[i] = float("inf")
+
+    # a parità di punteggio vince la riga che compare prima
+    order = sorted((i for i in range(len(lines)) if scores[i] > 0), key=lambda i: (-scores[i], i))
+    keep: set[int] = set()
+    used = 0
+    for i in order:
+        cost = count_tokens(lines[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        keep.add(i)
+        used += cost
+
+    kept = [lines[i] for i in sorted(keep)]
+    out = "\n".join(kept)
+    return CondensedText(out, count_tokens(out), original_tokens, len(kept), len(raw))
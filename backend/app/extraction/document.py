@@ -0,0 +1,232 @@
+"""PDF aperto una volta, condiviso tra testo nativo, routing OCR e rasterizzazione."""
+from __future__ import annotations
+
+import io
+import logging
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+import pdfplumber
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# pdfium ha stato globale e non è thread-safe nemmeno tra documenti diversi: ogni chiamata
+# pypdfium2 del processo (apertura, render, chiusura) passa da questo lock
+_PDFIUM_LOCK = threading.RLock()
+
+
+@dataclass
+class PageText:
+    number: int  # 1-based, come pdftoppm
+    text: str
+    image_coverage: float  # frazione dell'area pagina coperta da immagini (0..1)
+    parsed: bool = True  # False se pdfplumber non è riuscito a leggere la pagina
+
+    @property
+    def chars(self) -> int:
+        return len(self.text.strip())
+
+
+def _image_coverage(page: Any) -> float:
+    area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for im in page.images:
+        x0, x1 = max(0.0, float(im["x0"])), min(float(page.width), float(im["x1"]))
+        top, bottom = max(0.0, float(im["top"])), min(float(page.height), float(im["bottom"]))
+        if x1 > x0 and bottom > top:
+            covered += (x1 - x0) * (bottom - top)
+    return min(1.0, covered / area)
+
+
+def _pdf_page_count(pdf_bytes: bytes) -> int | None:
+    """Numero pagine via poppler `pdfinfo` letto da stdin (None se non determinabile)."""
+    try:
+        proc = subprocess.run(
+            ["pdfinfo", "-"],
+            input=pdf_bytes,
+            check=False,
+            capture_output=True,
+        )
+        for line in proc.stdout.decode("utf-8", "replace").splitlines():
+            if line.startswith("Pages:"):
+                return int(line.split(":", 1)[1].strip())
+    except Exception:
+        logger.exception("pdfinfo_failed")
+    return None
+
+
+def _render_pdf_page_pgm(pdf_bytes: bytes, page: int, dpi: int) -> bytes:
+    """Render di una pagina in scala di grigi: PDF da stdin, PGM su stdout."""
+    cmd = [
+        "pdftoppm",
+        "-gray",
+        "-singlefile",
+        "-r",
+        str(dpi),
+        "-f",
+        str(page),
+        "-l",
+        str(page),
+        "-",
+    ]
+    proc = subprocess.run(cmd, input=pdf_bytes, check=False, capture_output=True)
+    return proc.stdout if proc.returncode == 0 else b""
+
+
+def image_to_pnm(img: Image.Image) -> bytes:
+    # PGM/PPM è un dump dei pixel con header minimo: nessuna compressione (a differenza di PNG)
+    buf = io.BytesIO()
+    img.save(buf, format="PPM")
+    return buf.getvalue()
+
+
+class PdfDocument:
+    """Bytes PDF aperti una sola volta; testo e raster per pagina calcolati lazy e in cache.
+
+    - testo/immagini: pdfplumber (stesso layout testo di prima per i parser)
+    - raster: pypdfium2 in-process, fallback `pdftoppm` se non disponibile
+
+    Thread-safe: le cache del documento sono protette da un lock per istanza; le chiamate
+    pdfium sono serializzate in tutto il processo (_PDFIUM_LOCK), anche tra documenti
+    diversi (es. worker con pool di thread). L'OCR delle pagine già renderizzate può
+    procedere in parallelo.
+    Pagine numerate da 1, come pdftoppm.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._lock = threading.RLock()
+        self._plumber: Any = None
+        self._plumber_failed = False
+        self._pdfium: Any = None
+        self._pdfium_failed = False
+        self._pages: dict[int, PageText] = {}
+        self._rasters: dict[tuple[int, int], Image.Image] = {}
+        self._page_count: int | None = None
+
+    def __enter__(self) -> PdfDocument:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._plumber is not None:
+                self._plumber.close()
+                self._plumber = None
+            if self._pdfium is not None:
+                with _PDFIUM_LOCK:
+                    self._pdfium.close()
+                self._pdfium = None
+            self._rasters.clear()
+
+    def _open_plumber(self) -> Any:
+        if self._plumber is None and not self._plumber_failed:
+            try:
+                self._plumber = pdfplumber.open(io.BytesIO(self.data))
+            except Exception:
+                logger.exception("pdf_text_extract_failed")
+                self._plumber_failed = True
+        return self._plumber
+
+    def _open_pdfium(self) -> Any:
+        if self._pdfium is None and not self._pdfium_failed:
+            try:
+                import pypdfium2
+
+                with _PDFIUM_LOCK:
+                    self._pdfium = pypdfium2.PdfDocument(self.data)
+            except Exception as e:
+                logger.warning("pypdfium2 unavailable, falling back to pdftoppm: %s", e)
+                self._pdfium_failed = True
+        return self._pdfium
+
+    @property
+    def page_count(self) -> int:
+        with self._lock:
+            if self._page_count is None:
+                pdf = self._open_plumber()
+                if pdf is not None:
+                    self._page_count = len(pdf.pages)
+                else:
+                    self._page_count = _pdf_page_count(self.data) or 0
+            return self._page_count
+
+    @property
+    def readable(self) -> bool:
+        """True se pdfplumber riesce ad aprire il documento (testo nativo disponibile)."""
+        with self._lock:
+            return self._open_plumber() is not None
+
+    def page(self, number: int) -> PageText:
+        with self._lock:
+            cached = self._pages.get(number)
+            if cached is not None:
+                return cached
+            pdf = self._open_plumber()
+            text, coverage, parsed = "", 0.0, False
+            if pdf is not None:
+                try:
+                    p = pdf.pages[number - 1]
+                    text = p.extract_text() or ""
+                    coverage = _image_coverage(p)
+                    parsed = True
+                    # libera gli oggetti di layout di pdfminer: il testo è già in cache
+                    p.close()
+                except Exception:
+                    logger.exception("pdf_page_text_failed", extra={"page": number})
+            page = PageText(number=number, text=text, image_coverage=coverage, parsed=parsed)
+            self._pages[number] = page
+            return page
+
+    def pages(self, limit: int | None = None) -> list[PageText]:
+        n = self.page_count if limit is None else min(limit, self.page_count)
+        return [self.page(i) for i in range(1, n + 1)]
+
+    def text(self, max_pages: int | None = None) -> str:
+        return "\n".join(p.text for p in self.pages(max_pages) if p.text.strip()).strip()
+
+    def render(self, number: int, dpi: int = 200) -> Image.Image | None:
+        """Raster in scala di grigi della pagina (in cache per (pagina, dpi))."""
+        key = (number, dpi)
+        with self._lock:
+            cached = self._rasters.get(key)
+            if cached is not None:
+                return cached
+            img: Image.Image | None = None
+            pdf = self._open_pdfium()
+            try:
+                if pdf is not None:
+                    with _PDFIUM_LOCK:
+                        page = pdf[number - 1]
+                        try:
+                            img = page.render(scale=dpi / 72, grayscale=True).to_pil()
+                        finally:
+                            page.close()
+                else:
+                    pgm = _render_pdf_page_pgm(self.data, number, dpi)
+                    if pgm:
+                        img = Image.open(io.BytesIO(pgm))
+                        img.load()
+            except Exception:
+                logger.exception("pdf_render_failed", extra={"page": number})
+                img = None
+            if img is not None:
+                self._rasters[key] = img
+            return img
+
+    def render_pnm(self, number: int, dpi: int = 200) -> bytes:
+        img = self.render(number, dpi)
+        return image_to_pnm(img) if img is not None else b""
+
+    def render_png(self, number: int, dpi: int = 150) -> bytes | None:
+        img = self.render(number, dpi)
+        if img is None:
+            return None
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        return buf.getvalue()
@@ -1,75 +1,167 @@
 from __future__ import annotations
 
+import contextvars
 import io
 import logging
 import os
 import subprocess
-import tempfile
-from pathlib import Path
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
 
-import pytesseract
 from PIL import Image, ImageOps
 
+from app.core.instrumentation import span
+from app.extraction.document import PdfDocument, image_to_pnm
+
 logger = logging.getLogger(__name__)
 
+# Limite per processo worker di tesseract concorrenti (condiviso tra chiamate parallele)
+_tesseract_slots: threading.BoundedSemaphore | None = None
+_tesseract_slots_lock = threading.Lock()
+
+
+def _get_tesseract_slots() -> threading.BoundedSemaphore:
+    global _tesseract_slots
+    if _tesseract_slots is None:
+        with _tesseract_slots_lock:
+            if _tesseract_slots is None:
+                from app.core.config import get_settings
+                limit = max(1, get_settings().OCR_MAX_CONCURRENT_TESSERACT)
+                _tesseract_slots = threading.BoundedSemaphore(limit)
+    return _tesseract_slots
+
+
+def _tesseract_pnm(pnm: bytes) -> str:
+    """OCR di un buffer PNM (PGM/PPM) passato a tesseract via stdin -> stdout, senza file su disco."""
+    if not pnm:
+        return ""
+    with _get_tesseract_slots():
+        proc = subprocess.run(
+            ["tesseract", "stdin", "stdout", "-l", "ita"],
+            input=pnm,
+            check=False,
+            capture_output=True,
+        )
+    if proc.returncode != 0:
+        logger.warning("tesseract_failed: %s", proc.stderr.decode("utf-8", "replace")[:200])
+    return proc.stdout.decode("utf-8", "replace").strip()
+
+
+def _ocr_pnm_page(pnm: bytes, page: int) -> str:
+    try:
+        with span("ocr_page"):
+            return _tesseract_pnm(pnm)
+    except Exception:
+        logger.exception("ocr_pdf_page_failed", extra={"page": page})
+        return ""
+
 
 def _ocr_image(img: Image.Image) -> str:
     # Piccolo pre-processing per bollette scansionate
     gray = ImageOps.grayscale(img)
-    return (pytesseract.image_to_string(gray, lang="ita") or "").strip()
+    return _tesseract_pnm(image_to_pnm(gray))
 
 
 def ocr_image_bytes(image_bytes: bytes) -> str:
     try:
-        with Image.open(io.BytesIO(image_bytes)) as img:
+        with span("ocr_image"), Image.open(io.BytesIO(image_bytes)) as img:
             return _ocr_image(img)
     except Exception:
         logger.exception("ocr_image_failed")
         return ""
 
 
-def ocr_pdf_bytes(pdf_bytes: bytes, dpi: int = 200, max_pages: int | None = None) -> str:
-    """OCR PDF via poppler `pdftoppm` -> PNG -> tesseract.
+def ocr_document_pages(
+    doc: PdfDocument,
+    pages: list[int],
+    dpi: int = 200,
+    workers: int | None = None,
+    on_page: Callable[[int, int], None] | None = None,
+) -> dict[int, str]:
+    """OCR delle sole pagine indicate (1-based): {pagina: testo}.
+
+    `on_page(completate, totale)` è chiamata a ogni pagina finita (avanzamento).
 
-    Richiede `poppler-utils` nel container.
+    Il render avviene nel thread chiamante (pdfium è serializzato nel processo), una pagina
+    alla volta; ogni raster pronto passa subito a tesseract su un pool di thread
+    (tesseract è un processo esterno), rispettando `OCR_MAX_CONCURRENT_TESSERACT`.
+    I raster restano nella cache del documento.
     """
     from app.core.config import get_settings
-    settings = get_settings()
+    if workers is None:
+        workers = get_settings().OCR_WORKERS
+    if not pages:
+        return {}
+
+    n_workers = max(1, min(workers, len(pages)))
+    if n_workers == 1:
+        out: dict[int, str] = {}
+        for i, p in enumerate(pages, 1):
+            with span("pdf_render"):
+                pnm = doc.render_pnm(p, dpi)
+            out[p] = _ocr_pnm_page(pnm, p)
+            if on_page:
+                on_page(i, len(pages))
+        return out
+
+    # tesseract usa OpenMP: con più pagine in parallelo evitiamo oversubscription
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    with ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="ocr") as pool:
+        futures: dict[int, Future[str]] = {}
+        done = [0]
+        done_lock = threading.Lock()
+
+        def _page_done(_: Future[str]) -> None:
+            with done_lock:
+                done[0] += 1
+                n = done[0]
+            on_page(n, len(pages))
+
+        for p in pages:
+            with span("pdf_render"):
+                pnm = doc.render_pnm(p, dpi)
+            # copia del contesto: i tempi per pagina finiscono nel collector dell'analisi
+            futures[p] = pool.submit(contextvars.copy_context().run, _ocr_pnm_page, pnm, p)
+            if on_page:
+                futures[p].add_done_callback(_page_done)
+        return {p: f.result() for p, f in futures.items()}
+
+
+def ocr_pdf_pages(
+    pdf_bytes: bytes,
+    pages: list[int],
+    dpi: int = 200,
+    workers: int | None = None,
+) -> dict[int, str]:
+    with PdfDocument(pdf_bytes) as doc:
+        return ocr_document_pages(doc, pages, dpi=dpi, workers=workers)
+
+
+def ocr_document(doc: PdfDocument, dpi: int = 200, max_pages: int | None = None, workers: int | None = None) -> str:
+    """OCR delle prime `max_pages` pagine, testo in ordine di pagina."""
+    from app.core.config import get_settings
     if max_pages is None:
-        max_pages = settings.OCR_MAX_PAGES
+        max_pages = get_settings().OCR_MAX_PAGES
     try:
-        with tempfile.TemporaryDirectory() as td:
-            td_path = Path(td)
-            pdf_path = td_path / "input.pdf"
-            pdf_path.write_bytes(pdf_bytes)
-            out_prefix = td_path / "page"
-
-            # -f/-l per limitare numero pagine (performance)
-            cmd = [
-                "pdftoppm",
-                "-png",
-                "-r",
-                str(dpi),
-                "-f",
-                "1",
-                "-l",
-                str(max_pages),
-                str(pdf_path),
-                str(out_prefix),
-            ]
-            subprocess.run(cmd, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-            texts: list[str] = []
-            for img_path in sorted(td_path.glob("page-*.png")):
-                try:
-                    with Image.open(img_path) as img:
-                        t = _ocr_image(img)
-                        if t:
-                            texts.append(t)
-                except Exception:
-                    logger.exception("ocr_pdf_page_failed")
-            return "\n".join(texts).strip()
+        n_pages = min(max_pages, doc.page_count or max_pages)
+        by_page = ocr_document_pages(doc, list(range(1, n_pages + 1)), dpi=dpi, workers=workers)
+        return "\n".join(t for _, t in sorted(by_page.items()) if t).strip()
     except Exception:
         logger.exception("ocr_pdf_failed")
         return ""
 
+
+def ocr_pdf_bytes(
+    pdf_bytes: bytes,
+    dpi: int = 200,
+    max_pages: int | None = None,
+    workers: int | None = None,
+) -> str:
+    """OCR PDF: render in memoria (pypdfium2, o `pdftoppm` via pipe) -> PGM -> tesseract (pipe).
+
+    Nessun file temporaneo e nessun encode/decode PNG.
+    Richiede `tesseract-ocr` (+ `ita`) nel container.
+    """
+    with PdfDocument(pdf_bytes) as doc:
+        return ocr_document(doc, dpi=dpi, max_pages=max_pages, workers=workers)
@@ -5,7 +5,7 @@ import re
 from dataclasses import dataclass
 from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
-from typing import Any
+from typing import Any, Iterator
 
 from dateutil import parser as date_parser
 
@@ -56,6 +56,10 @@ def parse_kwh(text: str) -> float | None:
         val = m.group(2)
     else:
         val = m.group(1)
+    return _kwh_value(val)
+
+
+def _kwh_value(val: str) -> float | None:
     return float(str(parse_decimal_eur(val) or "").replace(",", ".")) if parse_decimal_eur(val) else None
 
 
@@ -69,6 +73,10 @@ def parse_smc(text: str) -> float | None:
         val = m.group(2)
     else:
         val = m.group(1)
+    return _smc_value(val)
+
+
+def _smc_value(val: str) -> float | None:
     d = parse_decimal_eur(val)
     return float(d) if d is not None else None
 
@@ -92,6 +100,10 @@ def parse_period(text: str) -> dict[str, Any]:
     )
     if not m:
         return {}
+    return _period_from_match(m)
+
+
+def _period_from_match(m: re.Match[str]) -> dict[str, Any]:
     try:
         start = date_parser.parse(m.group(1), dayfirst=True).date()
         end = date_parser.parse(m.group(2), dayfirst=True).date()
@@ -106,6 +118,10 @@ def parse_supplier(text: str) -> str | None:
     m = re.search(r"\bfornitore\b\s*[:\-]?\s*([^\n]{3,80})", text, re.IGNORECASE)
     if m:
         return _norm_space(m.group(1))[:80]
+    return _supplier_from_lines(text)
+
+
+def _supplier_from_lines(text: str) -> str | None:
     lines = [l.strip() for l in text.splitlines() if l.strip()]
     if not lines:
         return None
@@ -128,7 +144,18 @@ def extract_amount_by_label(text: str, labels: list[str]) -> float | None:
     return None
 
 
-def parse_fields_from_text(text: str) -> dict[str, Any]:
+# Etichette importi per campo, in ordine di priorità (vince la prima etichetta trovata)
+AMOUNT_LABELS: dict[str, list[str]] = {
+    "total_eur": ["totale", "importo totale", "totale bolletta", "da pagare"],
+    "fixed_fees": ["quota fissa", "spesa fissa", "fissi"],
+    "variable_eur": ["quota variabile", "spesa variabile", "spesa per la materia", "materia energia", "materia gas"],
+    "vat_eur": ["iva"],
+    "excise_eur": ["accisa", "imposta di consumo"],
+}
+
+
+def parse_fields_from_text_legacy(text: str) -> dict[str, Any]:
+    """Implementazione originale (una regex per campo/etichetta): riferimento per test e benchmark."""
     t = text or ""
     fields: dict[str, Any] = {}
 
@@ -152,25 +179,214 @@ def parse_fields_from_text(text: str) -> dict[str, Any]:
     if smc is not None:
         fields["mc"] = smc
 
-    total = extract_amount_by_label(t, ["totale", "importo totale", "totale bolletta", "da pagare"])
+    total = extract_amount_by_label(t, AMOUNT_LABELS["total_eur"])
     if total is not None:
         fields["total_eur"] = total
 
-    fixed = extract_amount_by_label(t, ["quota fissa", "spesa fissa", "fissi"])
+    fixed = extract_amount_by_label(t, AMOUNT_LABELS["fixed_fees"])
     if fixed is not None:
         fields["fixed_fees"] = fixed
 
-    variable = extract_amount_by_label(t, ["quota variabile", "spesa variabile", "spesa per la materia", "materia energia", "materia gas"])
+    variable = extract_amount_by_label(t, AMOUNT_LABELS["variable_eur"])
     if variable is not None:
         fields["variable_eur"] = variable
 
-    vat = extract_amount_by_label(t, ["iva"])
+    vat = extract_amount_by_label(t, AMOUNT_LABELS["vat_eur"])
     if vat is not None:
         fields["vat_eur"] = vat
 
-    excise = extract_amount_by_label(t, ["accisa", "imposta di consumo"])
+    excise = extract_amount_by_label(t, AMOUNT_LABELS["excise_eur"])
     if excise is not None:
         fields["excise_eur"] = excise
 
     return fields
 
+
+
+_AMOUNT_TAIL = r"[^\n\r]{0,40}?(-?\d{1,3}(?:[.\s]\d{3})*(?:,\d{1,2})|-?\d+(?:[.,]\d{1,2})?)\s*€?"
+_KWH_NUMBER_FIRST = re.compile(r"(\d{1,6}(?:[.,]\d{1,3})?)\s*(kwh)\b(?!\s*/)", re.IGNORECASE)
+_SMC_NUMBER_FIRST = re.compile(r"(\d{1,6}(?:[.,]\d{1,3})?)\s*(smc|mc|m3|m³)\b", re.IGNORECASE)
+
+
+def _line_at(text: str, pos: int) -> str:
+    start = text.rfind("\n", 0, pos) + 1
+    end = text.find("\n", pos)
+    return text[start:end if end >= 0 else len(text)]
+
+
+class FieldScanner:
+    """Scanner precompilato: un solo passaggio sul testo per localizzare tutte le etichette.
+
+    Le etichette sono compilate in un'unica regex a trie (primo carattere consumato +
+    lookahead sul resto), eseguita una volta sul testo in minuscolo: restituisce ogni
+    posizione in cui può iniziare un'etichetta, anche sovrapposta. Lì si prova solo il
+    pattern ancorato (`match`) delle regole con la stessa iniziale. Il primo match per
+    regola coincide con quello di `re.search` sul testo intero, quindi l'output è
+    identico a `parse_fields_from_text_legacy`.
+    """
+
+    # Caratteri che con re.IGNORECASE equivalgono a lettere ASCII ma che `str.lower()`
+    # non normalizza (o espande): se presenti si usa la regex àncora case-insensitive.
+    _CASEFOLD_SPECIAL = frozenset("İıſ")
+
+    def __init__(self, amount_labels: dict[str, list[str]] | None = None):
+        self.amount_labels = amount_labels or AMOUNT_LABELS
+        rules: list[tuple[str, list[str], str]] = [
+            # (rule_id, etichette letterali in minuscolo, pattern ancorato)
+            ("supplier", ["fornitore"], r"\bfornitore\b\s*[:\-]?\s*([^\n]{3,80})"),
+            (
+                "period",
+                ["dal"],
+                r"\bdal\s+(\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4})\s+al\s+(\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4})\b",
+            ),
+            ("pod", ["pod"], r"\bPOD\b[^A-Z0-9]*(IT[0-9A-Z]{14})\b"),
+            ("pdr", ["pdr"], r"\bPDR\b[^0-9]*(\d{14})\b"),
+            ("kwh", ["kwh"], r"kwh"),
+            ("kwh_label", ["kwh"], r"\b(kwh)\b(?!\s*/)\s*[:\-]?\s*(\d{1,6}(?:[.,]\d{1,3})?)"),
+            ("smc", ["smc", "mc", "m3", "m³"], r"smc|mc|m3|m³"),
+            ("smc_label", ["smc", "mc", "m3", "m³"], r"\b(smc|mc|m3|m³)\s*[:\-]?\s*(\d{1,6}(?:[.,]\d{1,3})?)"),
+        ]
+        for labels in self.amount_labels.values():
+            for lab in labels:
+                rules.append((f"amount:{lab}", [lab], rf"{lab}{_AMOUNT_TAIL}"))
+
+        self._rule_ids = [r[0] for r in rules]
+        self._rules: list[tuple[str, re.Pattern[str]]] = []
+        # Indice per iniziale delle etichette: a ogni àncora si provano solo quei pattern
+        self._by_char: dict[str, list[tuple[str, re.Pattern[str]]]] = {}
+        literals: set[str] = set()
+        for rule_id, labels, pattern in rules:
+            rule = (rule_id, re.compile(pattern, re.IGNORECASE))
+            self._rules.append(rule)
+            for ch in {lab[0] for lab in labels}:
+                self._by_char.setdefault(ch, []).append(rule)
+            literals.update(labels)
+        anchor = self._trie_pattern(sorted(literals))
+        self._anchor_lower = re.compile(anchor)
+        self._anchor_ci = re.compile(anchor, re.IGNORECASE)
+
+    @classmethod
+    def _trie_pattern(cls, words: list[str]) -> str:
+        """Regex a trie: primo carattere consumato, resto in lookahead (posizioni sovrapposte)."""
+        by_initial: dict[str, list[str]] = {}
+        for w in words:
+            by_initial.setdefault(w[0], []).append(w[1:])
+        alts = []
+        for ch, rests in sorted(by_initial.items()):
+            # se un'etichetta è prefisso di altre basta il prefisso: l'àncora può essere più larga
+            rest = "" if "" in rests else f"(?={cls._trie_alternation(rests)})"
+            alts.append(re.escape(ch) + rest)
+        return "|".join(alts)
+
+    @classmethod
+    def _trie_alternation(cls, words: list[str]) -> str:
+        by_initial: dict[str, list[str]] = {}
+        for w in words:
+            by_initial.setdefault(w[0], []).append(w[1:])
+        alts = []
+        for ch, rests in sorted(by_initial.items()):
+            if "" in rests:
+                alts.append(re.escape(ch))
+            else:
+                alts.append(re.escape(ch) + cls._trie_alternation(rests))
+        return alts[0] if len(alts) == 1 else f"(?:{'|'.join(alts)})"
+
+    def _anchors(self, text: str) -> Iterator[tuple[int, str]]:
+        if self._CASEFOLD_SPECIAL.isdisjoint(text):
+            lowered = text.lower()
+            for m in self._anchor_lower.finditer(lowered):
+                pos = m.start()
+                yield pos, lowered[pos]
+        else:
+            for m in self._anchor_ci.finditer(text):
+                pos = m.start()
+                yield pos, text[pos].lower()
+
+    def scan(self, text: str) -> dict[str, re.Match[str]]:
+        """Primo match (più a sinistra) per ogni regola, in un solo passaggio."""
+        found: dict[str, re.Match[str]] = {}
+        pending = set(self._rule_ids)
+        for pos, ch in self._anchors(text):
+            for rule_id, pattern in self._by_char.get(ch, self._rules):
+                if rule_id not in pending:
+                    continue
+                m = pattern.match(text, pos)
+                if m:
+                    found[rule_id] = m
+                    pending.discard(rule_id)
+            if not pending:
+                break
+        return found
+
+    def parse(self, text: str) -> dict[str, Any]:
+        return self.parse_with_evidence(text)[0]
+
+    def parse_with_evidence(self, text: str) -> tuple[dict[str, Any], dict[str, str]]:
+        """Come `parse`, più il testo che ha prodotto ogni campo ("" = euristica senza etichetta).
+
+        Per gli importi l'evidenza è l'intera riga dell'etichetta.
+        """
+        t = text or ""
+        found = self.scan(t)
+        fields: dict[str, Any] = {}
+        evidence: dict[str, str] = {}
+
+        m = found.get("supplier")
+        supplier = _norm_space(m.group(1))[:80] if m else _supplier_from_lines(t)
+        if supplier:
+            fields["supplier"] = supplier
+            evidence["supplier"] = m.group(0) if m else ""
+
+        m = found.get("period")
+        if m:
+            period = _period_from_match(m)
+            fields.update(period)
+            for k in period:
+                evidence[k] = m.group(0)
+
+        m = found.get("pod")
+        if m:
+            fields["pod"] = m.group(1).upper()
+            evidence["pod"] = m.group(0)
+        m = found.get("pdr")
+        if m:
+            fields["pdr"] = m.group(1)
+            evidence["pdr"] = m.group(0)
+
+        if "kwh" in found:
+            m = _KWH_NUMBER_FIRST.search(t)
+            val = m.group(1) if m else (found["kwh_label"].group(2) if "kwh_label" in found else None)
+            kwh = _kwh_value(val) if val is not None else None
+            if kwh is not None:
+                fields["kwh"] = kwh
+                evidence["kwh"] = m.group(0) if m else found["kwh_label"].group(0)
+        if "smc" in found:
+            m = _SMC_NUMBER_FIRST.search(t)
+            val = m.group(1) if m else (found["smc_label"].group(2) if "smc_label" in found else None)
+            smc = _smc_value(val) if val is not None else None
+            if smc is not None:
+                fields["mc"] = smc
+                evidence["mc"] = m.group(0) if m else found["smc_label"].group(0)
+
+        for field, labels in self.amount_labels.items():
+            for lab in labels:
+                m = found.get(f"amount:{lab}")
+                if m:
+                    value = parse_float_eur(m.group(1))
+                    if value is not None:
+                        fields[field] = value
+                        evidence[field] = _line_at(t, m.start())
+                    break
+
+        return fields, evidence
+
+
+_scanner = FieldScanner()
+
+
+def parse_fields_from_text(text: str) -> dict[str, Any]:
+    return _scanner.parse(text)
+
+
+def parse_fields_with_evidence(text: str) -> tuple[dict[str, Any], dict[str, str]]:
+    return _scanner.parse_with_evidence(text)
@@ -1,23 +1,14 @@
 from __future__ import annotations
 
-import io
-import logging
+from app.extraction.document import PageText, PdfDocument
 
-import pdfplumber
 
-logger = logging.getLogger(__name__)
+def extract_pdf_pages(pdf_bytes: bytes) -> list[PageText]:
+    """Testo + copertura immagini per pagina (lista vuota se il PDF non è leggibile)."""
+    with PdfDocument(pdf_bytes) as doc:
+        return doc.pages() if doc.readable else []
 
 
 def extract_pdf_text(pdf_bytes: bytes) -> str:
-    try:
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            parts: list[str] = []
-            for page in pdf.pages:
-                t = page.extract_text() or ""
-                if t.strip():
-                    parts.append(t)
-            return "\n".join(parts).strip()
-    except Exception:
-        logger.exception("pdf_text_extract_failed")
-        return ""
-
+    with PdfDocument(pdf_bytes) as doc:
+        return doc.text()
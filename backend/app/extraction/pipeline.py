@@ -1,29 +1,103 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
-
-from app.extraction.ocr import ocr_image_bytes, ocr_pdf_bytes
+import time
+from typing import Any, Callable
+
+from app.cache import content_key, get_extraction_cache
+from app.core.config import get_settings
+from app.core.instrumentation import collect_timings, span
+from app.extraction.document import PageText, PdfDocument
+from app.extraction.ocr import ocr_document, ocr_document_pages, ocr_image_bytes
 from app.extraction.parsers import parse_fields_from_text
-from app.extraction.pdf_text import extract_pdf_text
 
 logger = logging.getLogger(__name__)
 
+# Da incrementare quando cambiano parser/OCR: invalida la cache delle estrazioni
+EXTRACTOR_VERSION = "pipeline-4"
+
 
-def _extract_text(mime: str, data: bytes) -> tuple[str, dict[str, Any]]:
+def _page_needs_ocr(page: PageText) -> bool:
+    """Pagina scansionata: immagini con poco testo, oppure dominata da immagini con testo scarso.
+
+    Le pagine che pdfplumber non riesce a leggere vanno sempre all'OCR.
+    """
+    s = get_settings()
+    if not page.parsed:
+        return True
+    if page.image_coverage <= 0:
+        return False  # pagine vuote o con solo testo breve: l'OCR non troverebbe nulla da leggere
+    if page.chars < s.OCR_PAGE_MIN_CHARS:
+        return True
+    return page.image_coverage >= s.OCR_PAGE_IMAGE_COVERAGE and page.chars < s.OCR_PAGE_MIN_CHARS_WITH_IMAGE
+
+
+def _extract_pdf_text(
+    doc: PdfDocument, meta: dict[str, Any], on_ocr_page: Callable[[int, int], None] | None = None
+) -> str:
+    """Routing per pagina: testo nativo dove c'è, OCR solo sulle pagine che ne hanno bisogno."""
+    with span("pdf_parse"):
+        pages = doc.pages() if doc.readable else []
+    meta["pdf_text_len"] = sum(len(p.text) for p in pages)
+    if not pages:
+        # PDF non leggibile da pdfplumber: OCR dell'intero documento
+        t0 = time.perf_counter()
+        ocr = ocr_document(doc)
+        meta["ocr_used"] = True
+        meta["ocr_len"] = len(ocr)
+        meta["ocr_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        return ocr
+
+    settings = get_settings()
+    max_ocr = settings.OCR_MAX_PAGES
+    wanted = [p.number for p in pages if _page_needs_ocr(p)]
+    if not wanted and sum(p.chars for p in pages) < settings.OCR_DOC_MIN_CHARS:
+        # quasi nessun testo nativo e nessuna immagine (es. testo convertito in tracciati): OCR di tutto il documento
+        wanted = [p.number for p in pages]
+    ocr_pages = wanted[:max_ocr]
+    t0 = time.perf_counter()
+    ocr_by_page = ocr_document_pages(doc, ocr_pages, on_page=on_ocr_page) if ocr_pages else {}
+    ocr_ms = (time.perf_counter() - t0) * 1000
+
+    parts: list[str] = []
+    routing: list[dict[str, Any]] = []
+    for p in pages:
+        entry: dict[str, Any] = {"page": p.number, "chars": p.chars, "image_coverage": round(p.image_coverage, 3)}
+        if p.number in ocr_by_page:
+            ocr = ocr_by_page[p.number]
+            entry.update(path="ocr", ocr_chars=len(ocr))
+            page_text = (p.text + "\n" + ocr).strip() if p.text.strip() else ocr
+        else:
+            entry["path"] = "ocr_skipped_limit" if p.number in wanted else "text"
+            page_text = p.text
+        if page_text.strip():
+            parts.append(page_text)
+        routing.append(entry)
+
+    meta["pages"] = routing
+    meta["text_pages"] = [e["page"] for e in routing if e["path"] == "text"]
+    meta["ocr_pages"] = ocr_pages
+    meta["ocr_used"] = bool(ocr_pages)
+    if ocr_pages:
+        meta["ocr_len"] = sum(len(t) for t in ocr_by_page.values())
+        meta["ocr_ms"] = round(ocr_ms, 1)
+    return "\n".join(parts).strip()
+
+
+def _extract_text(
+    mime: str,
+    data: bytes,
+    doc: PdfDocument | None = None,
+    on_ocr_page: Callable[[int, int], None] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """Testo del documento. Per i PDF si può passare un `PdfDocument` già aperto (riusato)."""
     mime_l = (mime or "").lower()
     meta: dict[str, Any] = {"mime": mime_l}
     if "pdf" in mime_l:
-        text = extract_pdf_text(data)
-        meta["pdf_text_len"] = len(text)
-        if len(text.strip()) < 80:
-            ocr = ocr_pdf_bytes(data)
-            meta["ocr_used"] = True
-            meta["ocr_len"] = len(ocr)
-            text = (text + "\n" + ocr).strip() if text else ocr
-        else:
-            meta["ocr_used"] = False
-        return text, meta
+        if doc is not None:
+            return _extract_pdf_text(doc, meta, on_ocr_page), meta
+        with PdfDocument(data) as opened:
+            return _extract_pdf_text(opened, meta, on_ocr_page), meta
 
     # immagini
     ocr = ocr_image_bytes(data)
@@ -59,23 +133,44 @@ def compute_confidence(fields_latest: dict[str, Any], fields_older: dict[str, An
     return int(score)
 
 
-def extract_fields_from_documents(docs: list[dict[str, Any]]) -> tuple[dict[str, Any], int]:
+def extract_fields_from_documents(
+    docs: list[dict[str, Any]],
+    on_progress: Callable[..., None] | None = None,
+) -> tuple[dict[str, Any], int]:
     """
-    docs: [{kind, mime, bytes}]
+    docs: [{kind, mime, bytes, pdf?}] -- `pdf` opzionale: PdfDocument già aperto sugli stessi bytes
+    on_progress(stage, doc=kind, page=, pages=): avanzamento ("extracting", "ocr") per lo streaming
     return: (fields_json, confidence)
     """
     per_kind: dict[str, dict[str, Any]] = {}
     meta: dict[str, Any] = {}
-
-    for doc in docs:
-        kind = doc["kind"]
-        mime = doc.get("mime") or "application/octet-stream"
-        data: bytes = doc["bytes"]
-        text, m = _extract_text(mime, data)
-        fields = parse_fields_from_text(text)
-        fields["_text_len"] = len(text)
-        per_kind[kind] = fields
-        meta[kind] = m
+    cache = get_extraction_cache()
+
+    with collect_timings() as timings:
+        for doc in docs:
+            kind = doc["kind"]
+            mime = doc.get("mime") or "application/octet-stream"
+            data: bytes = doc["bytes"]
+            key = content_key(data, "pipeline", f"{EXTRACTOR_VERSION}:{mime.lower()}")
+            cached = cache.get(key)
+            if cached is not None:
+                fields, m = cached["fields"], cached["meta"]
+                m["cache_hit"] = True
+            else:
+                on_ocr_page = None
+                if on_progress is not None:
+                    on_progress("extracting", doc=kind)
+                    on_ocr_page = lambda done, total, kind=kind: on_progress("ocr", doc=kind, page=done, pages=total)
+                text, m = _extract_text(mime, data, doc.get("pdf"), on_ocr_page=on_ocr_page)
+                with span("parse_fields"):
+                    fields = parse_fields_from_text(text)
+                fields["_text_len"] = len(text)
+                cache.set(key, {"fields": fields, "meta": m})
+                m["cache_hit"] = False
+            per_kind[kind] = fields
+            meta[kind] = m
+    # tempi per fase (ms, numero di span) dell'estrazione; vuoto se tutto da cache
+    meta["timings"] = timings.as_dict()
 
     latest = per_kind.get("latest", {})
     older = per_kind.get("older")
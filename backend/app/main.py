@@ -37,3 +37,12 @@ def root_health():
     from fastapi.responses import JSONResponse
     content, status_code = health.health()
     return JSONResponse(content=content, status_code=status_code)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus scrape target (not proxied by nginx: reachable only inside the network)."""
+    from fastapi.responses import Response
+    from app.core.instrumentation import render_metrics
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,51 @@
+"""Executors for the legacy /submissions analysis (Celery worker or in-process for tests)."""
+from __future__ import annotations
+
+import logging
+import uuid
+from abc import ABC, abstractmethod
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisExecutor(ABC):
+    @abstractmethod
+    def submit(self, submission_id: uuid.UUID) -> None:
+        """Schedule the analysis of a submission already claimed as "pending"."""
+
+
+class CeleryAnalysisExecutor(AnalysisExecutor):
+    """Enqueue on the cpu queue (OCR); acks_late gives at-least-once delivery."""
+
+    def submit(self, submission_id: uuid.UUID) -> None:
+        from app.workers.tasks import analyze_submission
+
+        analyze_submission.apply_async(args=[str(submission_id)])
+
+
+class InlineAnalysisExecutor(AnalysisExecutor):
+    """Run the worker task synchronously in this process (tests, single-process dev)."""
+
+    def submit(self, submission_id: uuid.UUID) -> None:
+        from app.workers.tasks import analyze_submission
+
+        analyze_submission.apply(args=[str(submission_id)])
+
+
+_override: AnalysisExecutor | None = None
+
+
+def set_analysis_executor(executor: AnalysisExecutor | None) -> None:
+    """Force an executor (tests); None restores the one from settings."""
+    global _override
+    _override = executor
+
+
+def get_analysis_executor() -> AnalysisExecutor:
+    if _override is not None:
+        return _override
+    if get_settings().ANALYSIS_EXECUTOR.lower() == "inline":
+        return InlineAnalysisExecutor()
+    return CeleryAnalysisExecutor()
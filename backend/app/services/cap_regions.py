@@ -0,0 +1,34 @@
+"""CAP -> regione (dalle prime due cifre del CAP, una provincia o un gruppo di province)."""
+from __future__ import annotations
+
+_REGIONS: dict[str, tuple[str, ...]] = {
+    "Lazio": ("00", "01", "02", "03", "04"),
+    "Umbria": ("05", "06"),
+    "Sardegna": ("07", "08", "09"),
+    "Piemonte": ("10", "12", "13", "14", "15", "28"),
+    "Valle d'Aosta": ("11",),
+    "Liguria": ("16", "17", "18", "19"),
+    "Lombardia": ("20", "21", "22", "23", "24", "25", "26", "27", "46"),
+    "Emilia-Romagna": ("29", "40", "41", "42", "43", "44", "47", "48"),
+    "Veneto": ("30", "31", "32", "35", "36", "37", "45"),
+    "Friuli-Venezia Giulia": ("33", "34"),
+    "Trentino-Alto Adige": ("38", "39"),
+    "Toscana": ("50", "51", "52", "53", "54", "55", "56", "57", "58", "59"),
+    "Marche": ("60", "61", "62", "63"),
+    "Abruzzo": ("64", "65", "66", "67"),
+    "Puglia": ("70", "71", "72", "73", "74", "76"),
+    "Basilicata": ("75", "85"),
+    "Campania": ("80", "81", "82", "83", "84"),
+    "Molise": ("86",),
+    "Calabria": ("87", "88", "89"),
+    "Sicilia": ("90", "91", "92", "93", "94", "95", "96", "97", "98"),
+}
+
+REGION_BY_PREFIX: dict[str, str] = {prefix: region for region, prefixes in _REGIONS.items() for prefix in prefixes}
+
+
+def region_for_cap(cap: str) -> str | None:
+    cap = (cap or "").strip()
+    if len(cap) != 5 or not cap.isdigit():
+        return None
+    return REGION_BY_PREFIX.get(cap[:2])
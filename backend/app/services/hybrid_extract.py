@@ -0,0 +1,113 @@
+"""Regex-first bill extraction: local parsers, LLM only for missing/low-confidence fields."""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.extraction.parsers import parse_fields_with_evidence
+
+logger = logging.getLogger(__name__)
+
+# Campi necessari al calcolo del trend; kwh/smc: basta uno dei due
+REQUIRED_FIELDS = ("total_due", "period_start", "period_end")
+CONSUMPTION_FIELDS = ("kwh", "smc")
+
+# Etichette che identificano senza ambiguità il totale da pagare
+_TOTAL_SPECIFIC = ("totale bolletta", "importo totale", "da pagare", "totale fattura", "totale da pagare")
+# "Totale ..." che NON è il totale bolletta (subtotali di sezione)
+_TOTAL_PARTIAL = ("imposte", "iva", "parziale", "servizi", "spesa", "oneri", "materia", "trasporto")
+
+
+@dataclass
+class LocalExtraction:
+    raw: dict[str, Any]
+    confidence: dict[str, float]
+    missing: list[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing
+
+
+def _total_confidence(evidence: str) -> float:
+    ev = evidence.lower()
+    if any(lab in ev for lab in _TOTAL_SPECIFIC):
+        return 0.9
+    if any(w in ev for w in _TOTAL_PARTIAL):
+        return 0.3
+    return 0.6
+
+
+def local_extraction(text: str, threshold: float | None = None) -> LocalExtraction:
+    """Parse with the local scanner and map to the ExtractionOutput payload, with per-field confidence."""
+    threshold = get_settings().HYBRID_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    fields, evidence = parse_fields_with_evidence(text)
+    raw: dict[str, Any] = {}
+    conf: dict[str, float] = {}
+
+    if "total_eur" in fields:
+        raw["total_due"] = fields["total_eur"]
+        conf["total_due"] = _total_confidence(evidence["total_eur"])
+    if fields.get("period_start") and fields.get("period_end"):
+        raw["period_start"] = fields["period_start"]
+        raw["period_end"] = fields["period_end"]
+        # periodo plausibile per una bolletta (mensile..annuale)
+        days = fields.get("period_days") or 0
+        conf["period_start"] = conf["period_end"] = 0.9 if 20 <= days <= 370 else 0.4
+    if "kwh" in fields:
+        raw["kwh"] = fields["kwh"]
+        conf["kwh"] = 0.85
+    if "mc" in fields:
+        raw["smc"] = fields["mc"]
+        # "mc"/"m3" compaiono anche in testi non di consumo; "Smc" è specifico
+        conf["smc"] = 0.85 if "smc" in evidence["mc"].lower() else 0.6
+    if "variable_eur" in fields:
+        raw["energy_cost"] = fields["variable_eur"]
+        conf["energy_cost"] = 0.7
+    # "IVA 10% 7,77": il parser legge l'aliquota, non l'importo
+    if "vat_eur" in fields and "excise_eur" in fields and "%" not in evidence["vat_eur"]:
+        raw["taxes"] = round(fields["vat_eur"] + fields["excise_eur"], 2)
+        conf["taxes"] = 0.6
+    if "supplier" in fields:
+        raw["supplier"] = fields["supplier"]
+        conf["supplier"] = 0.85 if evidence["supplier"] else 0.4
+
+    def ok(name: str) -> bool:
+        return conf.get(name, 0) >= threshold
+
+    missing = [f for f in REQUIRED_FIELDS if not ok(f)]
+    if not any(ok(f) for f in CONSUMPTION_FIELDS):
+        missing.extend(CONSUMPTION_FIELDS)
+    raw["confidence"] = conf
+    raw["notes"] = "Estrazione locale (parser)"
+    return LocalExtraction(raw=raw, confidence=conf, missing=missing)
+
+
+def merge_llm_fields(local: LocalExtraction, llm: dict[str, Any], fields: list[str]) -> dict[str, Any]:
+    """Local payload with `fields` taken from the LLM answer (values and confidence)."""
+    merged = {k: v for k, v in local.raw.items() if k not in ("confidence", "notes")}
+    conf = dict(local.confidence)
+    llm_conf = llm.get("confidence") or {}
+    for name in fields:
+        if llm.get(name) is not None:
+            merged[name] = llm[name]
+            conf[name] = llm_conf.get(name, 0.5)
+    merged["confidence"] = conf
+    merged["notes"] = llm.get("notes") or "Estrazione locale + LLM"
+    return merged
+
+
+def record_outcome(local: LocalExtraction) -> None:
+    metrics.incr("hybrid_extractions_total", outcome="llm_skipped" if local.complete else "llm_partial")
+    if not local.complete:
+        metrics.incr("hybrid_llm_fields_requested", len(local.missing))
+        logger.info("Local extraction incomplete, asking LLM for: %s", ", ".join(local.missing))
+
+
+def llm_skip_rate() -> float | None:
+    skipped = metrics.get_counter("hybrid_extractions_total", outcome="llm_skipped")
+    total = skipped + metrics.get_counter("hybrid_extractions_total", outcome="llm_partial")
+    return skipped / total if total else None
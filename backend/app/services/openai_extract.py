@@ -1,16 +1,26 @@
 """OpenAI-based bill extraction with strict JSON schema."""
 from __future__ import annotations
 
-import base64
+import asyncio
 import json
 import logging
-from typing import Any
+import os
+import random
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, TypeVar
 
+from app.core import metrics
 from app.core.config import get_settings
+from app.core.instrumentation import span
+from app.extraction.condense import condense_text
 from app.services.extract_schema import ExtractionOutput, validate_extraction_payload, second_pass_validate
 
 logger = logging.getLogger(__name__)
 
+# Da incrementare quando cambiano prompt/schema: invalida la cache delle estrazioni
+EXTRACTOR_VERSION = "openai-1"
+
 SCHEMA_JSON = {
     "type": "object",
     "properties": {
@@ -40,28 +50,192 @@ SCHEMA_JSON = {
 }
 
 
-def extract_from_text(text: str) -> tuple[dict[str, Any] | None, str | None]:
-    """Call OpenAI to extract structured data from bill text. Returns (raw_dict, error)."""
-    api_key = get_settings().OPENAI_API_KEY
-    if not api_key:
+T = TypeVar("T")
+
+TEXT_SYSTEM_PROMPT = """Sei un estrattore di dati da bollette luce/gas.
+Restituisci SOLO un JSON valido con i campi richiesti. Se un valore non è leggibile, usa null.
+Non inventare mai valori. confidence per ogni campo deve essere tra 0 e 1."""
+
+IMAGE_SYSTEM_PROMPT = (
+    "Estrai dalla bolletta energia i campi: period_start, period_end, issue_date, total_due, kwh, smc, "
+    "energy_cost, transport_cost, taxes, supplier, tariff_name, cap_or_zone_hint. "
+    "Restituisci JSON con confidence 0-1 per campo. Se non leggibile: null."
+)
+
+
+class _AsyncRuntime:
+    """Event loop dedicato (thread daemon) + AsyncOpenAI condiviso, uno per processo.
+
+    I task Celery sono sincroni: le coroutine vengono eseguite su questo loop, così il
+    client httpx (e le sue connessioni keep-alive) sopravvive tra un task e l'altro.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="openai-loop", daemon=True)
+        self.thread.start()
+        self.client: Any = None
+
+    def run(self, coro: Awaitable[T]) -> T:
+        fut: Future[T] = asyncio.run_coroutine_threadsafe(coro, self.loop)  # type: ignore[arg-type]
+        return fut.result()
+
+    def close(self) -> None:
+        async def _close() -> None:
+            if self.client is not None:
+                await self.client.close()
+
+        try:
+            self.run(_close())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+
+
+_runtime: _AsyncRuntime | None = None
+_runtime_lock = threading.Lock()
+
+
+def _get_runtime() -> _AsyncRuntime:
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = _AsyncRuntime()
+    return _runtime
+
+
+def _forget_runtime_after_fork() -> None:
+    # il thread del loop non esiste nel figlio: si ricrea al primo utilizzo
+    global _runtime, _runtime_lock
+    _runtime = None
+    _runtime_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_runtime_after_fork)
+
+
+def reset_client() -> None:
+    """Chiude client e loop (es. dopo cambio settings nei test)."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is not None:
+            _runtime.close()
+            _runtime = None
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """Esegue una coroutine sul loop condiviso del processo e ne attende il risultato."""
+    return _get_runtime().run(coro)
+
+
+def _build_client() -> Any:
+    import httpx
+    import openai
+
+    s = get_settings()
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(s.OPENAI_TIMEOUT_SECONDS, connect=s.OPENAI_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=s.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=s.OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=120,
+        ),
+    )
+    return openai.AsyncOpenAI(
+        api_key=s.OPENAI_API_KEY,
+        base_url=s.OPENAI_BASE_URL or None,
+        http_client=http_client,
+        # i retry li gestiamo noi (backoff con jitter su 429/5xx)
+        max_retries=0,
+    )
+
+
+def get_async_client() -> Any:
+    """AsyncOpenAI del processo. Da chiamare dentro il loop condiviso."""
+    rt = _get_runtime()
+    if rt.client is None:
+        rt.client = _build_client()
+    return rt.client
+
+
+def _is_retryable(exc: Exception) -> bool:
+    import openai
+
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def _retry_after_seconds(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def _with_retries(call: Callable[[], Awaitable[T]]) -> T:
+    """Retry su 429/5xx/timeout con backoff esponenziale e full jitter (rispetta Retry-After)."""
+    s = get_settings()
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as exc:
+            if attempt >= s.OPENAI_MAX_RETRIES or not _is_retryable(exc):
+                raise
+            delay = random.uniform(0, min(s.OPENAI_BACKOFF_MAX_SECONDS, s.OPENAI_BACKOFF_BASE_SECONDS * 2**attempt))
+            retry_after = _retry_after_seconds(exc)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, s.OPENAI_BACKOFF_MAX_SECONDS))
+            attempt += 1
+            logger.warning("OpenAI call failed (%s), retry %d in %.2fs", type(exc).__name__, attempt, delay)
+            await asyncio.sleep(delay)
+
+
+async def _chat_json(**kwargs: Any) -> dict[str, Any]:
+    client = get_async_client()
+
+    async def call() -> Any:
+        return await client.chat.completions.create(response_format={"type": "json_object"}, temperature=0.1, **kwargs)
+
+    with span("llm_call"):
+        response = await _with_retries(call)
+    return json.loads(response.choices[0].message.content)
+
+
+def _condense(text: str, max_tokens: int) -> str:
+    c = condense_text(text, max_tokens)
+    metrics.incr("openai_input_tokens_original", c.original_tokens)
+    metrics.incr("openai_input_tokens_sent", c.tokens)
+    logger.debug("Condensed bill text: %d -> %d tokens (%d/%d lines)", c.original_tokens, c.tokens, c.lines_kept, c.lines_total)
+    return c.text
+
+
+async def aextract_from_text(
+    text: str, fields: list[str] | None = None
+) -> tuple[dict[str, Any] | None, str | None]:
+    """Call OpenAI to extract structured data from bill text. Returns (raw_dict, error).
+
+    `fields`: ask only for these fields (the others are already known locally).
+    """
+    if not get_settings().OPENAI_API_KEY:
         return None, "OPENAI_API_KEY non configurata"
 
+    system = TEXT_SYSTEM_PROMPT
+    if fields:
+        system += f"\nEstrai SOLO questi campi (tutti gli altri null): {', '.join(fields)}."
+    excerpt = _condense(text, get_settings().OPENAI_INPUT_MAX_TOKENS)
     try:
-        import openai
-        client = openai.OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
+        data = await _chat_json(
             model=get_settings().OPENAI_MODEL,
             messages=[
-                {"role": "system", "content": """Sei un estrattore di dati da bollette luce/gas.
-Restituisci SOLO un JSON valido con i campi richiesti. Se un valore non è leggibile, usa null.
-Non inventare mai valori. confidence per ogni campo deve essere tra 0 e 1."""},
-                {"role": "user", "content": f"Estrai i dati dalla seguente bolletta:\n\n{text[:12000]}"},
+                {"role": "system", "content": system},
+                {"role": "user", "content": f"Estrai i dati dalla seguente bolletta:\n\n{excerpt}"},
             ],
-            response_format={"type": "json_object"},
-            temperature=0.1,
         )
-        raw = response.choices[0].message.content
-        data = json.loads(raw)
     except Exception as e:
         logger.exception("OpenAI extraction failed")
         return None, f"Estrazione non riuscita: {str(e)[:200]}"
@@ -75,29 +249,22 @@ Non inventare mai valori. confidence per ogni campo deve essere tra 0 e 1."""},
     return data, None
 
 
-def extract_from_image_base64(b64: str) -> tuple[dict[str, Any] | None, str | None]:
+async def aextract_from_image_base64(b64: str) -> tuple[dict[str, Any] | None, str | None]:
     """Extract from image (base64). Uses vision model if available."""
-    api_key = get_settings().OPENAI_API_KEY
-    if not api_key:
+    if not get_settings().OPENAI_API_KEY:
         return None, "OPENAI_API_KEY non configurata"
 
     try:
-        import openai
-        client = openai.OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
+        data = await _chat_json(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": "Estrai dalla bolletta energia i campi: period_start, period_end, issue_date, total_due, kwh, smc, energy_cost, transport_cost, taxes, supplier, tariff_name, cap_or_zone_hint. Restituisci JSON con confidence 0-1 per campo. Se non leggibile: null."},
+                {"role": "system", "content": IMAGE_SYSTEM_PROMPT},
                 {"role": "user", "content": [
                     {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}},
                 ]},
             ],
-            response_format={"type": "json_object"},
-            temperature=0.1,
             max_tokens=1024,
         )
-        raw = response.choices[0].message.content
-        data = json.loads(raw)
     except Exception as e:
         logger.exception("OpenAI vision extraction failed")
         return None, f"Estrazione immagine non riuscita: {str(e)[:200]}"
@@ -106,3 +273,33 @@ def extract_from_image_base64(b64: str) -> tuple[dict[str, Any] | None, str | No
     if err:
         return None, f"Schema non valido: {err}"
     return data, None
+
+
+def extract_from_text(text: str) -> tuple[dict[str, Any] | None, str | None]:
+    """Sync wrapper of `aextract_from_text` (shared pooled client)."""
+    return run_sync(aextract_from_text(text))
+
+
+def extract_from_image_base64(b64: str) -> tuple[dict[str, Any] | None, str | None]:
+    """Sync wrapper of `aextract_from_image_base64` (shared pooled client)."""
+    return run_sync(aextract_from_image_base64(b64))
+
+
+async def _gather(coros: list[Awaitable[T]]) -> list[T]:
+    return list(await asyncio.gather(*coros))
+
+
+def extract_concurrently(
+    requests: list[tuple[Any, ...]],
+) -> list[tuple[dict[str, Any] | None, str | None]]:
+    """Run several extractions at once.
+
+    requests: [("text", text) | ("text", text, fields) | ("image", b64)]; with `fields`
+    only those fields are requested (hybrid extraction fallback).
+    """
+    coros: list[Awaitable[tuple[dict[str, Any] | None, str | None]]] = [
+        aextract_from_text(r[1], fields=r[2] if len(r) > 2 else None) if r[0] == "text"
+        else aextract_from_image_base64(r[1])
+        for r in requests
+    ]
+    return run_sync(_gather(coros)) if coros else []
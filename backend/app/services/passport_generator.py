@@ -6,6 +6,7 @@ import logging
 from datetime import datetime, timezone
 
 from app.core.config import get_settings
+from app.core.instrumentation import span
 from app.services.storage import save_file
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,7 @@ logger = logging.getLogger(__name__)
 POSITION_LABELS = {"green": "In linea", "yellow": "In scostamento", "red": "Fuori trend"}
 
 
+@span("passport_render")
 def generate_passport_pdf(
     session_id: str,
     zone_label: str,
@@ -5,11 +5,13 @@ import io
 import logging
 
 from app.core.config import get_settings
+from app.core.instrumentation import span
 from app.services.storage import save_file
 
 logger = logging.getLogger(__name__)
 
 
+@span("share_render")
 def generate_share_card(session_id: str, share_token: str) -> str:
     """Generate 1080x1080 share image, save, return relative path."""
     settings = get_settings()
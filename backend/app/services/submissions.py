@@ -5,10 +5,12 @@ import uuid
 from datetime import datetime, timezone
 from typing import Any, Iterable
 
-from sqlalchemy import select, delete
+from sqlalchemy import delete, or_, select, update
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
+from app.core.instrumentation import collect_timings, span
+from app.core.progress import publish_progress, submission_topic
 from app.db.models import Extracted, File, Finding, Submission
 from app.extraction.pipeline import extract_fields_from_documents
 from app.rules.engine import run_rules
@@ -84,6 +86,43 @@ def set_analysis_state(db: Session, submission: Submission, state: str, error: s
     submission.analysis_error = error
     db.add(submission)
     db.commit()
+    publish_progress(submission_topic(submission.id), "queued" if state == "pending" else state, detail=error)
+
+
+# Stati in cui l'analisi è già accodata o in esecuzione: una nuova richiesta non riaccoda
+ANALYSIS_ACTIVE_STATES = ("pending", "running")
+
+
+def claim_analysis_enqueue(db: Session, submission_id: uuid.UUID) -> bool:
+    """Porta analysis_state a "pending" solo se non c'è già un'analisi attiva (compare-and-set).
+
+    True se questa chiamata ha ottenuto l'accodamento: due richieste concorrenti non
+    producono mai due job per la stessa submission.
+    """
+    res = db.execute(
+        update(Submission)
+        .where(Submission.id == submission_id)
+        .where(or_(Submission.analysis_state.is_(None), Submission.analysis_state.notin_(ANALYSIS_ACTIVE_STATES)))
+        .values(analysis_state="pending", analysis_error=None)
+    )
+    db.commit()
+    if res.rowcount == 1:
+        publish_progress(submission_topic(submission_id), "queued")
+    return res.rowcount == 1
+
+
+def claim_analysis_run(db: Session, submission_id: uuid.UUID, redelivered: bool = False) -> bool:
+    """Lato worker: "pending" -> "running". Un messaggio riconsegnato (worker morto a metà)
+    può riprendere anche da "running"; un duplicato di un job già concluso viene scartato."""
+    from_states = ("pending", "running") if redelivered else ("pending",)
+    res = db.execute(
+        update(Submission)
+        .where(Submission.id == submission_id)
+        .where(Submission.analysis_state.in_(from_states))
+        .values(analysis_state="running", analysis_error=None)
+    )
+    db.commit()
+    return res.rowcount == 1
 
 
 def run_analysis(db: Session, submission_id: uuid.UUID, storage: Storage) -> None:
@@ -100,19 +139,29 @@ def run_analysis(db: Session, submission_id: uuid.UUID, storage: Storage) -> Non
             set_analysis_state(db, sub, "error", "Nessun file caricato")
             return
 
-        docs: list[dict[str, Any]] = []
-        for f in files:
-            try:
-                data = storage.read_bytes(f.storage_path)
-                if len(data) == 0:
-                    raise ValueError(f"File {f.original_name} è vuoto (0 bytes)")
-                docs.append({"kind": f.kind, "mime": f.mime, "bytes": data})
-            except Exception as e:
-                logger.warning(f"Failed to read file {f.id}: {e}")
-                set_analysis_state(db, sub, "error", f"Errore lettura file {f.original_name}: {str(e)[:200]}")
-                return
-
-        extracted_fields, confidence = extract_fields_from_documents(docs)
+        # tempi per fase dell'intera analisi: lettura, estrazione (OCR, LLM...), regole
+        with collect_timings() as timings:
+            docs: list[dict[str, Any]] = []
+            for f in files:
+                try:
+                    with span("storage_read"):
+                        data = storage.read_bytes(f.storage_path)
+                    if len(data) == 0:
+                        raise ValueError(f"File {f.original_name} è vuoto (0 bytes)")
+                    docs.append({"kind": f.kind, "mime": f.mime, "bytes": data})
+                except Exception as e:
+                    logger.warning(f"Failed to read file {f.id}: {e}")
+                    set_analysis_state(db, sub, "error", f"Errore lettura file {f.original_name}: {str(e)[:200]}")
+                    return
+
+            topic = submission_topic(submission_id)
+            extracted_fields, confidence = extract_fields_from_documents(
+                docs, on_progress=lambda stage, **kw: publish_progress(topic, stage, **kw)
+            )
+            with span("rules"):
+                rule_findings: list[RuleFinding] = run_rules(extracted_fields)
+        # la scrittura finale va solo nell'istogramma (durata nota solo dopo il commit)
+        extracted_fields["meta"]["timings"] = timings.as_dict()
 
         # reset risultati precedenti
         db.execute(delete(Finding).where(Finding.submission_id == submission_id))
@@ -122,7 +171,6 @@ def run_analysis(db: Session, submission_id: uuid.UUID, storage: Storage) -> Non
         ex = Extracted(submission_id=submission_id, fields=extracted_fields, confidence=int(confidence))
         db.add(ex)
 
-        rule_findings: list[RuleFinding] = run_rules(extracted_fields)
         for rf in rule_findings:
             db.add(
                 Finding(
@@ -135,7 +183,8 @@ def run_analysis(db: Session, submission_id: uuid.UUID, storage: Storage) -> Non
                 )
             )
 
-        db.commit()
+        with span("db_write"):
+            db.commit()
         set_analysis_state(db, sub, "done", None)
     except Exception as e:
         logger.exception("analysis_failed", extra={"submission_id": str(submission_id)})
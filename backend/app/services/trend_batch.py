@@ -0,0 +1,202 @@
+"""Vectorized trend computation over column arrays and bulk position recompute.
+
+compute_user_trend / compute_position work on one session at a time; the functions
+here do the same arithmetic on whole columns (NumPy), element for element, so every
+stored result can be re-evaluated in one pass after a threshold change
+(TREND_GREEN_THRESHOLD_PCT / TREND_YELLOW_THRESHOLD_PCT):
+
+    python -m app.services.trend_batch recompute [--chunk 50000] [--dry-run]
+
+The job walks trend_results by primary key (keyset pagination, one commit per chunk:
+memory is bounded by the chunk size). Inputs are the totals/kWh/Smc stored in
+user_trend_json and the zone delta each result was compared with, extracted by the
+database; only rows whose position or explanation changes are written, with bulk
+UPDATE ... FROM (VALUES ...) statements on Postgres (executemany by primary key
+elsewhere). Requires numpy (the `batch` extra).
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from typing import Any, Sequence
+
+from sqlalchemy import String, Text, Update, cast, column, select, update, values
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.db.base import GUID
+from app.db.models import TrendResult
+from app.services.trend_calc import EXPLANATIONS, INSUFFICIENT_DATA
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    np = None
+
+logger = logging.getLogger(__name__)
+
+INPUTS = ("total_recent", "total_old", "kwh_recent", "kwh_old", "smc_recent", "smc_old")
+# codici di compute_positions; 3 = delta utente mancante (giallo, spiegazione diversa)
+POSITIONS = ("green", "yellow", "red", "yellow")
+POSITION_EXPLANATIONS = (EXPLANATIONS["green"], EXPLANATIONS["yellow"], EXPLANATIONS["red"], INSUFFICIENT_DATA)
+# Postgres accepts at most 65535 bind parameters per statement (3 per row here)
+UPDATE_BATCH = 5000
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("Batch trend computation requires numpy (pip install numpy)")
+
+
+def _column(values: Sequence[float | None]) -> "np.ndarray":
+    """Float column with missing values as 0, like `x or 0` in compute_user_trend."""
+    arr = np.asarray(values, dtype=float)
+    return np.where(np.isnan(arr), 0.0, arr)
+
+
+def compute_user_trends(
+    total_recent: Sequence[float | None],
+    total_old: Sequence[float | None],
+    kwh_recent: Sequence[float | None],
+    kwh_old: Sequence[float | None],
+    smc_recent: Sequence[float | None],
+    smc_old: Sequence[float | None],
+) -> dict[str, "np.ndarray"]:
+    """compute_user_trend over columns: same keys, one array each (NaN where the scalar gives None)."""
+    _require_numpy()
+    tr, to, kr, ko, sr, so = map(_column, (total_recent, total_old, kwh_recent, kwh_old, smc_recent, smc_old))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eur_recent = np.where(kr != 0, tr / kr, np.nan)
+        eur_old = np.where(ko != 0, to / ko, np.nan)
+        comparable = ~np.isnan(eur_recent) & ~np.isnan(eur_old) & (eur_old != 0)
+        delta_pct = np.where(comparable, (eur_recent - eur_old) / eur_old * 100, np.nan)
+    return {
+        "total_recent": tr,
+        "total_old": to,
+        "delta_total": tr - to,
+        "kwh_recent": kr,
+        "kwh_old": ko,
+        "delta_kwh": kr - ko,
+        "smc_recent": sr,
+        "smc_old": so,
+        "delta_smc": sr - so,
+        "eur_per_kwh_recent": eur_recent,
+        "eur_per_kwh_old": eur_old,
+        "eur_per_kwh_delta_pct": delta_pct,
+    }
+
+
+def compute_positions(
+    user_delta_pct: Sequence[float | None],
+    zone_delta_pct: Sequence[float | None],
+    green_pct: float | None = None,
+    yellow_pct: float | None = None,
+) -> "np.ndarray":
+    """compute_position over columns: int8 codes indexing POSITIONS / POSITION_EXPLANATIONS.
+
+    Thresholds default to the current settings.
+    """
+    _require_numpy()
+    settings = get_settings()
+    green_pct = settings.TREND_GREEN_THRESHOLD_PCT if green_pct is None else green_pct
+    yellow_pct = settings.TREND_YELLOW_THRESHOLD_PCT if yellow_pct is None else yellow_pct
+    user = np.asarray(user_delta_pct, dtype=float)
+    diff = np.abs(user - _column(zone_delta_pct))
+    return np.select([np.isnan(user), diff <= green_pct, diff <= yellow_pct], [3, 0, 1], default=2).astype(np.int8)
+
+
+def bulk_update_statement(rows: Sequence[tuple[Any, str, str]]) -> Update:
+    """UPDATE trend_results SET position, explanation_short FROM (VALUES (id, position, explanation), ...)."""
+    v = values(
+        column("id", String(36)), column("position", String(16)), column("explanation_short", Text()), name="v",
+    ).data([(str(id_), position, explanation) for id_, position, explanation in rows])
+    return (
+        update(TrendResult)
+        .where(TrendResult.id == cast(v.c.id, GUID()))
+        .values(position=v.c.position, explanation_short=v.c.explanation_short)
+    )
+
+
+def write_positions(db: Session, rows: Sequence[tuple[Any, str, str]]) -> None:
+    """Write (id, position, explanation_short) rows; the caller commits."""
+    postgres = db.get_bind().dialect.name == "postgresql"
+    for start in range(0, len(rows), UPDATE_BATCH):
+        batch = rows[start:start + UPDATE_BATCH]
+        if postgres:
+            db.execute(bulk_update_statement(batch))
+        else:  # SQLite: niente alias di colonna su VALUES; bulk update ORM per chiave primaria
+            db.execute(update(TrendResult), [
+                {"id": id_, "position": position, "explanation_short": explanation}
+                for id_, position, explanation in batch
+            ])
+
+
+def _chunk_query(after: Any, chunk: int):
+    trend = TrendResult.user_trend_json
+    stmt = (
+        select(
+            TrendResult.id, TrendResult.position, TrendResult.explanation_short,
+            *(trend[key].as_float() for key in INPUTS),
+            TrendResult.zone_trend_json["eur_per_kwh_delta_pct"].as_float(),
+        )
+        .order_by(TrendResult.id)
+        .limit(chunk)
+    )
+    return stmt if after is None else stmt.where(TrendResult.id > after)
+
+
+def recompute_positions(db: Session, chunk: int = 50_000, dry_run: bool = False) -> dict[str, Any]:
+    """Re-evaluate every stored result with the current thresholds, `chunk` rows at a time."""
+    _require_numpy()
+    summary: dict[str, Any] = {"results": 0, "changed": 0, "positions": {p: 0 for p in POSITIONS[:3]}}
+    after = None
+    while True:
+        rows = db.execute(_chunk_query(after, chunk)).all()
+        if not rows:
+            break
+        after = rows[-1][0]
+        ids, positions, explanations, *inputs, zone = zip(*rows)
+        trends = compute_user_trends(*inputs)
+        codes = compute_positions(trends["eur_per_kwh_delta_pct"], zone)
+        changed = [
+            (id_, POSITIONS[code], POSITION_EXPLANATIONS[code])
+            for id_, code, position, explanation in zip(ids, codes.tolist(), positions, explanations)
+            if (position, explanation) != (POSITIONS[code], POSITION_EXPLANATIONS[code])
+        ]
+        if changed and not dry_run:
+            write_positions(db, changed)
+            db.commit()
+        else:
+            db.rollback()  # chiude la transazione di lettura del chunk
+        counts = np.bincount(codes, minlength=len(POSITIONS))
+        for code, n in enumerate(counts.tolist()):
+            summary["positions"][POSITIONS[code]] += n
+        summary["results"] += len(rows)
+        summary["changed"] += len(changed)
+        logger.info("Recomputed %d results (%d changed)", summary["results"], summary["changed"])
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Bulk trend recomputation")
+    ap.add_argument("command", choices=["recompute"], help="re-evaluate every stored position with the current thresholds")
+    ap.add_argument("--chunk", type=int, default=50_000, help="results read and written per transaction")
+    ap.add_argument("--dry-run", action="store_true", help="count the changes without writing them")
+    args = ap.parse_args(argv)
+
+    from app.db.session import get_sessionmaker
+
+    db = get_sessionmaker()()
+    try:
+        summary = recompute_positions(db, chunk=args.chunk, dry_run=args.dry_run)
+    finally:
+        db.close()
+    print(f"{'would change' if args.dry_run else 'changed'} {summary['changed']} of {summary['results']} results: "
+          f"{summary['positions']}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
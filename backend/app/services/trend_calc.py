@@ -7,6 +7,14 @@ from typing import Any
 from app.core.config import get_settings
 
 
+EXPLANATIONS = {
+    "green": "Sei in linea con l'andamento della tua zona.",
+    "yellow": "Stai iniziando ad allontanarti dal trend della zona.",
+    "red": "Il tuo andamento è fuori trend rispetto alla tua zona.",
+}
+INSUFFICIENT_DATA = "Dati insufficienti per il confronto con la zona."
+
+
 def monthlyize_days(days: float) -> float:
     if days <= 0:
         return 0.0
@@ -64,12 +72,12 @@ def compute_position(
     zone_delta_pct = zone_trend.get("eur_per_kwh_delta_pct") or 0.0
 
     if user_delta_pct is None:
-        return "yellow", "Dati insufficienti per il confronto con la zona."
+        return "yellow", INSUFFICIENT_DATA
 
     diff_pct = abs((user_delta_pct or 0) - zone_delta_pct)
 
     if diff_pct <= green_pct:
-        return "green", "Sei in linea con l'andamento della tua zona."
+        return "green", EXPLANATIONS["green"]
     if diff_pct <= yellow_pct:
-        return "yellow", "Stai iniziando ad allontanarti dal trend della zona."
-    return "red", "Il tuo andamento è fuori trend rispetto alla tua zona."
+        return "yellow", EXPLANATIONS["yellow"]
+    return "red", EXPLANATIONS["red"]
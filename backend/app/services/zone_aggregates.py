@@ -1,47 +1,267 @@
-"""Zone aggregates (CAP-level) for trend comparison."""
+"""Zone aggregates (CAP-level) for trend comparison.
+
+Zone statistics live in `zone_trend_stats`, one row per zone with a KLL sketch of
+eur_per_kwh_delta_pct: every new TrendResult updates its CAP's row in the same
+transaction (bounded work, whatever the zone size). Rollups per 3-digit prefix and
+per region merge the CAP sketches; they are refreshed periodically (Celery beat,
+`refresh_zone_rollups`). A lookup reads the three levels with one primary-key query
+and uses the smallest one with at least ZONE_MIN_SAMPLES results.
+
+Each session is counted once: a re-analysis replaces its TrendResult without touching
+the sketches. Sketches cannot forget values, so deleted results (TTL) and the previous
+value of re-analysed sessions stay counted until the next rebuild:
+
+    python -m app.services.zone_aggregates rebuild [--zone 20121 ...]
+    python -m app.services.zone_aggregates rollups
+
+Time-windowed statistics (by bill month) are in zone_windows; both commands refresh them too.
+
+Exact statistics (rebuilds, zones without a stats row yet) read the stored
+trend_results.eur_per_kwh_delta_pct column through the (zone_key, id) and
+(session_id, delta) indexes, never the JSON documents; medians are computed by
+Postgres (percentile_cont), in Python on SQLite.
+"""
 from __future__ import annotations
 
+import argparse
 import logging
-from collections import defaultdict
-from typing import Any
+import sys
+from typing import Any, Iterable
 
-from sqlalchemy import select, func
+from sqlalchemy import Select, func, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.db.models import TrendResult, UserSession
+from app.core.config import get_settings
+from app.db.models import TrendResult, UserSession, ZoneTrendStats
+from app.services.cap_regions import region_for_cap
+from app.utils.quantile_sketch import KLLSketch, percentile_cont
 
 logger = logging.getLogger(__name__)
 
+EMPTY_ZONE = {"eur_per_kwh_delta_pct": 0.0, "count": 0}
+QUANTILES = (0.1, 0.5, 0.9)
+LEVELS = ("cap", "prefix", "region")
+_KEY_PREFIX = {"cap": "", "prefix": "p:", "region": "r:"}
 
-def get_zone_trend_json(db: Session, zone_key: str) -> dict[str, Any]:
-    """Aggregate eur_per_kwh_delta_pct from TrendResults in same zone."""
-    subq = (
-        select(TrendResult.user_trend_json)
+
+def zone_hierarchy(zone_key: str) -> list[tuple[str, str]]:
+    """[(level, stats key)] from the smallest zone up: CAP, 3-digit prefix, region."""
+    levels = [("cap", zone_key)]
+    if len(zone_key) == 5 and zone_key.isdigit():
+        levels.append(("prefix", f"p:{zone_key[:3]}"))
+        region = region_for_cap(zone_key)
+        if region:
+            levels.append(("region", f"r:{region}"))
+    return levels
+
+
+def stats_key(level: str, zone: str) -> str:
+    """Inverse of zone_hierarchy for one level: ("prefix", "201") -> "p:201"."""
+    return f"{_KEY_PREFIX.get(level, '')}{zone}"
+
+
+def _zone_json(median: float | None, count: int, level: str, key: str) -> dict[str, Any]:
+    return {"eur_per_kwh_delta_pct": median if count else 0.0, "count": count, "level": level,
+            "zone": key[len(_KEY_PREFIX[level]):]}
+
+
+def _delta(user_trend: Any) -> float | None:
+    if isinstance(user_trend, dict) and user_trend.get("eur_per_kwh_delta_pct") is not None:
+        return float(user_trend["eur_per_kwh_delta_pct"])
+    return None
+
+
+def _in_zone(stmt: Select, zone_key: str) -> Select:
+    return (
+        stmt.select_from(TrendResult)
         .join(UserSession, UserSession.id == TrendResult.session_id)
         .where(UserSession.zone_key == zone_key)
-        .where(TrendResult.user_trend_json.isnot(None))
+        .where(TrendResult.eur_per_kwh_delta_pct.isnot(None))
     )
-    rows = list(db.execute(subq).scalars().all())
+
+
+def zone_deltas_query(zone_key: str) -> Select:
+    return _in_zone(select(TrendResult.eur_per_kwh_delta_pct), zone_key)
+
+
+def exact_zone_stats(db: Session, zone_key: str) -> dict[str, Any]:
+    """count, p10, median, p90 of the zone's deltas, aggregated in the database where possible."""
+    if db.get_bind().dialect.name == "postgresql":
+        delta = TrendResult.eur_per_kwh_delta_pct
+        stmt = _in_zone(select(func.count(delta), *(func.percentile_cont(q).within_group(delta) for q in QUANTILES)),
+                        zone_key)
+        count, *values = db.execute(stmt).one()
+    else:
+        ordered = sorted(db.execute(zone_deltas_query(zone_key)).scalars())
+        count, values = len(ordered), [percentile_cont(ordered, q) for q in QUANTILES]
+    return {"count": count, **dict(zip(("p10", "median", "p90"), values))}
+
+
+def get_zone_trend_json(db: Session, zone_key: str) -> dict[str, Any]:
+    """Zone median of eur_per_kwh_delta_pct at the smallest level with enough results.
+
+    One primary-key read fetches every level. When none reaches ZONE_MIN_SAMPLES the
+    level with the most results is used; zones with no stats rows at all (before the
+    first rebuild) fall back to the exact CAP query.
+    """
+    levels = zone_hierarchy(zone_key)
+    rows = {
+        r.zone_key: r
+        for r in db.execute(
+            select(ZoneTrendStats.zone_key, ZoneTrendStats.median_delta_pct, ZoneTrendStats.count)
+            .where(ZoneTrendStats.zone_key.in_([key for _, key in levels]))
+        )
+    }
     if not rows:
-        return {"eur_per_kwh_delta_pct": 0.0, "count": 0}
+        exact = exact_zone_trend_json(db, zone_key)
+        return _zone_json(exact["eur_per_kwh_delta_pct"], exact["count"], "cap", zone_key)
+    candidates = [(level, key, rows[key]) for level, key in levels if key in rows]
+    min_samples = get_settings().ZONE_MIN_SAMPLES
+    level, key, row = next(
+        (c for c in candidates if c[2].count >= min_samples),
+        max(candidates, key=lambda c: c[2].count),
+    )
+    return _zone_json(row.median_delta_pct, row.count, level, key)
+
+
+def exact_zone_trend_json(db: Session, zone_key: str) -> dict[str, Any]:
+    """Zone median computed from all the zone's results (no sketch)."""
+    stats = exact_zone_stats(db, zone_key)
+    if not stats["count"]:
+        return dict(EMPTY_ZONE)
+    return {"eur_per_kwh_delta_pct": stats["median"], "count": stats["count"]}
+
+
+def _locked_stats(db: Session, zone_key: str) -> ZoneTrendStats:
+    """The zone's row, locked until commit (created if missing; concurrent creators race safely)."""
+    query = select(ZoneTrendStats).where(ZoneTrendStats.zone_key == zone_key).with_for_update()
+    stats = db.execute(query).scalars().first()
+    if stats is not None:
+        return stats
+    try:
+        with db.begin_nested():
+            stats = ZoneTrendStats(zone_key=zone_key, count=0)
+            db.add(stats)
+        return stats
+    except IntegrityError:
+        return db.execute(query).scalars().one()
+
+
+def _store(stats: ZoneTrendStats, sketch: KLLSketch) -> None:
+    stats.count = sketch.n
+    stats.p10_delta_pct, stats.median_delta_pct, stats.p90_delta_pct = sketch.quantiles(QUANTILES)
+    stats.sketch_json = sketch.to_dict()
+
+
+def record_zone_trend(db: Session, zone_key: str | None, user_trend: dict[str, Any]) -> None:
+    """Add one result to its zone's sketch; the caller commits (same transaction as the TrendResult)."""
+    delta = _delta(user_trend)
+    if not zone_key or delta is None:
+        return
+    stats = _locked_stats(db, zone_key)
+    sketch = KLLSketch.from_dict(stats.sketch_json)
+    sketch.update(delta)
+    _store(stats, sketch)
+
+
+def _refresh_lock(db: Session, job: str) -> None:
+    """Serialize the runs of a refresh job until commit (Postgres advisory lock; SQLite has one writer)."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(func.hashtext(job))))
 
-    deltas = []
-    for row in rows:
-        uj = row[0] if row else None
-        if uj is not None and isinstance(uj, dict) and uj.get("eur_per_kwh_delta_pct") is not None:
-            deltas.append(uj["eur_per_kwh_delta_pct"])
 
-    if not deltas:
-        return {"eur_per_kwh_delta_pct": 0.0, "count": 0}
+def refresh_zone_rollups(db: Session, chunk: int = 1000) -> dict[str, int]:
+    """Rebuild the prefix and region rows by merging the CAP sketches (no TrendResult scan).
+
+    Concurrent runs (overlapping beat ticks, the CLI) wait for each other: the rollup rows
+    are read, created and deleted under the job's advisory lock.
+    """
+    _refresh_lock(db, "refresh_zone_rollups")
+    merged: dict[tuple[str, str], KLLSketch] = {}
+    caps = db.execute(
+        select(ZoneTrendStats.zone_key, ZoneTrendStats.sketch_json)
+        .where(ZoneTrendStats.level == "cap")
+        .execution_options(yield_per=chunk)
+    )
+    for zone_key, sketch_json in caps:
+        sketch = KLLSketch.from_dict(sketch_json)
+        for level, key in zone_hierarchy(zone_key)[1:]:
+            merged.setdefault((level, key), KLLSketch()).merge(sketch)
+
+    existing = {r.zone_key: r for r in db.execute(select(ZoneTrendStats).where(ZoneTrendStats.level != "cap")).scalars()}
+    counts = {level: 0 for level in LEVELS[1:]}
+    for (level, key), sketch in merged.items():
+        stats = existing.pop(key, None)
+        if stats is None:
+            stats = ZoneTrendStats(zone_key=key, level=level)
+            db.add(stats)
+        _store(stats, sketch)
+        counts[level] += 1
+    for stale in existing.values():  # nessun CAP rimasto sotto questo rollup
+        db.delete(stale)
+    db.commit()
+    logger.info("Zone rollups refreshed: %s", counts)
+    return counts
 
-    deltas.sort()
-    n = len(deltas)
-    trimmed = deltas[n // 10 : 9 * n // 10] if n >= 10 else deltas
-    median = trimmed[len(trimmed) // 2] if trimmed else 0.0
-    return {"eur_per_kwh_delta_pct": median, "count": len(deltas)}
+
+def rebuild_zone_stats(db: Session, zone_keys: Iterable[str] | None = None, chunk: int = 5000) -> int:
+    """Recompute CAP sketches from the TrendResults (all zones by default), one commit per zone.
+
+    The zone's row is locked before its scan: results written meanwhile either wait for
+    the rebuild or are already visible to it, so none is lost or counted twice.
+    """
+    if zone_keys is None:
+        with_results = (
+            select(UserSession.zone_key)
+            .join(TrendResult, TrendResult.session_id == UserSession.id)
+            .where(UserSession.zone_key.isnot(None))
+            .distinct()
+        )
+        known = select(ZoneTrendStats.zone_key).where(ZoneTrendStats.level == "cap")
+        zone_keys = sorted(set(db.execute(with_results).scalars()) | set(db.execute(known).scalars()))
+    n = 0
+    for zone_key in zone_keys:
+        stats = _locked_stats(db, zone_key)
+        sketch = KLLSketch()
+        sketch.extend(db.execute(zone_deltas_query(zone_key).execution_options(yield_per=chunk)).scalars())
+        _store(stats, sketch)
+        db.commit()
+        n += 1
+        logger.info("Zone %s rebuilt: %d results", zone_key, sketch.n)
+    return n
 
 
 def cap_to_zone_key(cap: str) -> str:
     """CAP -> zone key (e.g. first 3 digits or full CAP)."""
     cap = (cap or "").strip()[:5]
     return cap or "unknown"
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Zone trend statistics maintenance")
+    ap.add_argument("command", choices=["rebuild", "rollups"],
+                    help="rebuild: CAP and monthly sketches + rollups + windows; rollups: rollups + dirty windows")
+    ap.add_argument("--zone", action="append", dest="zones", help="only these CAP zones (repeatable)")
+    args = ap.parse_args(argv)
+
+    from app.db.session import get_sessionmaker
+    from app.services.zone_windows import rebuild_zone_months, refresh_zone_windows
+
+    db = get_sessionmaker()()
+    try:
+        rebuild = args.command == "rebuild"
+        if rebuild:
+            print(f"rebuilt {rebuild_zone_stats(db, args.zones)} zones")
+            zones = args.zones or list(db.execute(select(ZoneTrendStats.zone_key).where(ZoneTrendStats.level == "cap")).scalars())
+            print(f"rebuilt months of {rebuild_zone_months(db, zones)} zones")
+        print(f"rollups: {refresh_zone_rollups(db)}")
+        print(f"windows: {refresh_zone_windows(db, full=rebuild)} rows")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
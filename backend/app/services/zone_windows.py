@@ -0,0 +1,246 @@
+"""Time-windowed zone trends: rolling 3/6/12-month statistics by bill month.
+
+Every TrendResult is also added to `zone_trend_monthly`, one KLL sketch per (CAP,
+month of the recent bill's period_end), in the same transaction as its zone_trend_stats
+update. A month only ever touches its own row, so a new month never rescans history.
+
+`zone_trend_windows` holds, for every zone key of the hierarchy (CAP, prefix, region,
+same keys as zone_trend_stats) and every month, the statistics of the 3/6/12 months
+ending there. They are merged from the monthly sketches by the beat job
+(`refresh_zone_windows`, with the rollups): only zones with monthly rows written since
+the previous refresh are recomputed, and only from their earliest dirty month onwards.
+
+Reads never merge sketches: the comparison at the bill month is one primary-key IN
+query, the curves of a zone one range read on the (zone_key, month, window_months)
+primary key.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.db.models import ExtractedBill, TrendResult, UploadedDocument, ZoneTrendMonthly, ZoneTrendWindow
+from app.services.zone_aggregates import (
+    QUANTILES, _delta, _in_zone, _locked_stats, _refresh_lock, _zone_json, zone_hierarchy,
+)
+from app.utils.quantile_sketch import KLLSketch
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = (3, 6, 12)
+# monthly rows committed while the previous refresh was running are picked up by the next one
+REFRESH_OVERLAP = timedelta(minutes=10)
+
+
+def month_of(value: date | datetime | None) -> date | None:
+    if value is None:
+        return None
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    y, m = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+
+def _months(first: date, last: date) -> list[date]:
+    out = []
+    while first <= last:
+        out.append(first)
+        first = add_months(first, 1)
+    return out
+
+
+def _locked_month(db: Session, zone_key: str, month: date) -> ZoneTrendMonthly:
+    """The (zone, month) row, locked until commit (created if missing)."""
+    query = (
+        select(ZoneTrendMonthly)
+        .where(ZoneTrendMonthly.zone_key == zone_key, ZoneTrendMonthly.month == month)
+        .with_for_update()
+    )
+    row = db.execute(query).scalars().first()
+    if row is not None:
+        return row
+    try:
+        with db.begin_nested():
+            row = ZoneTrendMonthly(zone_key=zone_key, month=month, count=0)
+            db.add(row)
+        return row
+    except IntegrityError:
+        return db.execute(query).scalars().one()
+
+
+def record_zone_month(db: Session, zone_key: str | None, month: date | None, user_trend: dict[str, Any]) -> None:
+    """Add one result to its (CAP, bill month) sketch; the caller commits."""
+    delta = _delta(user_trend)
+    if not zone_key or month is None or delta is None:
+        return
+    row = _locked_month(db, zone_key, month)
+    sketch = KLLSketch.from_dict(row.sketch_json)
+    sketch.update(delta)
+    row.count = sketch.n
+    row.sketch_json = sketch.to_dict()
+    row.updated_at = datetime.now(timezone.utc)
+
+
+def get_zone_window_json(db: Session, zone_key: str, month: date | None) -> dict[str, Any] | None:
+    """Zone median over the ZONE_TREND_WINDOW_MONTHS ending at the bill month, or None.
+
+    Same level choice as get_zone_trend_json; None when windows are disabled, the bill
+    has no period or no level has a precomputed window there yet (the caller falls back
+    to the all-time statistics).
+    """
+    window = get_settings().ZONE_TREND_WINDOW_MONTHS
+    if not window or month is None:
+        return None
+    levels = zone_hierarchy(zone_key)
+    rows = {
+        r.zone_key: r
+        for r in db.execute(
+            select(ZoneTrendWindow.zone_key, ZoneTrendWindow.median_delta_pct, ZoneTrendWindow.count)
+            .where(ZoneTrendWindow.zone_key.in_([key for _, key in levels]))
+            .where(ZoneTrendWindow.month == month, ZoneTrendWindow.window_months == window)
+            .where(ZoneTrendWindow.count > 0)
+        )
+    }
+    candidates = [(level, key, rows[key]) for level, key in levels if key in rows]
+    if not candidates:
+        return None
+    min_samples = get_settings().ZONE_MIN_SAMPLES
+    level, key, row = next(
+        (c for c in candidates if c[2].count >= min_samples),
+        max(candidates, key=lambda c: c[2].count),
+    )
+    return {**_zone_json(row.median_delta_pct, row.count, level, key),
+            "window_months": window, "month": month.strftime("%Y-%m")}
+
+
+def zone_series(db: Session, stats_key: str, last: date, months: int = 24) -> dict[str, list[dict[str, Any]]]:
+    """Rolling-window curves of a zone key up to `last`: {"3": [{month, median, p10, p90, count}], ...}."""
+    rows = db.execute(
+        select(ZoneTrendWindow.month, ZoneTrendWindow.window_months, ZoneTrendWindow.median_delta_pct,
+               ZoneTrendWindow.p10_delta_pct, ZoneTrendWindow.p90_delta_pct, ZoneTrendWindow.count)
+        .where(ZoneTrendWindow.zone_key == stats_key)
+        .where(ZoneTrendWindow.month.between(add_months(last, 1 - months), last))
+        .order_by(ZoneTrendWindow.month)
+    )
+    series: dict[str, list[dict[str, Any]]] = {}
+    for r in rows:
+        if not r.count:
+            continue
+        series.setdefault(str(r.window_months), []).append({
+            "month": r.month.strftime("%Y-%m"), "median": r.median_delta_pct,
+            "p10": r.p10_delta_pct, "p90": r.p90_delta_pct, "count": r.count,
+        })
+    return series
+
+
+def rebuild_zone_months(db: Session, zone_keys: list[str], chunk: int = 5000) -> int:
+    """Recompute the monthly sketches of these CAP zones from their TrendResults, one commit per zone.
+
+    The zone's zone_trend_stats row is locked first, as results are recorded (stats row,
+    then month row): concurrent results wait for the zone's rebuild.
+    """
+    n = 0
+    for zone_key in zone_keys:
+        _locked_stats(db, zone_key)
+        sketches: dict[date, KLLSketch] = {}
+        rows = db.execute(
+            _in_zone(select(ExtractedBill.period_end, TrendResult.eur_per_kwh_delta_pct), zone_key)
+            .join(UploadedDocument, (UploadedDocument.session_id == TrendResult.session_id)
+                  & (UploadedDocument.doc_type == "recent"))
+            .join(ExtractedBill, ExtractedBill.doc_id == UploadedDocument.id)
+            .where(ExtractedBill.period_end.isnot(None))
+            .execution_options(yield_per=chunk)
+        )
+        for period_end, delta in rows:
+            sketches.setdefault(month_of(period_end), KLLSketch()).update(delta)
+        db.execute(delete(ZoneTrendMonthly).where(ZoneTrendMonthly.zone_key == zone_key))
+        for month, sketch in sketches.items():
+            db.add(ZoneTrendMonthly(zone_key=zone_key, month=month, count=sketch.n, sketch_json=sketch.to_dict()))
+        db.commit()
+        n += 1
+        logger.info("Zone %s months rebuilt: %d months", zone_key, len(sketches))
+    return n
+
+
+def refresh_zone_windows(db: Session, full: bool = False, windows: tuple[int, ...] = WINDOWS) -> int:
+    """Recompute the windows touched by monthly rows written since the last refresh.
+
+    For every dirty CAP, its prefix and region are dirty too; each dirty key is
+    recomputed from its earliest dirty month up to the current month (the last
+    `max(windows) - 1` months before it are read for the first windows). Returns the
+    number of window rows written. Every transaction holds the job's advisory lock, so
+    concurrent runs never create the same window row.
+    """
+    started = datetime.now(timezone.utc)
+    _refresh_lock(db, "refresh_zone_windows")
+    dirty_q = select(ZoneTrendMonthly.zone_key, func.min(ZoneTrendMonthly.month)).group_by(ZoneTrendMonthly.zone_key)
+    last_run = None if full else db.scalar(select(func.max(ZoneTrendWindow.computed_at)))
+    if last_run is not None:
+        dirty_q = dirty_q.where(ZoneTrendMonthly.updated_at >= last_run - REFRESH_OVERLAP)
+    dirty: dict[tuple[str, str], date] = {}
+    for cap, first in db.execute(dirty_q):
+        for level, key in zone_hierarchy(cap):
+            dirty[(level, key)] = min(first, dirty.get((level, key), first))
+    if full:  # finestre di zone o mesi che non hanno più risultati
+        stale = db.execute(select(ZoneTrendWindow.zone_key).distinct()).scalars()
+        db.execute(delete(ZoneTrendWindow).where(
+            ZoneTrendWindow.zone_key.in_([k for k in stale if k not in {key for _, key in dirty}])))
+        for (_, key), first in dirty.items():
+            db.execute(delete(ZoneTrendWindow).where(ZoneTrendWindow.zone_key == key, ZoneTrendWindow.month < first))
+        db.commit()
+    if not dirty:
+        return 0
+
+    children: dict[tuple[str, str], list[str]] = defaultdict(list)
+    for cap in db.execute(select(ZoneTrendMonthly.zone_key).distinct()).scalars():
+        for level_key in zone_hierarchy(cap):
+            if level_key in dirty:
+                children[level_key].append(cap)
+
+    current = month_of(started)
+    span = max(windows)
+    written = 0
+    for (level, key), first in sorted(dirty.items()):
+        _refresh_lock(db, "refresh_zone_windows")  # ripreso dopo ogni commit, prima di leggere le righe esistenti
+        per_month: dict[date, KLLSketch] = {}
+        for month, sketch_json in db.execute(
+            select(ZoneTrendMonthly.month, ZoneTrendMonthly.sketch_json)
+            .where(ZoneTrendMonthly.zone_key.in_(children[(level, key)]))
+            .where(ZoneTrendMonthly.month >= add_months(first, 1 - span))
+        ):
+            per_month.setdefault(month, KLLSketch()).merge(KLLSketch.from_dict(sketch_json))
+        months = _months(first, max(current, max(per_month, default=first)))
+        existing = {
+            (r.month, r.window_months): r
+            for r in db.execute(
+                select(ZoneTrendWindow).where(ZoneTrendWindow.zone_key == key, ZoneTrendWindow.month >= first)
+            ).scalars()
+        }
+        for month in months:
+            for w in windows:
+                sketch = KLLSketch()
+                for m in _months(add_months(month, 1 - w), month):
+                    if m in per_month:
+                        sketch.merge(per_month[m])
+                row = existing.get((month, w))
+                if row is None:
+                    if not sketch.n:
+                        continue
+                    row = ZoneTrendWindow(zone_key=key, month=month, window_months=w, level=level)
+                    db.add(row)
+                row.count = sketch.n
+                row.p10_delta_pct, row.median_delta_pct, row.p90_delta_pct = sketch.quantiles(QUANTILES)
+                row.computed_at = started
+                written += 1
+        db.commit()
+    logger.info("Zone windows refreshed: %d keys, %d rows", len(dirty), written)
+    return written
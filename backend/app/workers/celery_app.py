@@ -1,7 +1,13 @@
 """Celery app for Bollettometro 2030."""
 from __future__ import annotations
 
+import os
+from typing import Any
+
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
+from kombu import Queue
+
 from app.core.config import get_settings
 
 settings = get_settings()
@@ -20,4 +26,53 @@ app.conf.update(
     enable_utc=True,
     task_track_started=True,
     task_time_limit=300,
+    # Queues by resource profile (launch matrix: app/workers/launch.py):
+    #   cpu         - OCR, PDF parsing, trend math (prefork, ~1 child per free core)
+    #   llm         - waits on OpenAI (threads pool, high concurrency)
+    #   maintenance - TTL cleanup and other periodic jobs
+    task_queues=(Queue("cpu"), Queue("llm"), Queue("maintenance")),
+    task_default_queue="cpu",
+    task_routes={
+        "extract_document": {"queue": "llm"},
+        "compute_trend": {"queue": "cpu"},
+        "mark_session_error": {"queue": "cpu"},
+        "analyze_session": {"queue": "cpu"},
+        "analyze_submission": {"queue": "cpu"},
+        "ttl_cleanup": {"queue": "maintenance"},
+        "refresh_zone_rollups": {"queue": "maintenance"},
+    },
+    # Periodic jobs: beat runs embedded in the (single) maintenance worker, see launch.py
+    beat_schedule={
+        "refresh-zone-rollups": {
+            "task": "refresh_zone_rollups",
+            "schedule": float(settings.ZONE_ROLLUP_INTERVAL_SECONDS),
+        },
+    },
+    # Long tasks: one message reserved at a time, acked only when done (stages are
+    # idempotent, so a redelivery after a crashed worker is safe)
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
 )
+
+
+@worker_init.connect
+def _start_metrics_server(**_: Any) -> None:
+    """Prometheus /metrics for this worker (stage histograms; see app/core/instrumentation.py)."""
+    port = get_settings().WORKER_METRICS_PORT
+    if port:
+        from app.core.instrumentation import serve_metrics
+
+        serve_metrics(port)
+
+
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid: int | None = None, **_: Any) -> None:
+    # prefork: drop the exited child's live gauges from the multiprocess directory
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from app.core.instrumentation import prometheus_client
+
+        if prometheus_client is not None:
+            from prometheus_client import multiprocess
+
+            multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,137 @@
+"""Per-process DB engine and scoped sessions for Celery workers.
+
+Prefork children each run one task at a time, so every child gets its own small
+pool (WORKER_DB_POOL_SIZE, default 1) created on `worker_process_init`: total
+connections = concurrency x (pool size + overflow), opened once per child instead
+of a new pool per task. With the threads/gevent pools (no child processes) the engine
+is created lazily and sized to the worker concurrency.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any
+
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+from app.core import metrics
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_engine: Engine | None = None
+WorkerSession = scoped_session(sessionmaker(autocommit=False, autoflush=False))
+# Concurrency of a non-prefork worker (threads/gevent), set on worker_init
+_threaded_concurrency: int | None = None
+
+
+def _default_pool_size() -> int:
+    if _threaded_concurrency:
+        return _threaded_concurrency
+    from app.workers.celery_app import app
+
+    if app.conf.worker_pool in ("threads", "gevent", "eventlet"):
+        return app.conf.worker_concurrency or os.cpu_count() or 1
+    return 1
+
+
+def _attach_pool_stats(engine: Engine) -> None:
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_conn: Any, record: Any) -> None:
+        metrics.incr("db_pool_connects")
+        logger.info("DB pool opened a new connection (pid %s): %s", os.getpid(), engine.pool.status())
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_conn: Any, record: Any, proxy: Any) -> None:
+        metrics.incr("db_pool_checkouts")
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_conn: Any, record: Any) -> None:
+        metrics.incr("db_pool_checkins")
+
+
+def init_worker_engine(pool_size: int | None = None) -> Engine:
+    """(Re)create this process' engine and bind the scoped session factory to it."""
+    global _engine
+    settings = get_settings()
+    size = pool_size or settings.WORKER_DB_POOL_SIZE or _default_pool_size()
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+        kwargs: dict[str, Any] = {"pool_pre_ping": True, "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS}
+        if not settings.DATABASE_URL.startswith("sqlite"):
+            kwargs.update(pool_size=size, max_overflow=settings.WORKER_DB_MAX_OVERFLOW)
+        _engine = create_engine(settings.DATABASE_URL, **kwargs)
+        _attach_pool_stats(_engine)
+        WorkerSession.remove()
+        WorkerSession.configure(bind=_engine)
+        logger.info("Worker DB engine ready (pid %s, pool_size=%s)", os.getpid(), size)
+        return _engine
+
+
+def get_worker_engine() -> Engine:
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                return init_worker_engine()
+    return _engine
+
+
+def get_worker_session() -> Session:
+    """Session for the current task (thread-local). Close with `close_worker_session`."""
+    get_worker_engine()
+    return WorkerSession()
+
+
+def close_worker_session() -> None:
+    WorkerSession.remove()
+    if _engine is not None:
+        logger.debug("DB pool after task (pid %s): %s", os.getpid(), _engine.pool.status())
+
+
+def _forget_engine_after_fork() -> None:
+    # Inherited connections belong to the parent: closing them here would close the
+    # parent's sockets, so just drop them and start a fresh pool in the child.
+    global _engine
+    if _engine is not None:
+        _engine.dispose(close=False)
+        _engine = None
+    WorkerSession.registry.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_engine_after_fork)
+
+
+@worker_init.connect
+def _on_worker_init(sender: Any = None, **_: Any) -> None:
+    global _threaded_concurrency
+    pool_cls = getattr(sender, "pool_cls", None)
+    pool_name = getattr(pool_cls, "__module__", str(pool_cls or ""))
+    if pool_name and "prefork" not in pool_name and getattr(sender, "concurrency", None):
+        _threaded_concurrency = int(sender.concurrency)
+
+
+@worker_process_init.connect
+def _on_worker_process_init(**_: Any) -> None:
+    init_worker_engine()
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**_: Any) -> None:
+    global _engine
+    WorkerSession.remove()
+    if _engine is not None:
+        logger.info(
+            "Worker DB pool stats (pid %s): connects=%d checkouts=%d",
+            os.getpid(),
+            metrics.get_counter("db_pool_connects"),
+            metrics.get_counter("db_pool_checkouts"),
+        )
+        _engine.dispose()
+        _engine = None
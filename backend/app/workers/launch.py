@@ -0,0 +1,92 @@
+"""Celery worker launch matrix: one worker per queue profile.
+
+    python -m app.workers.launch cpu            # OCR / PDF parsing / trend
+    python -m app.workers.launch llm            # OpenAI-bound extraction
+    python -m app.workers.launch maintenance    # TTL cleanup, periodic jobs
+    python -m app.workers.launch all            # single worker, small deployments
+    python -m app.workers.launch cpu --print    # show the celery command only
+
+| profile     | queues              | pool    | concurrency                               |
+|-------------|---------------------|---------|-------------------------------------------|
+| cpu         | cpu                 | prefork | cores // OCR_MAX_CONCURRENT_TESSERACT     |
+| llm         | llm                 | threads | WORKER_LLM_CONCURRENCY (32)               |
+| maintenance | maintenance         | solo    | 1, with embedded beat (periodic jobs)     |
+| all         | cpu,llm,maintenance | threads | WORKER_LLM_CONCURRENCY, with embedded beat |
+
+A cpu child can run up to OCR_MAX_CONCURRENT_TESSERACT tesseract processes (single
+threaded each), so the child count is sized to keep the total within the cores the
+container can use. llm tasks spend their time waiting on the network: threads are
+cheap and each thread gets one DB connection from the process pool (see db.py).
+Extra arguments are passed through to `celery worker`.
+
+With WORKER_METRICS_PORT set, the cpu profile gets a fresh PROMETHEUS_MULTIPROC_DIR so
+the metrics recorded in the prefork children (stage histograms, app.core.metrics
+counters and gauges) are served by the parent. Without prometheus_client the cpu
+/metrics only shows the parent's own counters: nothing recorded inside the tasks.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shlex
+import shutil
+import sys
+import tempfile
+
+from app.core.config import get_settings
+
+PROFILES = ("cpu", "llm", "maintenance", "all")
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - non Linux
+        return os.cpu_count() or 1
+
+
+def worker_argv(profile: str, extra: list[str] | None = None) -> list[str]:
+    s = get_settings()
+    beat = ["--beat", "--schedule", os.path.join(tempfile.gettempdir(), "celerybeat-schedule")]
+    if profile == "cpu":
+        concurrency = s.WORKER_CPU_CONCURRENCY or max(1, available_cores() // max(1, s.OCR_MAX_CONCURRENT_TESSERACT))
+        opts = ["-Q", "cpu", "--pool", "prefork", "--concurrency", str(concurrency),
+                "--max-tasks-per-child", str(s.WORKER_CPU_MAX_TASKS_PER_CHILD)]
+    elif profile == "llm":
+        opts = ["-Q", "llm", "--pool", "threads", "--concurrency", str(s.WORKER_LLM_CONCURRENCY)]
+    elif profile == "maintenance":
+        # one maintenance worker per deployment: it also runs beat (schedule in celery_app)
+        opts = ["-Q", "maintenance", "--pool", "solo", *beat]
+    elif profile == "all":
+        opts = ["-Q", "cpu,llm,maintenance", "--pool", "threads", "--concurrency", str(s.WORKER_LLM_CONCURRENCY), *beat]
+    else:
+        raise ValueError(f"Unknown worker profile: {profile} (expected one of {', '.join(PROFILES)})")
+    return ["celery", "-A", "app.workers.celery_app", "worker", "-n", f"{profile}@%h", *opts, "-l", "info", *(extra or [])]
+
+
+def prepare_metrics_dir(profile: str) -> str | None:
+    """Empty multiprocess directory for prometheus_client (prefork profiles only)."""
+    if profile != "cpu" or not get_settings().WORKER_METRICS_PORT:
+        return None
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.path.join(tempfile.gettempdir(), f"prometheus-{profile}")
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("profile", choices=PROFILES)
+    ap.add_argument("--print", action="store_true", dest="print_only", help="print the command and exit")
+    args, extra = ap.parse_known_args(argv)
+    cmd = worker_argv(args.profile, extra)
+    if args.print_only:
+        print(shlex.join(cmd))
+        return
+    prepare_metrics_dir(args.profile)
+    os.execvp(cmd[0], cmd)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,15 +1,28 @@
-"""Celery tasks: analyze_session, TTL cleanup."""
+"""Celery tasks: staged analysis pipeline (extract -> trend), TTL cleanup."""
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
+import time
 import uuid
+from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
 
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker, Session
+from celery import chord, group
+from celery.result import AsyncResult
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
 
+from app.cache import content_key, get_extraction_cache
+from app.core import admission, metrics
 from app.core.config import get_settings
+from app.core.inflight import get_inflight_registry
+from app.core.instrumentation import collect_timings, span
+from app.core.progress import publish_progress, session_topic
 from app.db.base import Base
+from app.extraction.document import PdfDocument
 from app.db.models import (
     UserSession,
     UploadedDocument,
@@ -18,45 +31,90 @@ from app.db.models import (
     Passport,
 )
 from app.services.storage import read_file, file_exists
-from app.services.openai_extract import extract_from_text, extract_from_image_base64
+from app.services.openai_extract import EXTRACTOR_VERSION, extract_concurrently
 from app.services.extract_schema import ExtractionOutput, validate_extraction_payload
+from app.services.hybrid_extract import LocalExtraction, local_extraction, merge_llm_fields, record_outcome
 from app.services.trend_calc import compute_user_trend, compute_position
-from app.services.zone_aggregates import get_zone_trend_json, cap_to_zone_key
-from app.utils.pdf_tools import extract_text_from_pdf, extract_first_page_image
+from app.services.zone_aggregates import get_zone_trend_json, cap_to_zone_key, record_zone_trend, refresh_zone_rollups
+from app.services.zone_windows import get_zone_window_json, month_of, record_zone_month, refresh_zone_windows
 from app.utils.image_tools import image_bytes_to_base64, resize_if_large
 
 logger = logging.getLogger(__name__)
 
 from app.workers.celery_app import app
+from app.workers.db import close_worker_session, get_worker_session
 
 
-def _get_db() -> Session:
+def _extraction_request(data: bytes, mime: str) -> tuple[str, str] | None:
+    """Build the OpenAI request for one document: ("text", text) or ("image", b64)."""
+    if "pdf" in mime:
+        # one parse: text and (if needed) the first-page raster come from the same document
+        with span("pdf_parse"), PdfDocument(data) as pdf:
+            text = pdf.text(max_pages=5)
+            if not text.strip():
+                img_bytes = pdf.render_png(1, dpi=150)
+                if img_bytes:
+                    return "image", image_bytes_to_base64(resize_if_large(img_bytes))
+        return "text", text
+    if "image" in mime:
+        return "image", image_bytes_to_base64(resize_if_large(data))
+    return None
+
+
+def _extract_documents(docs: list[UploadedDocument]) -> list[dict | None]:
+    """Extract documents to raw dicts (for ExtractedBill.raw_json), in input order.
+
+    Results are cached by content hash: re-analysis and duplicate uploads skip OpenAI.
+    With HYBRID_EXTRACTION text bills go through the local parsers first and OpenAI is
+    asked only for the fields they could not read with enough confidence.
+    Uncached documents are sent to OpenAI concurrently on the shared async client.
+    """
     settings = get_settings()
-    engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
-    sm = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    return sm()
+    cache = get_extraction_cache()
+    version = f"{EXTRACTOR_VERSION}:{settings.OPENAI_MODEL}"
+    if settings.HYBRID_EXTRACTION:
+        version += f":hybrid-{settings.HYBRID_CONFIDENCE_THRESHOLD}"
+    results: list[dict | None] = [None] * len(docs)
+    keys: list[str] = []
+    local: dict[int, LocalExtraction] = {}
+    pending: list[tuple[int, tuple]] = []
+    for i, doc in enumerate(docs):
+        data = read_file(doc.file_path)
+        key = content_key(data, "openai", version)
+        keys.append(key)
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info("Extraction cache hit for doc %s", doc.id)
+            results[i] = cached
+            continue
+        request = _extraction_request(data, (doc.mime_type or "").lower())
+        if request is None:
+            continue
+        if settings.HYBRID_EXTRACTION and request[0] == "text":
+            with span("parse_fields"):
+                loc = local_extraction(request[1])
+            record_outcome(loc)
+            if loc.complete:
+                cache.set(key, loc.raw)
+                results[i] = loc.raw
+                continue
+            local[i] = loc
+            request = ("text", request[1], loc.missing)
+        pending.append((i, request))
+
+    responses = extract_concurrently([request for _, request in pending])
+    for (i, _), (out, err) in zip(pending, responses):
+        if out and not err:
+            if i in local:
+                out = merge_llm_fields(local[i], out, local[i].missing)
+            cache.set(keys[i], out)
+            results[i] = out
+    return results
 
 
 def _extract_one(doc: UploadedDocument) -> dict | None:
     """Extract one document to raw dict (for ExtractedBill.raw_json)."""
-    data = read_file(doc.file_path)
-    mime = (doc.mime_type or "").lower()
-    text = ""
-    if "pdf" in mime:
-        text = extract_text_from_pdf(data)
-        if not text.strip():
-            img_bytes = extract_first_page_image(data)
-            if img_bytes:
-                b64 = image_bytes_to_base64(resize_if_large(img_bytes))
-                out, err = extract_from_image_base64(b64)
-                return out
-        out, err = extract_from_text(text)
-        return out if not err else None
-    if "image" in mime:
-        b64 = image_bytes_to_base64(resize_if_large(data))
-        out, err = extract_from_image_base64(b64)
-        return out if not err else None
-    return None
+    return _extract_documents([doc])[0]
 
 
 def _bill_dict_to_orm(raw: dict, session_id: uuid.UUID, doc_id: uuid.UUID) -> dict:
@@ -89,70 +147,325 @@ def _bill_dict_to_orm(raw: dict, session_id: uuid.UUID, doc_id: uuid.UUID) -> di
     return d
 
 
-@app.task(bind=True, name="analyze_session")
-def analyze_session(self, session_id: str):
-    """Load docs, extract with OpenAI, compute trend, store result, mark VERIFIED."""
+class ExtractionFailed(Exception):
+    """No usable extraction for a document; the extract stage is retried."""
+
+
+@app.task(
+    bind=True,
+    name="extract_document",
+    autoretry_for=(ExtractionFailed, OperationalError),
+    retry_backoff=5,
+    retry_backoff_max=60,
+    max_retries=2,
+)
+def extract_document(self, doc_id: str, enqueued_at: float | None = None) -> str | dict:
+    """Stage 1 (I/O bound, one per document): extract and persist an ExtractedBill.
+
+    Idempotent: if the document already has an ExtractedBill the stage is a no-op,
+    so retries and re-runs never call the extractor twice for the same document. Two
+    runs racing on the same document (redelivery) both extract, but only one bill is
+    stored (unique doc_id): the loser is treated as already done.
+    Returns {"doc_id", "doc_type", "timings"} (stage timings, collected by compute_trend),
+    or just the id when there was nothing to do.
+    """
+    if not self.request.retries:
+        admission.record_queue_wait(enqueued_at, "extract")
+    did = uuid.UUID(doc_id)
+    db = get_worker_session()
+    try:
+        if db.execute(select(ExtractedBill.id).where(ExtractedBill.doc_id == did)).first():
+            return doc_id
+        doc = db.get(UploadedDocument, did)
+        if doc is None:
+            raise ValueError(f"Document not found: {doc_id}")
+        topic = session_topic(doc.session_id)
+        publish_progress(topic, "extracting", doc=doc.doc_type)
+        with collect_timings() as timings:
+            raw = _extract_one(doc)
+            row = _bill_dict_to_orm(raw, doc.session_id, doc.id) if raw else {}
+            if not row:
+                raise ExtractionFailed(f"No usable extraction for document {doc_id}")
+            with span("db_write"):
+                db.add(ExtractedBill(**row))
+                try:
+                    db.commit()
+                except IntegrityError:  # un'altra esecuzione ha già salvato il bill del documento
+                    db.rollback()
+                    return doc_id
+        publish_progress(topic, "extracted", doc=doc.doc_type)
+        return {"doc_id": doc_id, "doc_type": doc.doc_type, "timings": timings.as_dict()}
+    finally:
+        close_worker_session()
+
+
+@app.task(
+    bind=True,
+    name="compute_trend",
+    autoretry_for=(OperationalError,),
+    retry_backoff=2,
+    max_retries=3,
+)
+def compute_trend(self, extracted: list[str | dict], session_id: str, fingerprint: str | None = None) -> str | None:
+    """Stage 2 (CPU, chord body): trend + zone position from the persisted bills, mark VERIFIED.
+
+    Reads the bills from the DB (the chord results only carry the extract stage timings)
+    and is a no-op if the session already has a TrendResult for the same inputs. A result
+    computed from other inputs is replaced in place, in the same commit as the new values:
+    until then (or if this run fails) the previous result stays readable. Releases the
+    session's in-flight lock when done.
+    """
     sid = uuid.UUID(session_id)
-    db = _get_db()
+    extract_timings = {r["doc_type"]: r["timings"] for r in extracted or [] if isinstance(r, dict)}
+    position = _compute_trend(sid, session_id, extract_timings, fingerprint, self.request.id)
+    _finish_inflight(session_id, self.request.id)
+    return position
+
+
+def _compute_trend(sid: uuid.UUID, session_id: str, extract_timings: dict | None = None,
+                   fingerprint: str | None = None, job_id: str | None = None) -> str | None:
+    db = get_worker_session()
     try:
         session = db.get(UserSession, sid)
         if not session:
             logger.error("Session not found: %s", session_id)
-            return
-        docs = list(db.execute(select(UploadedDocument).where(UploadedDocument.session_id == sid).order_by(UploadedDocument.doc_type)).scalars().all())
-        docs = [d[0] for d in docs]
-        if len(docs) < 2:
-            session.status = "error"
+            return None
+        topic = session_topic(sid)
+        existing = db.execute(select(TrendResult).where(TrendResult.session_id == sid)).scalars().first()
+        if existing is not None and (fingerprint is None or existing.fingerprint == fingerprint):
+            session.status = "verified"
             db.commit()
-            return
-        recent_doc = next((d for d in docs if d.doc_type == "recent"), None)
-        old_doc = next((d for d in docs if d.doc_type == "old"), None)
-        if not recent_doc or not old_doc:
+            publish_progress(topic, "verified")
+            return existing.position
+        publish_progress(topic, "computing_trend")
+
+        rows = db.execute(
+            select(UploadedDocument.doc_type, ExtractedBill.raw_json, ExtractedBill.period_end)
+            .join(ExtractedBill, ExtractedBill.doc_id == UploadedDocument.id)
+            .where(UploadedDocument.session_id == sid)
+        ).all()
+        raw_by_type = {doc_type: raw for doc_type, raw, _ in rows}
+        bill_month = month_of(next((end for doc_type, _, end in rows if doc_type == "recent"), None))
+        raw_recent, raw_old = raw_by_type.get("recent"), raw_by_type.get("old")
+        if not raw_recent or not raw_old:
+            if existing is None:  # un risultato precedente resta valido
+                session.status = "error"
+            db.commit()
+            publish_progress(topic, "error")
+            return None
+
+        with collect_timings() as timings:
+            with span("user_trend"):
+                user_trend = compute_user_trend(raw_recent, raw_old)
+            zone_key = session.zone_key or cap_to_zone_key(session.cap or "")
+            with span("zone_aggregate"):
+                zone_trend = get_zone_window_json(db, zone_key, bill_month) or get_zone_trend_json(db, zone_key)
+            position, explanation = compute_position(user_trend, zone_trend)
+        # the final write is only in the histogram: its duration is not known before the commit
+        with span("db_write"):
+            values = dict(
+                user_trend_json=user_trend,
+                zone_trend_json=zone_trend,
+                position=position,
+                explanation_short=explanation,
+                timings_json={"extract": extract_timings or {}, "trend": timings.as_dict()},
+                fingerprint=fingerprint,
+                job_id=job_id,
+            )
+            if existing is None:
+                db.add(TrendResult(session_id=sid, **values))
+                # the zone's stats row is locked until this commit (concurrent sessions of a zone queue
+                # here), then its bill-month row (same order everywhere)
+                record_zone_trend(db, session.zone_key, user_trend)
+                record_zone_month(db, session.zone_key, bill_month, user_trend)
+            else:
+                # re-analysis: the session is already in the zone sketches, which cannot drop its
+                # previous value; the next rebuild picks up the new one
+                for key, value in values.items():
+                    setattr(existing, key, value)
+            session.status = "verified"
+            db.commit()
+        publish_progress(topic, "verified")
+        logger.info("Session %s verified, position=%s", session_id, position)
+        return position
+    finally:
+        close_worker_session()
+
+
+@app.task(name="mark_session_error")
+def mark_session_error(session_id: str, job_id: str | None = None) -> None:
+    """Error callback of the pipeline: a stage failed after its retries.
+
+    A session that already has a result (failed re-analysis) stays verified on it.
+    """
+    logger.error("Analysis pipeline failed for session %s", session_id)
+    db = get_worker_session()
+    try:
+        session = db.get(UserSession, uuid.UUID(session_id))
+        has_result = db.execute(
+            select(TrendResult.id).where(TrendResult.session_id == uuid.UUID(session_id))
+        ).first() is not None
+        if session and not has_result:
             session.status = "error"
             db.commit()
-            return
+    finally:
+        close_worker_session()
+    publish_progress(session_topic(session_id), "error")
+    if job_id:
+        _finish_inflight(session_id, job_id)
 
-        raw_recent = _extract_one(recent_doc)
-        raw_old = _extract_one(old_doc)
-        if not raw_recent or not raw_old:
+
+def build_analysis_pipeline(session_id: str, doc_ids: list[str], job_id: str | None = None,
+                            fingerprint: str | None = None, priority: int | None = None):
+    """Chord: extract_document per document (parallel, llm queue) -> compute_trend (cpu queue)."""
+    options = {"priority": priority} if priority is not None else {}
+    enqueued_at = time.time()
+    header = group(extract_document.s(doc_id, enqueued_at=enqueued_at).set(**options) for doc_id in doc_ids)
+    body = compute_trend.s(session_id, fingerprint).set(**options)
+    if job_id:
+        body = body.set(task_id=job_id)
+    body = body.on_error(mark_session_error.si(session_id, job_id))
+    return chord(header, body)
+
+
+def start_analysis(session_id: str, doc_ids: list[str], job_id: str | None = None,
+                   fingerprint: str | None = None, priority: int | None = None) -> AsyncResult:
+    """Launch the staged pipeline; the returned result tracks the final (trend) stage."""
+    return build_analysis_pipeline(session_id, doc_ids, job_id, fingerprint, priority).apply_async()
+
+
+def analysis_fingerprint(session: UserSession, docs: list[UploadedDocument]) -> str:
+    """Hash of everything the result depends on: documents, zone, extractor version."""
+    settings = get_settings()
+    payload = {
+        "zone": session.zone_key or cap_to_zone_key(session.cap or ""),
+        "docs": sorted([d.doc_type, str(d.id), d.file_path] for d in docs),
+        "extractor": f"{EXTRACTOR_VERSION}:{settings.OPENAI_MODEL}",
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+@dataclass
+class AnalysisSubmission:
+    job_id: str
+    outcome: str  # started | coalesced (già in corso) | unchanged (già analizzata, stessi input)
+
+
+def submit_analysis(db: Session, session: UserSession, docs: list[UploadedDocument],
+                    source: str = "organic") -> AnalysisSubmission:
+    """Start the pipeline at most once per session and input set.
+
+    - same inputs already analysed (TrendResult with the same fingerprint): the job that computed it
+    - a pipeline already running for the session: its job_id (double clicks, client retries)
+    - otherwise claim the in-flight lock, pass admission control (may raise
+      AdmissionRejected) and launch with the source's priority. A TrendResult from other
+      inputs is kept until compute_trend replaces it; bills already extracted are reused
+      by the idempotent extract stage.
+    """
+    settings = get_settings()
+    registry = get_inflight_registry()
+    key = str(session.id)
+    docs = [d for d in docs if d.doc_type in ("recent", "old")]
+    fingerprint = analysis_fingerprint(session, docs)
+    trend = db.execute(
+        select(TrendResult.id, TrendResult.fingerprint, TrendResult.job_id).where(TrendResult.session_id == session.id)
+    ).first()
+    if trend is not None and trend.fingerprint == fingerprint:
+        metrics.incr("analysis_requests_total", outcome="unchanged")
+        return AnalysisSubmission(trend.job_id or str(trend.id), "unchanged")
+
+    job_id = str(uuid.uuid4())
+    current = registry.claim(key, job_id, settings.ANALYSIS_INFLIGHT_TTL_SECONDS)
+    if current is not None:
+        metrics.incr("analysis_requests_total", outcome="coalesced")
+        return AnalysisSubmission(current, "coalesced")
+    try:
+        admitted = admission.admit(job_id, source, session.ip_hash)
+    except admission.AdmissionRejected:
+        registry.release(key, job_id)
+        raise
+    try:
+        publish_progress(session_topic(session.id), "queued")
+        start_analysis(key, [str(d.id) for d in docs], job_id=job_id, fingerprint=fingerprint,
+                       priority=admitted.priority)
+    except Exception:
+        admission.release(job_id)
+        registry.release(key, job_id)
+        raise
+    metrics.incr("analysis_requests_total", outcome="started")
+    return AnalysisSubmission(job_id, "started")
+
+
+def _finish_inflight(session_id: str, job_id: str | None) -> None:
+    """Release the session lock and queue slot."""
+    if not job_id:
+        return
+    admission.release(job_id)
+    get_inflight_registry().release(session_id, job_id)
+
+
+@app.task(bind=True, name="analyze_session")
+def analyze_session(self, session_id: str) -> str | None:
+    """Entry point kept for existing callers: validate the session and launch the pipeline."""
+    sid = uuid.UUID(session_id)
+    db = get_worker_session()
+    try:
+        session = db.get(UserSession, sid)
+        if not session:
+            logger.error("Session not found: %s", session_id)
+            return None
+        docs = list(db.execute(select(UploadedDocument).where(UploadedDocument.session_id == sid)).scalars().all())
+        doc_types = {d.doc_type for d in docs}
+        if not {"recent", "old"} <= doc_types:
             session.status = "error"
             db.commit()
+            publish_progress(session_topic(sid), "error")
+            return None
+        try:
+            return submit_analysis(db, session, docs).job_id
+        except admission.AdmissionRejected as exc:
+            raise self.retry(countdown=exc.retry_after, exc=exc)
+    finally:
+        close_worker_session()
+
+
+@app.task(
+    bind=True,
+    name="analyze_submission",
+    autoretry_for=(OperationalError,),
+    retry_backoff=5,
+    max_retries=3,
+)
+def analyze_submission(self, submission_id: str) -> None:
+    """Legacy /submissions analysis (OCR + regex + rules), moved out of the API process.
+
+    Duplicate deliveries are dropped by the pending -> running claim on analysis_state.
+    """
+    from app.services.submissions import claim_analysis_run, run_analysis
+    from app.storage import get_storage
+
+    sid = uuid.UUID(submission_id)
+    redelivered = bool((self.request.delivery_info or {}).get("redelivered")) or self.request.retries > 0
+    db = get_worker_session()
+    try:
+        if not claim_analysis_run(db, sid, redelivered=redelivered):
+            logger.info("Submission %s already analysed or in progress, skipping", submission_id)
             return
+        run_analysis(db, sid, get_storage())
+    finally:
+        close_worker_session()
 
-        for doc, raw in [(recent_doc, raw_recent), (old_doc, raw_old)]:
-            row = _bill_dict_to_orm(raw, sid, doc.id)
-            if row:
-                eb = ExtractedBill(**row)
-                db.add(eb)
-        db.commit()
-
-        user_trend = compute_user_trend(raw_recent, raw_old)
-        zone_key = session.zone_key or cap_to_zone_key(session.cap or "")
-        zone_trend = get_zone_trend_json(db, zone_key)
-        position, explanation = compute_position(user_trend, zone_trend)
-
-        tr = TrendResult(
-            session_id=sid,
-            user_trend_json=user_trend,
-            zone_trend_json=zone_trend,
-            position=position,
-            explanation_short=explanation,
-        )
-        db.add(tr)
-        session.status = "verified"
-        db.commit()
-        logger.info("Session %s verified, position=%s", session_id, position)
-    except Exception as e:
-        logger.exception("analyze_session failed: %s", e)
-        try:
-            session = db.get(UserSession, sid)
-            if session:
-                session.status = "error"
-                db.commit()
-        except Exception:
-            pass
+
+@app.task(name="refresh_zone_rollups", autoretry_for=(OperationalError,), retry_backoff=30, max_retries=3)
+def refresh_zone_rollups_task() -> dict[str, int]:
+    """Periodic (beat): merge the CAP sketches into the prefix and region rollups and the dirty rolling windows."""
+    db = get_worker_session()
+    try:
+        counts = refresh_zone_rollups(db)
+        counts["windows"] = refresh_zone_windows(db)
+        return counts
     finally:
-        db.close()
+        close_worker_session()
 
 
 @app.task(name="ttl_cleanup")
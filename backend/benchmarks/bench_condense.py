@@ -0,0 +1,57 @@
+"""Token reduction and field-recall parity of the pre-LLM condenser vs. raw truncation.
+
+Usage (from backend/):  python -m benchmarks.bench_condense [--docs 300] [--max-tokens 3000 200]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from app.extraction.condense import condense_text, count_tokens
+from app.extraction.parsers import parse_fields_from_text
+from benchmarks.corpus import make_bill_text
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--docs", type=int, default=300)
+    ap.add_argument("--max-tokens", type=int, nargs="+", default=[3000, 200])
+    args = ap.parse_args()
+
+    rng = random.Random(2031)
+    corpus = []
+    for _ in range(args.docs):
+        pages = rng.randint(2, 12)
+        # the amounts summary is often not on page 1 (after notices and meter readings)
+        corpus.append(make_bill_text(rng, pages=pages, summary_page=rng.randint(1, pages)))
+    reference = [parse_fields_from_text(t) for t in corpus]
+    original = sum(count_tokens(t) for t in corpus)
+    n = len(corpus)
+    print(f"docs={n} original_tokens={original} ({original / n:.0f}/doc)")
+
+    for budget in args.max_tokens:
+        t0 = time.perf_counter()
+        condensed = [condense_text(t, budget) for t in corpus]
+        elapsed = time.perf_counter() - t0
+        sent = sum(c.tokens for c in condensed)
+        fields = sum(len(r) for r in reference)
+        recalled = sum(
+            sum(1 for k, v in ref.items() if parse_fields_from_text(c.text).get(k) == v)
+            for ref, c in zip(reference, condensed)
+        )
+        truncated = [t[: int(budget * 3.5)] for t in corpus]
+        trunc_recalled = sum(
+            sum(1 for k, v in ref.items() if parse_fields_from_text(t).get(k) == v)
+            for ref, t in zip(reference, truncated)
+        )
+        over = sum(c.tokens > budget for c in condensed)
+        print(
+            f"budget={budget:5d}  sent={sent / n:6.0f} tok/doc  reduction={1 - sent / original:6.1%}  "
+            f"recall={recalled / fields:6.1%} (truncation {trunc_recalled / fields:6.1%})  "
+            f"over_budget={over}  {elapsed * 1e6 / n:7.1f} us/doc"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Micro-benchmark: single-pass FieldScanner vs. legacy per-label regex search.
+
+Usage (from backend/):  python -m benchmarks.bench_parsers [--docs 500] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from app.extraction.parsers import parse_fields_from_text, parse_fields_from_text_legacy
+from benchmarks.corpus import make_text_corpus
+
+
+def _time(fn, corpus: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for text in corpus:
+            fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--docs", type=int, default=500)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    corpus = make_text_corpus(args.docs)
+    mismatches = sum(parse_fields_from_text(t) != parse_fields_from_text_legacy(t) for t in corpus)
+    legacy = _time(parse_fields_from_text_legacy, corpus, args.repeat)
+    scanner = _time(parse_fields_from_text, corpus, args.repeat)
+    n = len(corpus)
+    print(f"docs={n} mismatches={mismatches}")
+    print(f"legacy   {legacy * 1e6 / n:8.1f} us/doc  {n / legacy:8.0f} docs/s")
+    print(f"scanner  {scanner * 1e6 / n:8.1f} us/doc  {n / scanner:8.0f} docs/s  speedup x{legacy / scanner:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""End-to-end pipeline benchmarks on a synthetic bill corpus, with JSON baselines.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pipeline                       # run, compare with the baseline
+    python -m benchmarks.bench_pipeline --update-baseline     # record a new baseline
+    python -m benchmarks.bench_pipeline --only parse_fields run_rules --docs 50
+
+Cases: _extract_text on text PDFs, scanned PDFs and JPEG photos (the last two need
+tesseract; skipped otherwise), parse_fields_from_text, run_rules, compute_user_trend,
+the whole extract + rules flow, generate_passport_pdf and generate_share_card.
+Reports p50/p95 latency, throughput and peak RSS per case. Exits 1 when a case is
+slower (p95) or larger (RSS) than the baseline beyond the tolerances: baselines are
+machine-specific, record them on the machine that runs the comparison (CI runner).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.documents import make_document_corpus
+from benchmarks.harness import Case, compare, load_baseline, run_case, save_baseline
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "pipeline.json"
+
+
+def _texts(n: int) -> list[str]:
+    from app.extraction.pipeline import _extract_text
+
+    return [_extract_text(d.mime, d.data)[0] for d in make_document_corpus(n, shapes=("text_pdf",))]
+
+
+def _field_pairs(n: int) -> list[dict]:
+    from app.extraction.parsers import parse_fields_from_text
+
+    fields = [parse_fields_from_text(t) for t in _texts(n + 1)]
+    return [{"latest": a, "older": b} for a, b in zip(fields, fields[1:])]
+
+
+def _raw_pairs(n: int) -> list[tuple[dict, dict]]:
+    from app.services.hybrid_extract import local_extraction
+
+    raws = [local_extraction(t).raw for t in _texts(n + 1)]
+    return list(zip(raws, raws[1:]))
+
+
+def _doc_pairs(n: int) -> list[list[dict]]:
+    docs = make_document_corpus(n + 1, shapes=("text_pdf",))
+    return [[{"kind": "latest", "mime": a.mime, "bytes": a.data}, {"kind": "older", "mime": b.mime, "bytes": b.data}]
+            for a, b in zip(docs, docs[1:])]
+
+
+def _pipeline(docs: list[dict]) -> None:
+    from app.extraction.pipeline import extract_fields_from_documents
+    from app.rules.engine import run_rules
+
+    fields, _ = extract_fields_from_documents(docs)
+    run_rules(fields)
+
+
+def build_cases(n: int) -> list[Case]:
+    from app.extraction.parsers import parse_fields_from_text
+    from app.extraction.pipeline import _extract_text
+    from app.rules.engine import run_rules
+    from app.services.passport_generator import generate_passport_pdf
+    from app.services.share_card_generator import generate_share_card
+    from app.services.trend_calc import compute_user_trend
+
+    no_ocr = None if shutil.which("tesseract") else "tesseract not installed"
+    rng = random.Random(7)
+    sessions = [(f"bench-{i}", f"tok{rng.getrandbits(64):x}") for i in range(n)]
+    return [
+        Case("extract_text[text_pdf]", lambda: make_document_corpus(n, shapes=("text_pdf",)),
+             lambda d: _extract_text(d.mime, d.data)),
+        Case("extract_text[scanned_pdf]", lambda: make_document_corpus(n, shapes=("scanned_pdf",)),
+             lambda d: _extract_text(d.mime, d.data), skip_reason=no_ocr),
+        Case("extract_text[photo_jpeg]", lambda: make_document_corpus(n, shapes=("photo_jpeg",)),
+             lambda d: _extract_text(d.mime, d.data), skip_reason=no_ocr),
+        Case("parse_fields", lambda: _texts(n), parse_fields_from_text),
+        Case("run_rules", lambda: _field_pairs(n), run_rules),
+        Case("compute_user_trend", lambda: _raw_pairs(n), lambda pair: compute_user_trend(*pair)),
+        Case("pipeline[text_pdf]", lambda: _doc_pairs(n), _pipeline),
+        Case("generate_passport_pdf", lambda: sessions,
+             lambda s: generate_passport_pdf(s[0], "Milano 20121", "yellow", s[1])),
+        Case("generate_share_card", lambda: sessions, lambda s: generate_share_card(*s)),
+    ]
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=10, help="inputs per case")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", nargs="+", help="case names (prefix match)")
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--latency-tolerance", type=float, default=0.5, help="allowed p95 increase (0.5 = +50%%)")
+    ap.add_argument("--rss-tolerance", type=float, default=0.25, help="allowed peak RSS increase")
+    ap.add_argument("--json", type=Path, help="also write the results here")
+    args = ap.parse_args(argv)
+
+    # niente cache né servizi esterni; i file generati finiscono in una directory temporanea
+    storage = tempfile.mkdtemp(prefix="bench-storage-")
+    os.environ.update(EXTRACTION_CACHE_BACKEND="none", LOCAL_STORAGE_PATH=storage, STORAGE_BACKEND="local")
+    from app.core.config import get_settings
+
+    get_settings.cache_clear()
+
+    results: dict[str, dict] = {}
+    try:
+        for case in build_cases(args.docs):
+            if args.only and not any(case.name.startswith(p) for p in args.only):
+                continue
+            r = results[case.name] = run_case(case, repeat=args.repeat)
+            if "skipped" in r:
+                print(f"{case.name:28s} skipped ({r['skipped']})")
+            else:
+                print(f"{case.name:28s} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+                      f"{r['throughput_per_s']:9.1f}/s  rss {r['peak_rss_mb']:7.1f} MB")
+    finally:
+        shutil.rmtree(storage, ignore_errors=True)
+
+    params = {"docs": args.docs, "repeat": args.repeat}
+    if args.json:
+        args.json.write_text(json.dumps({"params": params, "cases": results}, indent=2) + "\n")
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        save_baseline(args.baseline, results, params)
+        print(f"baseline written: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"no baseline at {args.baseline} (run with --update-baseline)")
+        return 0
+    if baseline.get("params") != params:
+        print(f"warning: baseline recorded with {baseline.get('params')}, this run {params}")
+    failures = compare(results, baseline, args.latency_tolerance, args.rss_tolerance)
+    for line in failures:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Zone trend lookup latency vs. zone size: incremental sketch (zone_trend_stats) vs. full scan.
+
+Usage (from backend/):
+    python -m benchmarks.bench_zone_stats                         # 1k .. 1M results per zone
+    python -m benchmarks.bench_zone_stats --sizes 1000 1000000 --scan-max 0
+
+For each zone size a fresh SQLite database gets a zone_trend_stats row whose sketch
+holds that many results; `read` is get_zone_trend_json, `update` is record_zone_trend
+(+ rollback, so the size stays put). Up to --scan-max results are also written to
+trend_results and timed with the exact query (exact_zone_trend_json) for comparison.
+Exits 1 when read or update p95 at the largest size exceeds the smallest size's p95
+beyond --tolerance: the sketch path must stay flat.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from benchmarks.harness import percentile
+
+ZONE = "20121"
+
+
+def _timed(fn, repeat: int) -> dict[str, float]:
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return {"p50_ms": round(percentile(latencies, 0.5) * 1000, 3), "p95_ms": round(percentile(latencies, 0.95) * 1000, 3)}
+
+
+def _populate(db, size: int, scan_rows: int, rng: random.Random) -> None:
+    from sqlalchemy import insert
+
+    from app.db.models import TrendResult, UserSession, ZoneTrendStats
+    from app.services.zone_aggregates import _store
+    from app.utils.quantile_sketch import KLLSketch
+
+    sketch = KLLSketch()
+    stats = ZoneTrendStats(zone_key=ZONE)
+    chunk = 10_000
+    for start in range(0, size, chunk):
+        deltas = [rng.gauss(5, 8) for _ in range(min(chunk, size - start))]
+        sketch.extend(deltas)
+        if start < scan_rows:
+            deltas = deltas[: scan_rows - start]
+            ids = [uuid.uuid4() for _ in deltas]
+            db.execute(insert(UserSession), [{"id": i, "status": "verified", "zone_key": ZONE} for i in ids])
+            db.execute(insert(TrendResult), [
+                {"id": uuid.uuid4(), "session_id": i, "user_trend_json": {"eur_per_kwh_delta_pct": d},
+                 "zone_trend_json": {}, "position": "green", "explanation_short": ""}
+                for i, d in zip(ids, deltas)
+            ])
+    _store(stats, sketch)
+    db.add(stats)
+    db.commit()
+
+
+def run_size(size: int, scan_max: int, repeat: int, workdir: Path) -> dict[str, dict[str, float]]:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app.db.base import Base
+    from app.services.zone_aggregates import exact_zone_trend_json, get_zone_trend_json, record_zone_trend
+
+    engine = create_engine(f"sqlite:///{workdir / f'zones-{size}.db'}")
+    Base.metadata.create_all(engine)
+    scan_rows = size if size <= scan_max else 0
+    out: dict[str, dict[str, float]] = {}
+    with Session(engine) as db:
+        _populate(db, size, scan_rows, random.Random(size))
+        trend = {"eur_per_kwh_delta_pct": 3.5}
+
+        def update() -> None:
+            record_zone_trend(db, ZONE, trend)
+            db.flush()
+            db.rollback()
+
+        out["read"] = _timed(lambda: get_zone_trend_json(db, ZONE), repeat)
+        out["update"] = _timed(update, repeat)
+        if scan_rows:
+            out["scan"] = _timed(lambda: exact_zone_trend_json(db, ZONE), max(3, repeat // 50))
+    engine.dispose()
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    ap.add_argument("--scan-max", type=int, default=100_000, help="largest zone also timed with the full scan")
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--tolerance", type=float, default=1.0, help="allowed p95 growth smallest -> largest size")
+    ap.add_argument("--min-delta-ms", type=float, default=2.0, help="absolute p95 growth always accepted")
+    args = ap.parse_args(argv)
+
+    results: dict[int, dict[str, dict[str, float]]] = {}
+    with tempfile.TemporaryDirectory(prefix="bench-zones-") as tmp:
+        for size in sorted(args.sizes):
+            r = results[size] = run_size(size, args.scan_max, args.repeat, Path(tmp))
+            line = "  ".join(f"{name} p50 {v['p50_ms']:8.3f} p95 {v['p95_ms']:8.3f} ms" for name, v in r.items())
+            print(f"{size:>9,d} results/zone  {line}")
+
+    sizes = sorted(results)
+    failures = []
+    for name in ("read", "update"):
+        base, last = results[sizes[0]][name]["p95_ms"], results[sizes[-1]][name]["p95_ms"]
+        limit = max(base * (1 + args.tolerance), base + args.min_delta_ms)
+        if last > limit:
+            failures.append(f"{name}: p95 {last} ms at {sizes[-1]:,d} > {limit:.3f} ms (p95 {base} ms at {sizes[0]:,d})")
+    for line in failures:
+        print(f"NOT FLAT {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Synthetic bill documents for end-to-end benchmarks (deterministic, seed-based).
+
+Three shapes, as users upload them:
+- text PDF: native text layer (reportlab), the common case from supplier portals;
+- scanned PDF: the same page rasterized with light noise, no text layer (needs OCR);
+- photo: JPEG of the page, slightly rotated, with noise and uneven lighting.
+"""
+from __future__ import annotations
+
+import io
+import random
+from dataclasses import dataclass
+
+from benchmarks.corpus import make_bill_text
+
+PAGE_PX = (1240, 1754)  # A4 a 150 dpi
+
+
+@dataclass
+class BenchDocument:
+    shape: str  # text_pdf | scanned_pdf | photo_jpeg
+    mime: str
+    data: bytes
+    text: str
+
+
+def split_pages(text: str) -> list[str]:
+    """Bill text per page: each page opens with the supplier line + "BOLLETTA N. ... - Pagina k"."""
+    lines = text.splitlines()
+    pages: list[list[str]] = [[]]
+    for i, line in enumerate(lines):
+        nxt = lines[i + 1] if i + 1 < len(lines) else ""
+        if pages[-1] and nxt.startswith("BOLLETTA N.") and " - Pagina " in nxt:
+            pages.append([])
+        pages[-1].append(line)
+    return ["\n".join(p) for p in pages]
+
+
+def text_pdf(text: str) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    for page in split_pages(text):
+        for i, line in enumerate(page.splitlines()):
+            c.drawString(40, A4[1] - 50 - i * 16, line)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _page_image(text: str, rng: random.Random):
+    from PIL import Image, ImageDraw, ImageFont
+
+    img = Image.new("L", PAGE_PX, color=250)
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 22)
+    except OSError:
+        font = ImageFont.load_default()
+    y = 80
+    for line in text.splitlines()[:60]:
+        draw.text((80, y), line, fill=20, font=font)
+        y += 30
+    # rumore "da scanner": puntini sparsi
+    px = img.load()
+    for _ in range(PAGE_PX[0] * PAGE_PX[1] // 400):
+        x, yy = rng.randrange(PAGE_PX[0]), rng.randrange(PAGE_PX[1])
+        px[x, yy] = rng.randint(0, 255)
+    return img
+
+
+def scanned_pdf(text: str, rng: random.Random) -> bytes:
+    """One raster page per bill page, no text layer."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    for chunk in split_pages(text):
+        img = io.BytesIO()
+        _page_image(chunk, rng).save(img, format="PNG")
+        img.seek(0)
+        c.drawImage(ImageReader(img), 0, 0, width=A4[0], height=A4[1])
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def photo_jpeg(text: str, rng: random.Random) -> bytes:
+    """First page photographed: rotation, lighting gradient, JPEG artifacts."""
+    from PIL import Image
+
+    img = _page_image(split_pages(text)[0], rng)
+    shade = Image.linear_gradient("L").resize(PAGE_PX).point(lambda v: 200 + v // 5)
+    img = Image.composite(img, shade, Image.new("L", PAGE_PX, 200))
+    img = img.rotate(rng.uniform(-3, 3), expand=True, fillcolor=90).convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=70)
+    return out.getvalue()
+
+
+SHAPES = ("text_pdf", "scanned_pdf", "photo_jpeg")
+
+
+def make_document_corpus(n: int = 10, seed: int = 2030, shapes: tuple[str, ...] = SHAPES) -> list[BenchDocument]:
+    """`n` bills per requested shape (same bill texts across shapes)."""
+    rng = random.Random(seed)
+    texts = [make_bill_text(rng, pages=rng.randint(1, 3)) for _ in range(n)]
+    docs: list[BenchDocument] = []
+    for shape in shapes:
+        for text in texts:
+            if shape == "text_pdf":
+                docs.append(BenchDocument(shape, "application/pdf", text_pdf(text), text))
+            elif shape == "scanned_pdf":
+                docs.append(BenchDocument(shape, "application/pdf", scanned_pdf(text, rng), text))
+            elif shape == "photo_jpeg":
+                docs.append(BenchDocument(shape, "image/jpeg", photo_jpeg(text, rng), text))
+            else:
+                raise ValueError(f"Unknown document shape: {shape}")
+    return docs
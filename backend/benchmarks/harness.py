@@ -0,0 +1,125 @@
+"""Timing harness: latency percentiles, throughput and peak RSS per case, JSON baselines.
+
+Each case runs in its own forked process so its peak RSS is not inflated by the cases
+before it (ru_maxrss is a process-lifetime high-water mark).
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing as mp
+import platform
+import resource
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[], list[Any]]  # inputs, built in the child (not timed)
+    fn: Callable[[Any], Any]  # called once per input
+    skip_reason: str | None = None
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # macOS: byte, Linux: KiB
+
+
+def _measure(case: Case, repeat: int, warmup: int) -> dict[str, Any]:
+    inputs = case.setup()
+    for item in inputs[:warmup]:
+        case.fn(item)
+    latencies: list[float] = []
+    t_start = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            t0 = time.perf_counter()
+            case.fn(item)
+            latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - t_start
+    return {
+        "n": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "throughput_per_s": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _child(case: Case, repeat: int, warmup: int, conn) -> None:
+    try:
+        conn.send(("ok", _measure(case, repeat, warmup)))
+    except BaseException as e:  # noqa: BLE001 - riportato al padre
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def run_case(case: Case, repeat: int = 3, warmup: int = 1, isolate: bool = True) -> dict[str, Any]:
+    if case.skip_reason:
+        return {"skipped": case.skip_reason}
+    if not isolate:
+        return _measure(case, repeat, warmup)
+    ctx = mp.get_context("fork")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(case, repeat, warmup, child))
+    proc.start()
+    child.close()
+    status, payload = parent.recv()
+    proc.join()
+    if status != "ok":
+        raise RuntimeError(f"benchmark {case.name} failed: {payload}")
+    return payload
+
+
+def environment() -> dict[str, Any]:
+    return {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system(),
+            "cpus": mp.cpu_count()}
+
+
+def load_baseline(path: Path) -> dict[str, Any]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_baseline(path: Path, results: dict[str, dict[str, Any]], params: dict[str, Any]) -> None:
+    data = {"environment": environment(), "params": params,
+            "cases": {name: r for name, r in sorted(results.items()) if "skipped" not in r}}
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def compare(
+    results: dict[str, dict[str, Any]],
+    baseline: dict[str, Any],
+    latency_tolerance: float = 0.5,
+    rss_tolerance: float = 0.25,
+    min_delta: dict[str, float] | None = None,
+) -> list[str]:
+    """Regressions vs. baseline: p95 latency or peak RSS above baseline * (1 + tolerance).
+
+    `min_delta` (absolute, per metric) keeps sub-millisecond cases from failing on jitter.
+    """
+    min_delta = {"p95_ms": 1.0, "peak_rss_mb": 10.0} if min_delta is None else min_delta
+    failures = []
+    for name, base in (baseline.get("cases") or {}).items():
+        cur = results.get(name)
+        if cur is None or "skipped" in cur:
+            continue
+        for metric, tol in (("p95_ms", latency_tolerance), ("peak_rss_mb", rss_tolerance)):
+            limit = max(base[metric] * (1 + tol), base[metric] + min_delta.get(metric, 0.0))
+            if cur[metric] > limit:
+                failures.append(f"{name}: {metric} {cur[metric]} > {limit:.1f} (baseline {base[metric]}, +{tol:.0%})")
+    return failures
@@ -20,4 +20,7 @@ else:
 echo "Running migrations..."
 alembic upgrade head
 echo "Starting server..."
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000
+# client IP from X-Forwarded-For (per-IP fair share in admission control), trusted only when the
+# peer is the proxy: FORWARDED_ALLOW_IPS = nginx's address. Default: loopback only, so a client
+# reaching port 8000 directly cannot choose its own IP with a forged header.
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --proxy-headers --forwarded-allow-ips "${FORWARDED_ALLOW_IPS:-127.0.0.1}"
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import pytest
+
+VALID_EXTRACTION = {
+    "period_start": "2024-01-01",
+    "period_end": "2024-01-31",
+    "total_due": 85.5,
+    "kwh": 120.0,
+    "supplier": "Enel",
+    "confidence": {"total_due": 0.9, "kwh": 0.9},
+}
+
+
+class FakeOpenAI:
+    """Server HTTP locale compatibile con /v1/chat/completions (offline)."""
+
+    def __init__(self) -> None:
+        self.requests: list[dict[str, Any]] = []
+        # risposte programmate: (status, body dict | None); vuoto => VALID_EXTRACTION
+        self.script: list[tuple[int, dict[str, Any] | None]] = []
+        self.delay_seconds = 0.0
+        # richieste servite contemporaneamente (massimo osservato): concorrenza senza cronometro
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def completion(self, content: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "fake",
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(content)}}
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    def _next(self) -> tuple[int, dict[str, Any]]:
+        with self._lock:
+            status, body = self.script.pop(0) if self.script else (200, None)
+        if status == 200:
+            return status, self.completion(body if body is not None else VALID_EXTRACTION)
+        return status, body or {"error": {"message": "fake error", "type": "server_error"}}
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("content-length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests.append({"path": self.path, "body": body, "at": time.monotonic()})
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    if fake.delay_seconds:
+                        time.sleep(fake.delay_seconds)
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+                status, payload = fake._next()
+                raw = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(raw)))
+                if status == 429:
+                    self.send_header("retry-after", "0")
+                self.end_headers()
+                self.wfile.write(raw)
+
+        return Handler
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    from app.core.config import get_settings
+    from app.services import openai_extract
+
+    fake = FakeOpenAI()
+    fake.thread.start()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_BASE_URL", fake.base_url)
+    monkeypatch.setenv("OPENAI_BACKOFF_BASE_SECONDS", "0.01")
+    monkeypatch.setenv("OPENAI_BACKOFF_MAX_SECONDS", "0.05")
+    get_settings.cache_clear()
+    openai_extract.reset_client()
+    try:
+        yield fake
+    finally:
+        openai_extract.reset_client()
+        fake.server.shutdown()
+        fake.server.server_close()
+        get_settings.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def memory_progress_bus(monkeypatch):
+    """Eventi di avanzamento in memoria: nessun Redis richiesto nei test."""
+    from app.core.config import get_settings
+    from app.core.progress import get_progress_bus
+
+    monkeypatch.setenv("PROGRESS_BACKEND", "memory")
+    get_settings.cache_clear()
+    get_progress_bus.cache_clear()
+    yield get_progress_bus()
+    get_progress_bus.cache_clear()
+    get_settings.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def memory_inflight_registry(monkeypatch):
+    """Lock in-flight, impronte e slot di admission in memoria (nessun Redis nei test)."""
+    from app.core.admission import get_admission_store
+    from app.core.config import get_settings
+    from app.core.inflight import get_inflight_registry
+
+    monkeypatch.setenv("ANALYSIS_DEDUP_BACKEND", "memory")
+    get_settings.cache_clear()
+    get_inflight_registry.cache_clear()
+    get_admission_store.cache_clear()
+    yield get_inflight_registry()
+    get_admission_store.cache_clear()
+    get_inflight_registry.cache_clear()
+    get_settings.cache_clear()
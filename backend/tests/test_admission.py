@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.deps import get_db
+from app.api.routes import analysis
+from app.core import admission, metrics
+from app.core.config import get_settings
+from app.db.base import Base
+from app.db.models import UploadedDocument, UserSession
+
+
+@pytest.fixture
+def small_queue(monkeypatch):
+    monkeypatch.setenv("ANALYSIS_MAX_QUEUE_DEPTH", "10")
+    monkeypatch.setenv("ANALYSIS_PARTNER_RESERVE", "0.2")
+    monkeypatch.setenv("ANALYSIS_IP_SHARE", "0.3")
+    monkeypatch.setenv("ANALYSIS_RETRY_AFTER_SECONDS", "42")
+    monkeypatch.setenv("ANALYSIS_PARTNER_KEYS", "k-partner, k-other")
+    get_settings.cache_clear()
+    admission.get_admission_store.cache_clear()
+    metrics.reset()
+    yield
+    admission.get_admission_store.cache_clear()
+    get_settings.cache_clear()
+
+
+def _fill(n: int, source: str = "organic", ip: str | None = None) -> list[str]:
+    jobs = []
+    for i in range(n):
+        job = str(uuid.uuid4())
+        admission.admit(job, source, ip or f"ip-{i}")
+        jobs.append(job)
+    return jobs
+
+
+def test_partner_reserve_and_queue_full(small_queue):
+    _fill(8)  # 80% della coda: limite per il traffico organico
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        admission.admit("late", "organic", "ip-new")
+    assert (exc.value.reason, exc.value.retry_after) == ("queue_full", 42)
+
+    partner = admission.admit("p1", "partner", None)
+    assert partner.priority < admission.PRIORITIES["organic"]
+    admission.admit("p2", "partner", None)
+    with pytest.raises(admission.AdmissionRejected):
+        admission.admit("p3", "partner", None)
+    assert metrics.get_gauge("analysis_queue_depth") == 10
+    assert metrics.get_counter("analysis_admission_total", source="organic", outcome="queue_full") == 1
+
+
+def test_fair_share_per_ip(small_queue):
+    jobs = _fill(3, ip="burst")
+    with pytest.raises(admission.AdmissionRejected) as exc:
+        admission.admit("x", "organic", "burst")
+    assert exc.value.reason == "fair_share"
+    admission.admit("y", "organic", "someone-else")
+
+    admission.release(jobs[0])
+    admission.admit("z", "organic", "burst")
+    assert metrics.get_counter("analysis_job_seconds_count") == 1
+
+
+def test_partner_key_lookup(small_queue):
+    assert admission.source_for_partner_key("k-other") == "partner"
+    assert admission.source_for_partner_key("nope") == "organic"
+    assert admission.source_for_partner_key(None) == "organic"
+
+
+def test_start_returns_429_with_retry_after(small_queue, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'admission.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        session = UserSession(status="zone_set", cap="20121", zone_key="20121", ip_hash="burst")
+        db.add(session)
+        db.flush()
+        db.add_all([UploadedDocument(session_id=session.id, doc_type=t, file_path=f"/x/{t}.pdf",
+                                     mime_type="application/pdf") for t in ("recent", "old")])
+        db.commit()
+        sid = str(session.id)
+    _fill(3, ip="burst")
+
+    def override_db():
+        with Session() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(analysis.router, prefix="/api")
+    app.dependency_overrides[get_db] = override_db
+    r = TestClient(app).post("/api/analyze/start", json={"session_id": sid})
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == "42"
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.inflight import get_inflight_registry
+from app.db.base import Base
+from app.db.models import ExtractedBill, TrendResult, UploadedDocument, UserSession, ZoneTrendMonthly, ZoneTrendStats
+from app.workers import db as worker_db
+from app.workers import tasks
+from app.workers.celery_app import app as celery_app
+
+RAW = {
+    "recent": {"total_due": 120.0, "kwh": 300.0, "period_start": "2025-01-01", "period_end": "2025-02-28", "confidence": {}},
+    "old": {"total_due": 90.0, "kwh": 300.0, "period_start": "2024-01-01", "period_end": "2024-02-29", "confidence": {}},
+}
+
+
+@pytest.fixture
+def pipeline_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'pipeline.db'}")
+    get_settings.cache_clear()
+    engine = worker_db.init_worker_engine()
+    Base.metadata.create_all(engine)
+    calls: list[str] = []
+
+    def fake_extract_one(doc):
+        calls.append(doc.doc_type)
+        return RAW[doc.doc_type]
+
+    monkeypatch.setattr(tasks, "_extract_one", fake_extract_one)
+    db = worker_db.get_worker_session()
+    session = UserSession(status="zone_set", cap="20121", zone_key="20121")
+    db.add(session)
+    db.flush()
+    docs = [UploadedDocument(session_id=session.id, doc_type=t, file_path=f"/x/{t}.pdf", mime_type="application/pdf")
+            for t in ("recent", "old")]
+    db.add_all(docs)
+    db.commit()
+    ids = str(session.id), [str(d.id) for d in docs]
+    worker_db.close_worker_session()
+    try:
+        yield ids, calls
+    finally:
+        worker_db._on_worker_process_shutdown()
+        get_settings.cache_clear()
+
+
+def _count(model) -> int:
+    db = worker_db.get_worker_session()
+    try:
+        return db.execute(select(func.count()).select_from(model)).scalar_one()
+    finally:
+        worker_db.close_worker_session()
+
+
+def test_stages_are_idempotent(pipeline_db):
+    (session_id, doc_ids), calls = pipeline_db
+    for _ in range(2):
+        for doc_id in doc_ids:
+            tasks.extract_document.run(doc_id)
+    assert calls == ["recent", "old"]
+    assert _count(ExtractedBill) == 2
+
+    assert tasks.compute_trend.run(doc_ids, session_id) == tasks.compute_trend.run(doc_ids, session_id)
+    assert _count(TrendResult) == 1
+    db = worker_db.get_worker_session()
+    assert db.get(UserSession, uuid.UUID(session_id)).status == "verified"
+    assert db.get(ZoneTrendStats, "20121").count == 1  # counted once despite the re-run
+    assert db.get(ZoneTrendMonthly, ("20121", date(2025, 2, 1))).count == 1  # recent bill's period_end month
+    worker_db.close_worker_session()
+
+
+def test_concurrent_extraction_of_a_document_stores_one_bill(pipeline_db, monkeypatch):
+    (session_id, doc_ids), calls = pipeline_db
+    extract_one = tasks._extract_one
+
+    def racing_extract_one(doc):  # the other run commits its bill while this one is extracting
+        raw = extract_one(doc)
+        other = worker_db.get_worker_engine().connect()
+        other.execute(ExtractedBill.__table__.insert().values(
+            id=uuid.uuid4(), session_id=doc.session_id, doc_id=doc.id, created_at=doc.created_at))
+        other.commit()
+        other.close()
+        return raw
+
+    monkeypatch.setattr(tasks, "_extract_one", racing_extract_one)
+    assert tasks.extract_document.run(doc_ids[0]) == doc_ids[0]
+    assert _count(ExtractedBill) == 1
+
+
+def test_chord_runs_extract_then_trend(pipeline_db, monkeypatch):
+    (session_id, doc_ids), calls = pipeline_db
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    result = tasks.start_analysis(session_id, doc_ids)
+    assert result.get() in ("green", "yellow", "red")
+    assert sorted(calls) == ["old", "recent"]
+    assert _count(TrendResult) == 1
+    db = worker_db.get_worker_session()
+    timings = db.execute(select(TrendResult.timings_json)).scalar_one()
+    worker_db.close_worker_session()
+    assert set(timings["extract"]) == {"recent", "old"}
+    assert "db_write" in timings["extract"]["recent"]
+    assert {"user_trend", "zone_aggregate"} <= set(timings["trend"])
+
+
+def _submit(session_id: str) -> tasks.AnalysisSubmission:
+    db = worker_db.get_worker_session()
+    try:
+        session = db.get(UserSession, uuid.UUID(session_id))
+        docs = list(db.execute(select(UploadedDocument).where(UploadedDocument.session_id == session.id)).scalars())
+        return tasks.submit_analysis(db, session, docs)
+    finally:
+        worker_db.close_worker_session()
+
+
+def test_duplicate_submissions_coalesce_onto_the_running_job(pipeline_db, monkeypatch):
+    (session_id, _), _ = pipeline_db
+    launched: list[str] = []
+    monkeypatch.setattr(tasks, "start_analysis", lambda sid, ids, job_id=None, **_: launched.append(job_id))
+    metrics.reset()
+
+    first = _submit(session_id)
+    second = _submit(session_id)
+    assert (first.outcome, second.outcome) == ("started", "coalesced")
+    assert second.job_id == first.job_id
+    assert launched == [first.job_id]
+    assert metrics.get_counter("analysis_requests_total", outcome="coalesced") == 1
+
+    # a failed pipeline frees the lock: the next request starts a new job
+    tasks.mark_session_error.run(session_id, first.job_id)
+    assert _submit(session_id).outcome == "started"
+
+
+def test_unchanged_inputs_are_not_reanalysed(pipeline_db, monkeypatch):
+    (session_id, _), calls = pipeline_db
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    first = _submit(session_id)
+    assert first.outcome == "started"
+    # the fingerprint is stored with the result: a fresh Redis (flush, expiry) changes nothing
+    get_inflight_registry.cache_clear()
+    assert _submit(session_id) == tasks.AnalysisSubmission(first.job_id, "unchanged")
+    assert sorted(calls) == ["old", "recent"]
+
+    # a new upload changes the fingerprint: the trend is recomputed, old bills are reused
+    db = worker_db.get_worker_session()
+    db.add(UploadedDocument(session_id=uuid.UUID(session_id), doc_type="recent", file_path="/x/recent2.pdf",
+                            mime_type="application/pdf"))
+    db.commit()
+    worker_db.close_worker_session()
+    again = _submit(session_id)
+    assert again.outcome == "started" and again.job_id != first.job_id
+    assert sorted(calls) == ["old", "recent", "recent"]
+    assert _count(TrendResult) == 1
+    db = worker_db.get_worker_session()
+    assert db.execute(select(TrendResult.job_id)).scalar_one() == again.job_id
+    assert db.get(ZoneTrendStats, "20121").count == 1  # one sample per session, not per run
+    worker_db.close_worker_session()
+
+
+def test_failed_reanalysis_keeps_the_previous_result(pipeline_db, monkeypatch):
+    (session_id, doc_ids), _ = pipeline_db
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    first = _submit(session_id)
+    db = worker_db.get_worker_session()
+    db.add(UploadedDocument(session_id=uuid.UUID(session_id), doc_type="recent", file_path="/x/recent2.pdf",
+                            mime_type="application/pdf"))
+    db.commit()
+    worker_db.close_worker_session()
+
+    launched: list[str] = []
+    monkeypatch.setattr(tasks, "start_analysis", lambda sid, ids, job_id=None, **_: launched.append(job_id))
+    rerun = _submit(session_id)
+    assert rerun.outcome == "started" and launched == [rerun.job_id]
+    tasks.mark_session_error.run(session_id, rerun.job_id)  # the new pipeline fails
+
+    db = worker_db.get_worker_session()
+    assert db.get(UserSession, uuid.UUID(session_id)).status == "verified"
+    assert db.execute(select(TrendResult.job_id)).scalar_one() == first.job_id
+    worker_db.close_worker_session()
+
+
+def test_start_endpoint_runs_the_pipeline(pipeline_db, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy.orm import Session
+
+    from app.api.deps import get_db
+    from app.api.routes import analysis
+
+    (session_id, _), calls = pipeline_db
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    api = FastAPI()
+    api.include_router(analysis.router, prefix="/api")
+
+    def db_session():
+        with Session(worker_db.get_worker_engine()) as db:
+            yield db
+
+    api.dependency_overrides[get_db] = db_session
+    client = TestClient(api)
+
+    first = client.post("/api/analyze/start", json={"session_id": session_id})
+    assert first.status_code == 200 and first.json()["status"] == "running"
+    assert sorted(calls) == ["old", "recent"] and _count(TrendResult) == 1
+    again = client.post("/api/analyze/start", json={"session_id": session_id})
+    assert again.json() == {"job_id": first.json()["job_id"], "status": "done"}
+    assert client.post("/api/analyze/start", json={"session_id": str(uuid.uuid4())}).status_code == 404
+
+
+def test_stages_are_routed_to_their_queues():
+    routes = celery_app.conf.task_routes
+    assert routes["extract_document"]["queue"] == "llm"
+    assert routes["compute_trend"]["queue"] == "cpu"
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import io
+import json
+
+import pytest
+
+from app.batch import __main__ as batch_cli
+from app.batch.runner import BatchItem, discover_items, run_batch
+from app.batch.sinks import Checkpoint, JsonlSink
+
+
+def _pdf(lines: list[str]) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    for i, line in enumerate(lines):
+        c.drawString(40, A4[1] - 60 - i * 16, line)
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+FULL = ["Fornitore: Enel Energia", "Periodo dal 01/01/2024 al 29/02/2024", "Totale bolletta 85,50 €",
+        "Quota fissa 12,00 €", "Consumo 120 kWh"]
+NO_USAGE = ["Fornitore: A2A Energia", "Periodo dal 01/03/2024 al 30/04/2024", "Totale bolletta 99,00 €"]
+
+
+@pytest.fixture(autouse=True)
+def no_extraction_cache(monkeypatch):
+    from app.cache import get_extraction_cache
+    from app.core.config import get_settings
+
+    monkeypatch.setenv("EXTRACTION_CACHE_BACKEND", "none")
+    get_settings.cache_clear()
+    get_extraction_cache.cache_clear()
+    yield
+    get_extraction_cache.cache_clear()
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def bills(tmp_path):
+    root = tmp_path / "bills"
+    root.mkdir()
+    (root / "a.pdf").write_bytes(_pdf(FULL))
+    (root / "b.pdf").write_bytes(_pdf(NO_USAGE))
+    pair = root / "cliente-1"
+    pair.mkdir()
+    (pair / "1_latest.pdf").write_bytes(_pdf(NO_USAGE))
+    (pair / "2_older.pdf").write_bytes(_pdf(FULL))
+    (root / "note.txt").write_text("ignorato")
+    return root
+
+
+def _records(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_directory_and_manifest_discovery(bills, tmp_path):
+    items = list(discover_items(bills))
+    assert [i.id for i in items] == ["a.pdf", "b.pdf", "cliente-1"]
+    assert [k for k, _ in items[2].docs] == ["latest", "older"]
+
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("id,latest,older\nx,bills/a.pdf,bills/b.pdf\ny,bills/b.pdf,\n")
+    items = list(discover_items(manifest))
+    assert [(i.id, len(i.docs)) for i in items] == [("x", 2), ("y", 1)]
+    assert items[0].docs[0][1] == str(bills / "a.pdf")
+
+
+def test_run_batch_in_process_with_stub_llm(bills, tmp_path):
+    out = tmp_path / "out.jsonl"
+    stats = run_batch(discover_items(bills), JsonlSink(out), Checkpoint(tmp_path / "ck"), workers=0, llm="stub")
+    records = {r["id"]: r for r in _records(out)}
+    assert set(records) == {"a.pdf", "b.pdf", "cliente-1"}
+    assert all(r["status"] == "ok" for r in records.values())
+    assert records["a.pdf"]["fields"]["latest"]["total_eur"] == 85.5
+    assert records["a.pdf"]["llm"]["calls"] == 0
+    # consumo mancante: una chiamata allo stub per bolletta, nessun campo inventato
+    assert records["cliente-1"]["llm"] == {"backend": "stub", "calls": 1, "filled": {}}
+    assert set(records["cliente-1"]["timings"]) == {"read", "extract", "llm", "rules"}
+    summary = stats.summary()
+    assert (summary["items"], summary["docs"], summary["llm_calls"]) == (3, 4, 2)
+    assert summary["docs_per_s"] > 0 and "extract" in summary["stages"]
+
+
+def test_resume_skips_checkpointed_and_retries_errors(bills, tmp_path):
+    out, ck = tmp_path / "out.jsonl", Checkpoint(tmp_path / "out.jsonl.checkpoint")
+    items = list(discover_items(bills)) + [BatchItem(id="missing", docs=[("latest", str(bills / "nope.pdf"))])]
+    first = run_batch(items, JsonlSink(out), ck, workers=0)
+    assert (first.items, first.errors) == (4, 1)
+    assert ck.load() == {"a.pdf", "b.pdf", "cliente-1"}
+
+    second = run_batch(items, JsonlSink(out), ck, workers=0)
+    assert (second.items, second.skipped, second.errors) == (1, 3, 1)
+    assert [r["id"] for r in _records(out)].count("missing") == 2
+
+
+def test_cli_process_pool(bills, tmp_path, capsys):
+    out = tmp_path / "res" / "out.jsonl"
+    assert batch_cli.main([str(bills), "-o", str(out), "--workers", "2"]) == 0
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["items"] == 3 and summary["docs"] == 4
+    assert len(_records(out)) == 3
+    assert (tmp_path / "res" / "out.jsonl.checkpoint").exists()
+
+    # stessa invocazione: tutto già fatto
+    assert batch_cli.main([str(bills), "-o", str(out), "--workers", "2"]) == 0
+    assert json.loads(capsys.readouterr().out.strip().splitlines()[-1])["skipped"] == 3
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import random
+
+from app.extraction.condense import condense_text, count_tokens
+from app.extraction.parsers import parse_fields_from_text
+from benchmarks.corpus import make_bill_text
+
+
+def test_repeated_page_headers_are_dropped():
+    text = "\n".join(
+        ["ENEL ENERGIA", "Bolletta - Pagina 1 di 3", "Totale bolletta 85,50 €",
+         "ENEL ENERGIA", "Bolletta - Pagina 2 di 3", "Informativa privacy",
+         "ENEL ENERGIA", "Bolletta - Pagina 3 di 3", "Informativa privacy"]
+    )
+    c = condense_text(text, max_tokens=10_000)
+    assert c.text.splitlines() == ["ENEL ENERGIA", "Bolletta - Pagina 1 di 3", "Totale bolletta 85,50 €", "Informativa privacy"]
+    assert c.lines_total == 9 and c.lines_kept == 4
+
+
+def test_labelled_lines_with_different_amounts_are_not_merged():
+    c = condense_text("IVA 10% 5,00 €\nIVA 22% 7,00 €", max_tokens=10_000)
+    assert c.lines_kept == 2
+
+
+def test_budget_keeps_labelled_lines_in_order():
+    filler = [f"Comunicazione {i}: condizioni generali di fornitura e informativa." for i in range(200)]
+    text = "\n".join(["HERA COMM", *filler[:100], "Totale bolletta 120,00 €", "Consumo fatturato 300 kWh", *filler[100:]])
+    c = condense_text(text, max_tokens=80)
+    assert c.tokens <= 80
+    assert c.tokens < count_tokens(text) / 10
+    lines = c.text.splitlines()
+    assert lines[0] == "HERA COMM"
+    assert lines.index("Totale bolletta 120,00 €") < lines.index("Consumo fatturato 300 kWh")
+    assert parse_fields_from_text(c.text)["total_eur"] == 120.0
+
+
+def test_field_recall_parity_on_corpus():
+    rng = random.Random(2031)
+    for _ in range(50):
+        pages = rng.randint(2, 10)
+        text = make_bill_text(rng, pages=pages, summary_page=rng.randint(1, pages))
+        c = condense_text(text, max_tokens=250)
+        assert c.tokens <= 250
+        assert parse_fields_from_text(c.text) == parse_fields_from_text(text)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import time
+
+from app.cache.base import content_key
+from app.cache.memory import MemoryCache
+
+
+def test_content_key_depends_on_bytes_and_version():
+    k1 = content_key(b"abc", "pipeline", "v1")
+    assert k1 == content_key(b"abc", "pipeline", "v1")
+    assert k1 != content_key(b"abd", "pipeline", "v1")
+    assert k1 != content_key(b"abc", "pipeline", "v2")
+
+
+def test_memory_cache_lru_and_counters():
+    cache = MemoryCache(ttl_seconds=60, max_entries=2, max_bytes=10_000)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}  # "a" diventa la più recente
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("c") == {"v": 3}
+    assert cache.stats() == {"hits": 2, "misses": 1}
+
+
+def test_memory_cache_ttl_and_size_eviction():
+    cache = MemoryCache(ttl_seconds=0, max_entries=10, max_bytes=10_000)
+    cache.set("a", {"v": 1})
+    time.sleep(0.001)
+    assert cache.get("a") is None
+
+    cache = MemoryCache(ttl_seconds=60, max_entries=10, max_bytes=30)
+    cache.set("a", {"v": "x" * 10})
+    cache.set("b", {"v": "y" * 10})
+    assert len(cache) == 1
+    assert cache.get("b") is not None
+
+
+def test_pipeline_reuses_cached_extraction(monkeypatch):
+    from app.extraction import pipeline
+
+    cache = MemoryCache(ttl_seconds=60, max_entries=10, max_bytes=100_000)
+    monkeypatch.setattr(pipeline, "get_extraction_cache", lambda: cache)
+    calls: list[bytes] = []
+
+    def fake_extract_text(mime, data, pdf=None, on_ocr_page=None):
+        calls.append(data)
+        return "Totale bolletta 85,50 €\n120 kWh", {"mime": mime, "ocr_used": False}
+
+    monkeypatch.setattr(pipeline, "_extract_text", fake_extract_text)
+    docs = [{"kind": "latest", "mime": "application/pdf", "bytes": b"%PDF-same"}]
+    first, _ = pipeline.extract_fields_from_documents(docs)
+    second, _ = pipeline.extract_fields_from_documents(docs)
+    assert len(calls) == 1
+    assert first["latest"] == second["latest"]
+    assert second["meta"]["latest"]["cache_hit"] is True
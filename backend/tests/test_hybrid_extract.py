@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from app.cache import NullCache
+from app.core import metrics
+from app.services.extract_schema import validate_extraction_payload
+from app.services.hybrid_extract import llm_skip_rate, local_extraction
+from app.workers import tasks
+
+COMPLETE = (
+    "ENEL ENERGIA\nFornitore: Enel Energia S.p.A.\nPeriodo dal 01/01/2025 al 28/02/2025\n"
+    "Consumo fatturato 312,40 kWh\nTotale bolletta 85,50 €\nIVA 10% 7,77\nAccisa 2,30"
+)
+NO_PERIOD = "HERA COMM\nConsumo 120 Smc\nTotale bolletta 99,00 €"
+
+
+def test_local_extraction_maps_to_schema():
+    loc = local_extraction(COMPLETE, threshold=0.7)
+    assert loc.complete
+    out, err = validate_extraction_payload(loc.raw)
+    assert err is None
+    assert out.total_due == 85.5 and out.kwh == 312.4
+    assert out.taxes is None  # l'aliquota IVA non è un importo
+    assert out.period_start.isoformat() == "2025-01-01"
+    assert out.supplier == "Enel Energia S.p.A."
+    assert out.confidence.total_due == 0.9
+
+
+def test_generic_or_partial_total_is_low_confidence():
+    loc = local_extraction("Totale imposte 12,00 €\nPeriodo dal 01/01/2025 al 28/02/2025\n100 kWh", threshold=0.7)
+    assert loc.confidence["total_due"] < 0.7
+    assert loc.missing == ["total_due"]
+
+
+def test_missing_fields_only_are_requested(fake_openai, monkeypatch):
+    metrics.reset()
+    monkeypatch.setattr(tasks, "get_extraction_cache", lambda: NullCache())
+    monkeypatch.setattr(tasks, "read_file", lambda path: path.encode())
+    monkeypatch.setattr(tasks, "_extraction_request", lambda data, mime: ("text", data.decode()))
+    fake_openai.script = [
+        (200, {"period_start": "2025-03-01", "period_end": "2025-04-30", "total_due": 1.0, "confidence": {"period_start": 0.8}}),
+    ]
+    docs = [
+        SimpleNamespace(id=1, file_path=COMPLETE, mime_type="application/pdf"),
+        SimpleNamespace(id=2, file_path=NO_PERIOD, mime_type="application/pdf"),
+    ]
+    complete, partial = tasks._extract_documents(docs)
+
+    assert len(fake_openai.requests) == 1
+    system = fake_openai.requests[0]["body"]["messages"][0]["content"]
+    assert system.endswith("(tutti gli altri null): period_start, period_end.")
+    assert complete["total_due"] == 85.5
+    # i campi già letti localmente non vengono sovrascritti dall'LLM
+    assert partial["total_due"] == 99.0 and partial["smc"] == 120.0
+    assert partial["period_start"] == "2025-03-01"
+    assert partial["confidence"]["period_start"] == 0.8
+    assert llm_skip_rate() == 0.5
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import io
+
+import pytest
+
+from app.core import instrumentation
+from app.core.instrumentation import collect_timings, record_stage, span
+
+
+@pytest.fixture(autouse=True)
+def no_extraction_cache(monkeypatch):
+    from app.cache import get_extraction_cache
+    from app.core.config import get_settings
+
+    monkeypatch.setenv("EXTRACTION_CACHE_BACKEND", "none")
+    get_settings.cache_clear()
+    get_extraction_cache.cache_clear()
+    yield
+    get_extraction_cache.cache_clear()
+    get_settings.cache_clear()
+
+
+def test_nested_collectors_forward_to_parent():
+    with collect_timings() as outer:
+        record_stage("storage_read", 0.010)
+        with collect_timings() as inner:
+            record_stage("llm_call", 0.200)
+            record_stage("llm_call", 0.100)
+    record_stage("db_write", 1.0)  # nessun collector attivo: solo istogramma
+
+    assert inner.as_dict() == {"llm_call": {"ms": 300.0, "count": 2}}
+    assert outer.as_dict() == {"storage_read": {"ms": 10.0, "count": 1}, "llm_call": {"ms": 300.0, "count": 2}}
+
+
+def test_ocr_pages_in_pool_threads_reach_the_collector(monkeypatch):
+    from app.extraction import ocr
+
+    class FakeDoc:
+        def render_pnm(self, page, dpi):
+            return b"P5 1 1 255\n\x00"
+
+    monkeypatch.setattr(ocr, "_tesseract_pnm", lambda pnm: "testo")
+    with collect_timings() as timings:
+        out = ocr.ocr_document_pages(FakeDoc(), [1, 2, 3], workers=3)
+    assert out == {1: "testo", 2: "testo", 3: "testo"}
+    stages = timings.as_dict()
+    assert stages["ocr_page"]["count"] == 3
+    assert stages["pdf_render"]["count"] == 3
+
+
+def test_extraction_meta_has_stage_timings():
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    from app.extraction.pipeline import extract_fields_from_documents
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    for i, line in enumerate(["Fornitore: Enel Energia", "Totale bolletta 85,50 €", "Consumo 120 kWh"] * 3):
+        c.drawString(40, A4[1] - 60 - i * 16, line)
+    c.showPage()
+    c.save()
+
+    fields, _ = extract_fields_from_documents([{"kind": "latest", "mime": "application/pdf", "bytes": buf.getvalue()}])
+    timings = fields["meta"]["timings"]
+    assert {"pdf_parse", "parse_fields"} <= set(timings)
+    assert "ocr_page" not in timings
+
+
+def test_metrics_endpoint_exposes_stage_histogram():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with span("zone_aggregate"):
+        pass
+    resp = TestClient(app).get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'bollettometro_stage_seconds' in resp.text and 'stage="zone_aggregate"' in resp.text
+
+
+def test_render_metrics_without_prometheus_client(monkeypatch):
+    from app.core import metrics
+
+    metrics.reset()
+    monkeypatch.setattr(instrumentation, "prometheus_client", None)
+    monkeypatch.setattr(instrumentation, "_STAGE_SECONDS", None)
+    record_stage("passport_render", 0.5)
+    body, content_type = instrumentation.render_metrics()
+    assert content_type.startswith("text/plain")
+    assert 'bollettometro_stage_seconds_count{stage="passport_render"} 1' in body.decode()
+
+
+def test_internal_counters_are_prometheus_metrics():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    from app.core import metrics
+
+    metrics.incr("test_mirrored_events", kind="a")
+    metrics.incr("test_mirrored_events", 2, kind="a")
+    metrics.observe("test_mirrored_seconds", 0.5)
+    metrics.set_gauge("test_mirrored_depth", 7)
+    registry = prometheus_client.REGISTRY
+    assert registry.get_sample_value("test_mirrored_events_total", {"kind": "a"}) == 3
+    assert registry.get_sample_value("test_mirrored_seconds_count") == 1
+    assert registry.get_sample_value("test_mirrored_depth") == 7
+    body, _ = instrumentation.render_metrics()
+    assert b'test_mirrored_events_total{kind="a"} 3.0' in body
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import io
+import time
+
+from app.extraction import ocr
+from app.extraction.document import PdfDocument
+
+
+class _FakeDoc:
+    page_count = 4
+
+    def __init__(self):
+        self.rendered: list[int] = []
+
+    def render_pnm(self, number, dpi=200):
+        self.rendered.append(number)
+        return f"P5 {number}".encode()
+
+
+def test_ocr_pages_parallel_keeps_order(monkeypatch):
+    def fake_tesseract(pnm):
+        page = int(pnm.split()[1])
+        # le prime pagine finiscono per ultime: l'output deve restare ordinato
+        time.sleep(0.02 * (5 - page))
+        return f"pagina {page}"
+
+    monkeypatch.setattr(ocr, "_tesseract_pnm", fake_tesseract)
+    doc = _FakeDoc()
+    text = ocr.ocr_document(doc, max_pages=3, workers=3)
+    assert text.splitlines() == ["pagina 1", "pagina 2", "pagina 3"]
+    assert doc.rendered == [1, 2, 3]
+
+
+def test_ocr_skips_empty_pages(monkeypatch):
+    monkeypatch.setattr(ocr, "_tesseract_pnm", lambda pnm: "" if pnm.endswith(b"1") else "ok")
+    assert ocr.ocr_document(_FakeDoc(), max_pages=2, workers=2) == "ok"
+
+
+def test_ocr_image_feeds_pnm_to_tesseract(monkeypatch):
+    from PIL import Image
+
+    seen: list[bytes] = []
+    monkeypatch.setattr(ocr, "_tesseract_pnm", lambda pnm: seen.append(pnm) or "testo")
+    img = Image.new("RGB", (8, 4), color=(255, 255, 255))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG")
+    assert ocr.ocr_image_bytes(buf.getvalue()) == "testo"
+    # PGM binario (P5): scala di grigi, pixel grezzi
+    assert seen and seen[0].startswith(b"P5")
+
+
+def test_pdf_document_caches_text_and_rasters():
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    c.drawString(40, 700, "Totale bolletta 85,50")
+    c.showPage()
+    c.save()
+
+    with PdfDocument(buf.getvalue()) as doc:
+        assert doc.page_count == 1
+        assert doc.page(1) is doc.page(1)
+        assert "Totale bolletta" in doc.text()
+        img = doc.render(1, dpi=72)
+        assert img is not None and img.mode == "L"
+        assert doc.render(1, dpi=72) is img
+        assert doc.render_pnm(1, dpi=72).startswith(b"P5")
+
+
+def test_pdfium_calls_are_serialized_across_documents(monkeypatch):
+    import threading
+
+    import pypdfium2
+    from reportlab.pdfgen import canvas
+
+    def pdf(text: str) -> bytes:
+        buf = io.BytesIO()
+        c = canvas.Canvas(buf)
+        c.drawString(40, 700, text)
+        c.showPage()
+        c.save()
+        return buf.getvalue()
+
+    active, peak = [0], [0]
+    original = pypdfium2.PdfPage.render
+
+    def tracked(self, *args, **kwargs):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            active[0] -= 1
+
+    monkeypatch.setattr(pypdfium2.PdfPage, "render", tracked)
+    docs = [PdfDocument(pdf(f"bolletta {i}")) for i in range(6)]
+    threads = [threading.Thread(target=d.render, args=(1, 72)) for d in docs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 1  # un render pdfium alla volta, anche su documenti diversi
+    assert all(d.render(1, 72) is not None for d in docs)
+    for d in docs:
+        d.close()
+
+
+def test_only_pages_with_images_are_ocred(monkeypatch):
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    from app.extraction import pipeline
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    c.showPage()  # pagina bianca
+    c.drawString(40, 700, "Pag. 2")
+    c.showPage()
+    c.drawImage(ImageReader(Image.new("L", (200, 280), 255)), 0, 0, width=595, height=842)
+    c.showPage()
+    c.save()
+
+    ocred: list[int] = []
+    monkeypatch.setattr(pipeline, "ocr_document_pages",
+                        lambda doc, numbers, on_page=None: ocred.extend(numbers) or {n: "" for n in numbers})
+    meta: dict = {}
+    with PdfDocument(buf.getvalue()) as doc:
+        pipeline._extract_pdf_text(doc, meta)
+    assert ocred == [3]
+
+
+def test_documents_without_text_or_images_fall_back_to_ocr(monkeypatch):
+    from reportlab.pdfgen import canvas
+
+    from app.extraction import pipeline
+    from app.extraction.document import PageText
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    # "TOTALE" disegnato come tracciati vettoriali: niente testo estraibile, niente immagini
+    path = c.beginPath()
+    for x in range(40, 280, 40):
+        path.moveTo(x, 700)
+        path.lineTo(x + 15, 740)
+        path.lineTo(x + 30, 700)
+    c.drawPath(path)
+    c.showPage()
+    c.save()
+
+    ocred: list[int] = []
+    monkeypatch.setattr(pipeline, "ocr_document_pages",
+                        lambda doc, numbers, on_page=None: ocred.extend(numbers) or {n: "TOTALE" for n in numbers})
+    with PdfDocument(buf.getvalue()) as doc:
+        assert doc.page(1).chars == 0 and doc.page(1).image_coverage == 0
+        assert pipeline._extract_pdf_text(doc, {}) == "TOTALE"
+    assert ocred == [1]
+
+    # pagina che pdfplumber non ha letto: testo e immagini sconosciuti
+    assert pipeline._page_needs_ocr(PageText(number=1, text="", image_coverage=0.0, parsed=False))
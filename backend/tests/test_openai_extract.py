@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from app.services.openai_extract import extract_concurrently, extract_from_text
+
+
+def test_extract_from_text_uses_fake_server(fake_openai):
+    out, err = extract_from_text("Totale bolletta 85,50 €")
+    assert err is None
+    assert out["total_due"] == 85.5
+    assert fake_openai.requests[0]["path"] == "/v1/chat/completions"
+
+
+def test_retries_on_429_and_5xx(fake_openai):
+    fake_openai.script = [(429, None), (503, None)]
+    out, err = extract_from_text("Totale 10,00")
+    assert err is None and out is not None
+    assert len(fake_openai.requests) == 3
+
+
+def test_no_retry_on_client_error(fake_openai):
+    fake_openai.script = [(400, {"error": {"message": "bad request", "type": "invalid_request_error"}})]
+    out, err = extract_from_text("Totale 10,00")
+    assert out is None and err
+    assert len(fake_openai.requests) == 1
+
+
+def test_extractions_run_concurrently(fake_openai):
+    fake_openai.delay_seconds = 0.3  # finestra in cui la seconda richiesta deve già essere arrivata
+    results = extract_concurrently([("text", "bolletta recente"), ("image", "aGVsbG8=")])
+    assert [err for _, err in results] == [None, None]
+    assert fake_openai.max_in_flight >= 2
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from app.extraction.parsers import parse_fields_from_text, parse_fields_from_text_legacy
+
+SAMPLES = [
+    "",
+    "ENEL ENERGIA\nFornitore: Enel Energia S.p.A.\nPeriodo dal 01/01/2025 al 31/01/2025\n"
+    "POD: IT001E1234567890\nConsumo 123,45 kWh\nTotale bolletta 85,50 €\nQuota fissa 10,00\nIVA 10% 7,77\nAccisa 2,30",
+    # etichette sovrapposte, etichetta senza importo sulla stessa riga
+    "Importo totale\n\nTOTALE BOLLETTA 1.234,56 €\nDa pagare 99,00",
+    # kW/h non è un consumo; unità gas in varie forme
+    "Potenza 3 kW/h\nkWh: 250\nPDR 12345678901234\nLettura 45 m³\nSmc 12,5",
+    # date non valide: il primo match vince anche se non parsabile
+    "dal 45/13/2025 al 01/01/2025\ndal 01/02/2025 al 28/02/2025",
+    # caratteri con case-folding speciale (fallback case-insensitive)
+    "ſpesa fissa 12,00\nTOTALE 10,00\nİVA 3,00",
+    "BOLLETTA\nFATTURA n. 1\nHera Comm\nQuota variabile 40,00 €\nimposta di consumo 3,10",
+]
+
+LINES = [
+    "Totale {a}", "totale bolletta {a} €", "Importo totale: € {a}", "Da pagare {a}", "Quota fissa {a}",
+    "spesa fissa {a}", "oneri fissi {a}", "Spesa per la materia energia {a}", "materia gas {a}",
+    "IVA 22% {a}", "Accisa {a}", "Imposta di consumo {a}", "Consumo {n} kWh", "kWh {n}", "{n} Smc",
+    "mc {n}", "POD IT001E{d8}", "PDR {d14}", "Fornitore - {s}", "dal {dt} al {dt}", "Servizio clienti 800 900 800",
+]
+
+
+def _random_text(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(1, 25)):
+        tpl = rng.choice(LINES)
+        lines.append(
+            tpl.format(
+                a=f"{rng.randint(0, 2000)},{rng.randint(0, 99):02d}",
+                n=rng.randint(1, 5000),
+                d8=rng.randint(10**7, 10**8 - 1),
+                d14=rng.randint(10**13, 10**14 - 1),
+                s=rng.choice(["Enel", "A2A", "Iren"]),
+                dt=f"{rng.randint(1, 31):02d}/{rng.randint(1, 12):02d}/2025",
+            )
+        )
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_scanner_matches_legacy_samples(text):
+    assert parse_fields_from_text(text) == parse_fields_from_text_legacy(text)
+
+
+def test_scanner_matches_legacy_random_corpus():
+    rng = random.Random(42)
+    for _ in range(300):
+        text = _random_text(rng)
+        assert parse_fields_from_text(text) == parse_fields_from_text_legacy(text), text
+
+
+def test_scanner_fields():
+    fields = parse_fields_from_text(SAMPLES[1])
+    assert fields["total_eur"] == 85.5
+    assert fields["kwh"] == 123.45
+    assert fields["pod"] == "IT001E1234567890"
+    assert fields["period_days"] == 31
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import io
+
+from PIL import Image
+
+
+def _pdf_text_then_scan() -> bytes:
+    """Pagina 1 con testo nativo, pagina 2 solo immagine (scansione)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    w, h = A4
+    for i, line in enumerate(["Fornitore: Enel Energia", "Totale bolletta 85,50 €", "Consumo 120 kWh"] * 3):
+        c.drawString(40, h - 60 - i * 16, line)
+    c.showPage()
+    img = io.BytesIO()
+    Image.new("L", (200, 280), color=230).save(img, format="PNG")
+    img.seek(0)
+    c.drawImage(ImageReader(img), 0, 0, width=w, height=h)
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def test_extract_text_ocr_only_scanned_pages(monkeypatch):
+    from app.extraction import pipeline
+
+    requested: list[list[int]] = []
+
+    def fake_ocr_pages(doc, pages, dpi=200, workers=None, on_page=None):
+        requested.append(list(pages))
+        return {p: f"testo ocr pagina {p}" for p in pages}
+
+    monkeypatch.setattr(pipeline, "ocr_document_pages", fake_ocr_pages)
+    text, meta = pipeline._extract_text("application/pdf", _pdf_text_then_scan())
+
+    assert requested == [[2]]
+    assert meta["text_pages"] == [1]
+    assert meta["ocr_pages"] == [2]
+    assert meta["ocr_used"] is True
+    assert [p["path"] for p in meta["pages"]] == ["text", "ocr"]
+    assert meta["pages"][1]["image_coverage"] > 0.9
+    assert text.index("Totale bolletta") < text.index("testo ocr pagina 2")
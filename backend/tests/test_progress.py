@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import uuid
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import analysis
+from app.core import progress
+from app.core.progress import publish_progress, session_topic, stream_progress
+
+
+def _collect(topic: str, publish_after_subscribe: list[tuple[str, dict]]) -> list[dict]:
+    async def run() -> list[dict]:
+        events = []
+        agen = stream_progress(topic, keepalive_seconds=0.05)
+        started = False
+        async for event in agen:
+            if not started:
+                started = True
+                threading.Thread(
+                    target=lambda: [publish_progress(topic, stage, **kw) for stage, kw in publish_after_subscribe]
+                ).start()
+            if event is not None:
+                events.append(event)
+        return events
+
+    return asyncio.run(run())
+
+
+def test_stream_starts_from_last_event_and_stops_at_terminal():
+    topic = session_topic(uuid.uuid4())
+    publish_progress(topic, "queued")
+    events = _collect(topic, [
+        ("extracting", {"doc": "recent"}),
+        ("ocr", {"doc": "recent", "page": 2, "pages": 4}),
+        ("computing_trend", {}),
+        ("verified", {}),
+        ("extracting", {"doc": "old"}),  # dopo il terminale: non consegnato
+    ])
+    assert [e["stage"] for e in events] == ["queued", "extracting", "ocr", "computing_trend", "verified"]
+    assert events[2]["label"].endswith("pagina 2/4")
+    assert events[-1]["terminal"] is True
+
+
+class _FakeSession:
+    def __init__(self, status: str):
+        self.status = status
+
+
+class _FakeDB:
+    opened: list["_FakeDB"] = []
+
+    def __init__(self, status: str):
+        self.status = status
+        self.closed = False
+        _FakeDB.opened.append(self)
+
+    def get(self, model, key):
+        return _FakeSession(self.status)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+def _client(monkeypatch, status: str) -> TestClient:
+    monkeypatch.setattr(analysis, "get_sessionmaker", lambda: lambda: _FakeDB(status))
+    app = FastAPI()
+    app.include_router(analysis.router, prefix="/api")
+    return TestClient(app)
+
+
+def test_sse_endpoint_streams_progress_events(monkeypatch):
+    sid = uuid.uuid4()
+    topic = session_topic(sid)
+    publish_progress(topic, "computing_trend")
+    publish_progress(topic, "verified")
+    with _client(monkeypatch, "zone_set").stream("GET", f"/api/analyze/events/{sid}") as r:
+        assert r.headers["content-type"].startswith("text/event-stream")
+        assert _FakeDB.opened[-1].closed  # connessione già restituita al pool durante lo stream
+        body = "".join(r.iter_text())
+    data = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+    assert [d["stage"] for d in data] == ["verified"]
+
+
+def test_sse_endpoint_closes_immediately_for_finished_sessions(monkeypatch):
+    with _client(monkeypatch, "verified").stream("GET", f"/api/analyze/events/{uuid.uuid4()}") as r:
+        body = "".join(r.iter_text())
+    assert '"stage": "verified"' in body
+
+
+def test_websocket_variant(monkeypatch):
+    sid = uuid.uuid4()
+    publish_progress(session_topic(sid), "error", detail="timeout")
+    with _client(monkeypatch, "zone_set").websocket_connect(f"/api/analyze/ws/{sid}") as ws:
+        event = ws.receive_json()
+    assert event["stage"] == "error" and event["detail"] == "timeout"
+
+
+class _FakePubSub:
+    """Subscriber connection of a fake asyncio Redis client."""
+
+    def __init__(self):
+        self.subscribed: list[str] = []
+        self.unsubscribed: list[str] = []
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.subscribed.append(channel)
+
+    async def unsubscribe(self, channel):
+        self.unsubscribed.append(channel)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def test_redis_streams_share_one_subscriber_connection():
+    class _FakeClient:
+        pubsubs: list[_FakePubSub] = []
+
+        def pubsub(self):
+            self.pubsubs.append(_FakePubSub())
+            return self.pubsubs[-1]
+
+    async def run():
+        client = _FakeClient()
+        listener = progress._RedisListener(client)
+        bus = progress.RedisProgressBus("redis://localhost:6379/0")
+        bus._async = (asyncio.get_running_loop(), client, listener)
+
+        subs = [await bus.subscribe("session:a"), await bus.subscribe("session:a"), await bus.subscribe("session:b")]
+        pubsub = client.pubsubs[0]
+        assert len(client.pubsubs) == 1
+        assert pubsub.subscribed == ["progress:session:a", "progress:session:b"]  # una volta per canale
+
+        event = progress.make_event("extracting", doc="recent")
+        await pubsub.messages.put({"type": "message", "channel": b"progress:session:a", "data": json.dumps(event)})
+        assert [await s.get(1.0) for s in subs[:2]] == [event, event]
+        assert await subs[2].get(0.05) is None
+
+        await subs[0].close()
+        assert pubsub.unsubscribed == []  # l'altro client aspetta ancora session:a
+        for sub in subs[1:]:
+            await sub.close()
+        assert pubsub.unsubscribed == ["progress:session:a", "progress:session:b"]
+        await asyncio.wait_for(listener.reader, 2.0)  # nessun client: il lettore si ferma
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import random
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app.db.base import Base
+from app.db.models import TrendResult, UserSession
+from app.services import trend_batch
+from app.services.trend_calc import compute_position, compute_user_trend
+
+
+def test_bulk_update_is_one_update_from_values():
+    ids = [uuid.uuid4(), uuid.uuid4()]
+    stmt = trend_batch.bulk_update_statement([(ids[0], "green", "a"), (ids[1], "red", "b")])
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("UPDATE trend_results SET position=v.position, explanation_short=v.explanation_short FROM (VALUES")
+    assert "AS v (id, position, explanation_short) WHERE trend_results.id = CAST(v.id AS UUID)" in sql
+
+
+def _bills(rng: random.Random) -> dict:
+    def value(hi: float) -> float | None:
+        return rng.choice([None, 0.0, round(rng.uniform(0, hi), 2)])
+    return {"total_due": value(400), "kwh": value(900), "smc": value(300)}
+
+
+def test_vectorized_matches_scalar():
+    np = pytest.importorskip("numpy")
+    rng = random.Random(7)
+    pairs = [(_bills(rng), _bills(rng)) for _ in range(2000)]
+    trends = trend_batch.compute_user_trends(
+        *([b[i]["total_due"] for b in pairs] for i in (0, 1)),
+        *([b[i]["kwh"] for b in pairs] for i in (0, 1)),
+        *([b[i]["smc"] for b in pairs] for i in (0, 1)),
+    )
+    zone = [rng.choice([None, round(rng.uniform(-40, 40), 1)]) for _ in pairs]
+    codes = trend_batch.compute_positions(trends["eur_per_kwh_delta_pct"], zone, 15.0, 30.0)
+    for i, (recent, old) in enumerate(pairs):
+        scalar = compute_user_trend(recent, old)
+        for key, expected in scalar.items():
+            got = trends[key][i]
+            assert (np.isnan(got) if expected is None else got == expected), (key, recent, old)
+        position, explanation = compute_position(scalar, {"eur_per_kwh_delta_pct": zone[i]})
+        assert (trend_batch.POSITIONS[codes[i]], trend_batch.POSITION_EXPLANATIONS[codes[i]]) == (position, explanation)
+
+
+def test_recompute_positions_in_chunks(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    from app.core.config import get_settings
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'batch.db'}")
+    Base.metadata.create_all(engine)
+    deltas = [5.0, 20.0, 40.0, None, 10.0]  # vs zona 0: verde, giallo, rosso, dati insufficienti, verde
+    with Session(engine) as db:
+        for d in deltas:
+            session = UserSession(status="verified")
+            db.add(session)
+            db.flush()
+            trend = compute_user_trend({"total_due": 100 + (d or 0), "kwh": 100 if d is not None else 0},
+                                       {"total_due": 100, "kwh": 100})
+            position, explanation = compute_position(trend, {"eur_per_kwh_delta_pct": 0.0})
+            db.add(TrendResult(session_id=session.id, user_trend_json=trend, position=position,
+                               explanation_short=explanation, zone_trend_json={"eur_per_kwh_delta_pct": 0.0}))
+        db.commit()
+
+        assert trend_batch.recompute_positions(db, chunk=2)["changed"] == 0
+
+        monkeypatch.setenv("TREND_GREEN_THRESHOLD_PCT", "8")
+        get_settings.cache_clear()
+        try:
+            dry = trend_batch.recompute_positions(db, chunk=2, dry_run=True)
+            assert dry == {"results": 5, "changed": 1, "positions": {"green": 1, "yellow": 3, "red": 1}}
+            assert trend_batch.recompute_positions(db, chunk=2) == dry
+        finally:
+            get_settings.cache_clear()
+        by_delta = {d if d is None else round(d, 6): r for r in db.query(TrendResult) for d in [r.eur_per_kwh_delta_pct]}
+        assert by_delta[10.0].position == "yellow"
+        assert by_delta[None].explanation_short == "Dati insufficienti per il confronto con la zona."
+    engine.dispose()
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import text
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.workers import db as worker_db
+
+
+@pytest.fixture
+def sqlite_worker_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'worker.db'}")
+    get_settings.cache_clear()
+    metrics.reset()
+    worker_db.init_worker_engine()
+    try:
+        yield
+    finally:
+        worker_db._on_worker_process_shutdown()
+        get_settings.cache_clear()
+
+
+def _run_task_query() -> int:
+    db = worker_db.get_worker_session()
+    try:
+        return db.execute(text("select 1")).scalar_one()
+    finally:
+        worker_db.close_worker_session()
+
+
+def test_engine_and_connections_are_reused_across_tasks(sqlite_worker_db):
+    engine = worker_db.get_worker_engine()
+    for _ in range(5):
+        assert _run_task_query() == 1
+    assert worker_db.get_worker_engine() is engine
+    assert metrics.get_counter("db_pool_connects") == 1
+    assert metrics.get_counter("db_pool_checkouts") == 5
+
+
+def test_engine_is_replaced_after_fork(sqlite_worker_db):
+    parent = worker_db.get_worker_engine()
+    _run_task_query()
+    worker_db._forget_engine_after_fork()
+    assert worker_db._engine is None
+    assert _run_task_query() == 1
+    assert worker_db.get_worker_engine() is not parent
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import pytest
+
+from app.workers import launch
+from app.workers.celery_app import app as celery_app
+
+
+def test_cpu_profile_leaves_cores_for_tesseract(monkeypatch):
+    monkeypatch.setattr(launch, "available_cores", lambda: 8)
+    argv = launch.worker_argv("cpu")
+    assert argv[argv.index("-Q") + 1] == "cpu"
+    assert argv[argv.index("--pool") + 1] == "prefork"
+    # 8 core / 2 tesseract concorrenti per figlio
+    assert argv[argv.index("--concurrency") + 1] == "4"
+
+
+def test_llm_profile_uses_threads():
+    argv = launch.worker_argv("llm", ["--without-gossip"])
+    assert argv[argv.index("--pool") + 1] == "threads"
+    assert argv[-1] == "--without-gossip"
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        launch.worker_argv("gpu")
+
+
+def test_long_tasks_are_acked_late_one_at_a_time():
+    assert celery_app.conf.worker_prefetch_multiplier == 1
+    assert celery_app.conf.task_acks_late is True
+    queues = {q.name for q in celery_app.conf.task_queues}
+    assert queues == {"cpu", "llm", "maintenance"}
+    assert celery_app.conf.task_routes["ttl_cleanup"]["queue"] == "maintenance"
+
+
+def test_maintenance_profile_runs_beat_with_zone_rollups():
+    argv = launch.worker_argv("maintenance")
+    assert "--beat" in argv and argv[argv.index("--pool") + 1] == "solo"
+    assert "--beat" not in launch.worker_argv("llm")
+    job = celery_app.conf.beat_schedule["refresh-zone-rollups"]
+    assert celery_app.conf.task_routes[job["task"]]["queue"] == "maintenance"
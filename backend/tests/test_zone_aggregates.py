@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import bisect
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.db.base import Base
+from app.db.models import TrendResult, UserSession, ZoneTrendStats
+from app.services import zone_aggregates
+from app.utils.quantile_sketch import KLLSketch
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'zones.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _add_result(db: Session, zone_key: str, delta: float | None) -> dict:
+    session = UserSession(status="verified", cap=zone_key, zone_key=zone_key)
+    db.add(session)
+    db.flush()
+    trend = {"eur_per_kwh_delta_pct": delta}
+    db.add(TrendResult(session_id=session.id, user_trend_json=trend, zone_trend_json={}, position="green",
+                       explanation_short=""))
+    zone_aggregates.record_zone_trend(db, zone_key, trend)
+    db.commit()
+    return trend
+
+
+def _stat(zone_trend: dict) -> dict:
+    return {k: zone_trend[k] for k in ("eur_per_kwh_delta_pct", "count")}
+
+
+def test_sketch_is_exact_below_k_and_bounded_above():
+    small = KLLSketch()
+    small.extend([3.0, 1.0, 2.0, 5.0, 4.0])
+    assert small.quantiles([0.0, 0.5, 1.0]) == [1.0, 3.0, 5.0]
+
+    rng = random.Random(3)
+    values = [rng.gauss(5, 8) for _ in range(50_000)]
+    big = KLLSketch()
+    big.extend(values)
+    assert big.n == 50_000 and len(big.to_dict()["levels"]) > 1
+    assert sum(map(len, big.levels)) <= 3 * big.k
+    ordered = sorted(values)
+    for q in (0.1, 0.5, 0.9):
+        rank = bisect.bisect_left(ordered, big.quantile(q)) / len(ordered)
+        assert abs(rank - q) < 0.02
+
+
+def test_sketch_merge_and_serialization():
+    rng = random.Random(4)
+    values = [rng.uniform(-20, 20) for _ in range(20_000)]
+    a, b = KLLSketch(), KLLSketch()
+    a.extend(values[:12_000])
+    b.extend(values[12_000:])
+    a.merge(KLLSketch.from_dict(b.to_dict()))
+    assert a.n == 20_000 and (a.min, a.max) == (min(values), max(values))
+    rank = bisect.bisect_left(sorted(values), a.quantile(0.5)) / len(values)
+    assert abs(rank - 0.5) < 0.02
+
+
+def test_incremental_stats_match_full_scan(db):
+    assert _stat(zone_aggregates.get_zone_trend_json(db, "20121")) == {"eur_per_kwh_delta_pct": 0.0, "count": 0}
+    rng = random.Random(5)
+    for _ in range(37):
+        _add_result(db, "20121", round(rng.uniform(-10, 30), 2))
+    _add_result(db, "20121", None)
+    _add_result(db, "00100", 4.0)
+
+    assert _stat(zone_aggregates.get_zone_trend_json(db, "20121")) == zone_aggregates.exact_zone_trend_json(db, "20121")
+    assert _stat(zone_aggregates.get_zone_trend_json(db, "00100")) == {"eur_per_kwh_delta_pct": 4.0, "count": 1}
+
+
+def test_rebuild_recomputes_from_results(db):
+    for d in (1.0, 2.0, 3.0):
+        _add_result(db, "20121", d)
+    # risultato cancellato (es. TTL): resta nello sketch fino al rebuild
+    db.delete(db.query(TrendResult).first())
+    db.commit()
+    assert zone_aggregates.get_zone_trend_json(db, "20121")["count"] == 3
+
+    assert zone_aggregates.rebuild_zone_stats(db) == 1
+    assert _stat(zone_aggregates.get_zone_trend_json(db, "20121")) == zone_aggregates.exact_zone_trend_json(db, "20121")
+    stats = db.get(ZoneTrendStats, "20121")
+    assert stats.count == 2 and stats.p10_delta_pct <= stats.median_delta_pct <= stats.p90_delta_pct
+
+
+def test_exact_stats_use_the_stored_column_and_indexes(db):
+    from sqlalchemy.dialects import postgresql
+
+    for d in (4.0, 1.0, 3.0, 2.0):
+        _add_result(db, "20121", d)
+    assert zone_aggregates.exact_zone_stats(db, "20121") == {"count": 4, "p10": 1.3, "median": 2.5, "p90": 3.7}
+
+    # query plan regression: both sides of the join are index searches, no table scan
+    sql = str(zone_aggregates.zone_deltas_query("20121").compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    plan = " | ".join(row[-1] for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+    assert "COVERING INDEX ix_user_sessions_zone_key_id" in plan
+    assert "INDEX ix_trend_results_session_id_delta" in plan
+    assert "SCAN" not in plan
+
+    # Postgres: aggregated server side, the JSON documents are not read
+    class _PgBind:
+        dialect = postgresql.dialect()
+
+    captured = []
+
+    class _Result:
+        def one(self):
+            return (0, None, None, None)
+
+    class _Db:
+        def get_bind(self):
+            return _PgBind()
+
+        def execute(self, stmt):
+            captured.append(str(stmt.compile(dialect=postgresql.dialect())))
+            return _Result()
+
+    assert zone_aggregates.exact_zone_trend_json(_Db(), "20121") == zone_aggregates.EMPTY_ZONE
+    assert "percentile_cont" in captured[0] and "WITHIN GROUP" in captured[0]
+    assert "user_trend_json" not in captured[0]
+
+
+def test_zone_without_stats_row_falls_back_to_exact_query(db):
+    _add_result(db, "20121", 6.0)
+    db.query(ZoneTrendStats).delete()
+    db.commit()
+    assert _stat(zone_aggregates.get_zone_trend_json(db, "20121")) == {"eur_per_kwh_delta_pct": 6.0, "count": 1}
+
+
+def test_sparse_cap_falls_back_to_prefix_then_region(db, monkeypatch):
+    from app.core.config import get_settings
+
+    monkeypatch.setenv("ZONE_MIN_SAMPLES", "4")
+    get_settings.cache_clear()
+    try:
+        assert zone_aggregates.zone_hierarchy("20121") == [("cap", "20121"), ("prefix", "p:201"), ("region", "r:Lombardia")]
+        assert zone_aggregates.zone_hierarchy("unknown") == [("cap", "unknown")]
+        _add_result(db, "20121", 50.0)
+        for d in (1.0, 2.0, 3.0):
+            _add_result(db, "20122", d)
+        for d in (4.0, 5.0):
+            _add_result(db, "24100", d)  # Bergamo: altro prefisso, stessa regione
+
+        # rollup non ancora calcolati: il CAP è l'unico livello, anche se sotto soglia
+        assert zone_aggregates.get_zone_trend_json(db, "20121")["level"] == "cap"
+
+        assert zone_aggregates.refresh_zone_rollups(db) == {"prefix": 2, "region": 1}
+        prefix = zone_aggregates.get_zone_trend_json(db, "20121")
+        assert prefix == {"eur_per_kwh_delta_pct": 2.5, "count": 4, "level": "prefix", "zone": "201"}
+        assert zone_aggregates.get_zone_trend_json(db, "24100")["level"] == "region"
+        region = db.get(ZoneTrendStats, "r:Lombardia")
+        assert (region.level, region.count, region.median_delta_pct) == ("region", 6, 3.5)
+
+        # un CAP che non esiste più sparisce anche dai rollup
+        db.query(ZoneTrendStats).filter(ZoneTrendStats.zone_key == "24100").delete()
+        db.commit()
+        assert zone_aggregates.refresh_zone_rollups(db) == {"prefix": 1, "region": 1}
+        assert db.get(ZoneTrendStats, "p:241") is None
+    finally:
+        get_settings.cache_clear()
+
+
+def test_refresh_jobs_are_serialized_on_postgres(db, monkeypatch):
+    from sqlalchemy.dialects import postgresql
+
+    from app.services import zone_windows
+
+    class _PgBind:
+        dialect = postgresql.dialect()
+
+    captured = []
+
+    class _Db:
+        def get_bind(self):
+            return _PgBind()
+
+        def execute(self, stmt):
+            captured.append(str(stmt.compile(dialect=postgresql.dialect())))
+
+    zone_aggregates._refresh_lock(_Db(), "refresh_zone_rollups")
+    assert len(captured) == 1 and "pg_advisory_xact_lock(hashtext(" in captured[0]
+
+    locks = []
+    monkeypatch.setattr(zone_aggregates, "_refresh_lock", lambda db, job: locks.append(job))
+    monkeypatch.setattr(zone_windows, "_refresh_lock", lambda db, job: locks.append(job))
+    _add_result(db, "20121", 1.0)
+    zone_aggregates.refresh_zone_rollups(db)
+    zone_windows.refresh_zone_windows(db)
+    assert locks[0] == "refresh_zone_rollups" and set(locks[1:]) == {"refresh_zone_windows"}
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.db.base import Base
+from app.db.models import (
+    ExtractedBill, TrendResult, UploadedDocument, UserSession, ZoneTrendMonthly, ZoneTrendWindow,
+)
+from app.services import zone_aggregates, zone_windows
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'windows.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _add_result(db: Session, zone_key: str, month: date, delta: float) -> None:
+    session = UserSession(status="verified", cap=zone_key, zone_key=zone_key)
+    db.add(session)
+    db.flush()
+    doc = UploadedDocument(session_id=session.id, doc_type="recent", file_path="/x.pdf", mime_type="application/pdf")
+    db.add(doc)
+    db.flush()
+    period_end = datetime(month.year, month.month, 20, tzinfo=timezone.utc)
+    db.add(ExtractedBill(session_id=session.id, doc_id=doc.id, period_end=period_end))
+    trend = {"eur_per_kwh_delta_pct": delta}
+    db.add(TrendResult(session_id=session.id, user_trend_json=trend, zone_trend_json={}, position="green",
+                       explanation_short=""))
+    zone_aggregates.record_zone_trend(db, zone_key, trend)
+    zone_windows.record_zone_month(db, zone_key, zone_windows.month_of(period_end), trend)
+    db.commit()
+
+
+def test_month_helpers():
+    assert zone_windows.add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert zone_windows.add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert zone_windows.month_of(datetime(2025, 2, 28, 23, tzinfo=timezone.utc)) == date(2025, 2, 1)
+
+
+def test_rolling_windows_by_bill_month(db):
+    # picco del 2022: non deve pesare sulle finestre del 2023
+    for d in (40.0, 50.0, 60.0):
+        _add_result(db, "20121", date(2022, 10, 1), d)
+    for month, d in ((date(2023, 9, 1), 1.0), (date(2023, 10, 1), 2.0), (date(2023, 11, 1), 3.0)):
+        _add_result(db, "20121", month, d)
+    assert db.get(ZoneTrendMonthly, ("20121", date(2022, 10, 1))).count == 3
+
+    zone_windows.refresh_zone_windows(db)
+    w3 = db.get(ZoneTrendWindow, ("20121", date(2023, 11, 1), 3))
+    assert (w3.count, w3.median_delta_pct) == (3, 2.0)
+    w12 = db.get(ZoneTrendWindow, ("20121", date(2023, 11, 1), 12))
+    assert (w12.count, w12.median_delta_pct) == (3, 2.0)  # 2022-10 è fuori dai 12 mesi
+    assert db.get(ZoneTrendWindow, ("20121", date(2023, 9, 1), 12)).count == 4  # 2022-10 .. 2023-09
+    assert db.get(ZoneTrendWindow, ("r:Lombardia", date(2023, 11, 1), 6)).level == "region"
+
+    window = zone_windows.get_zone_window_json(db, "20121", date(2023, 11, 1))
+    assert window == {"eur_per_kwh_delta_pct": 2.0, "count": 3, "level": "cap", "zone": "20121",
+                      "window_months": 12, "month": "2023-11"}
+    assert zone_windows.get_zone_window_json(db, "20121", date(2019, 1, 1)) is None
+
+    series = zone_windows.zone_series(db, "20121", date(2023, 11, 1), months=3)
+    assert [p["month"] for p in series["3"]] == ["2023-09", "2023-10", "2023-11"]
+    assert [p["count"] for p in series["12"]] == [4, 2, 3]
+
+
+def test_refresh_only_recomputes_dirty_months(db, monkeypatch):
+    _add_result(db, "20121", date(2023, 1, 1), 1.0)
+    _add_result(db, "00100", date(2023, 1, 1), 5.0)
+    zone_windows.refresh_zone_windows(db)
+    assert zone_windows.refresh_zone_windows(db) > 0  # ancora nella sovrapposizione
+
+    # nuovo mese in una sola zona: Roma non viene ricalcolata, Milano solo da febbraio in poi
+    monkeypatch.setattr(zone_windows, "REFRESH_OVERLAP", timedelta(0))
+    before = {(r.zone_key, r.month, r.window_months): r.computed_at for r in db.query(ZoneTrendWindow)}
+    _add_result(db, "20121", date(2023, 2, 1), 3.0)
+    zone_windows.refresh_zone_windows(db)
+    after = {(r.zone_key, r.month, r.window_months): r.computed_at for r in db.query(ZoneTrendWindow)}
+    changed = {k for k, v in after.items() if before.get(k) != v}
+    assert changed and all(k[0] in ("20121", "p:201", "r:Lombardia") and k[1] >= date(2023, 2, 1) for k in changed)
+    assert db.get(ZoneTrendWindow, ("20121", date(2023, 2, 1), 3)).median_delta_pct == 2.0
+
+
+def test_rebuild_months_from_results(db):
+    for d in (1.0, 2.0, 3.0):
+        _add_result(db, "20121", date(2024, 5, 1), d)
+    db.delete(db.query(TrendResult).first())
+    db.query(ZoneTrendMonthly).delete()
+    db.commit()
+
+    assert zone_windows.rebuild_zone_months(db, ["20121"]) == 1
+    assert db.get(ZoneTrendMonthly, ("20121", date(2024, 5, 1))).count == 2
+    zone_windows.refresh_zone_windows(db, full=True)
+    assert db.get(ZoneTrendWindow, ("20121", date(2024, 5, 1), 3)).count == 2
@@ -6,7 +6,7 @@ import { useEffect, useMemo, useState } from "react";
 import { Button } from "@/components/Button";
 import { Card } from "@/components/Card";
 import { Progress } from "@/components/Progress";
-import { getStatus } from "@/lib/api";
+import { getStatus, submissionEvents } from "@/lib/api";
 import type { SubmissionStatus } from "@/lib/types";
 
 export default function ProcessingPage() {
@@ -18,17 +18,35 @@ export default function ProcessingPage() {
   const [error, setError] = useState<string | null>(null);
   const [tick, setTick] = useState(0);
   const [timeoutReached, setTimeoutReached] = useState(false);
+  // avanzamento in streaming (SSE); polling solo se lo stream non è disponibile
+  const [stageLabel, setStageLabel] = useState<string | null>(null);
+  const [stagePct, setStagePct] = useState<number | null>(null);
+  const [polling, setPolling] = useState(false);
+
+  useEffect(() => {
+    return submissionEvents(
+      id,
+      (event) => {
+        setStageLabel(event.label);
+        setStagePct(event.pct);
+        // a fine analisi serve lo stato completo (share_token / errore)
+        if (event.terminal) setTick((x) => x + 1);
+      },
+      () => setPolling(true)
+    );
+  }, [id]);
 
   const progress = useMemo(() => {
+    if (stagePct !== null && status?.analysis_state !== "done") return Math.max(10, stagePct);
     if (!status) return 10;
     if (status.analysis_state === "running" || status.analysis_state === "pending") return 55;
     if (status.analysis_state === "done") return 100;
     return 100;
-  }, [status]);
+  }, [status, stagePct]);
 
   useEffect(() => {
     let mounted = true;
-    const t = setInterval(() => setTick((x) => x + 1), 1500);
+    const t = polling ? setInterval(() => setTick((x) => x + 1), 1500) : undefined;
     // Timeout dopo 3 minuti
     const timeout = setTimeout(() => {
       if (mounted && status && status.analysis_state !== "done" && status.analysis_state !== "error") {
@@ -37,10 +55,10 @@ export default function ProcessingPage() {
     }, 180000); // 3 minuti
     return () => {
       mounted = false;
-      clearInterval(t);
+      if (t) clearInterval(t);
       clearTimeout(timeout);
     };
-  }, [status]);
+  }, [status, polling]);
 
   useEffect(() => {
     let cancelled = false;
@@ -78,7 +96,7 @@ export default function ProcessingPage() {
           <div className="text-sm text-zinc-300">
             {status ? (
               <>
-                Stato: <span className="font-semibold text-zinc-100">{status.analysis_state}</span>
+                Stato: <span className="font-semibold text-zinc-100">{stageLabel ?? status.analysis_state}</span>
               </>
             ) : (
               "Connessione…"
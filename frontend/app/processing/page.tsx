@@ -4,60 +4,75 @@ import { Suspense, useEffect, useState } from "react";
 import { useSearchParams } from "next/navigation";
 import { TrustBar } from "@/components/TrustBar";
 import { api } from "@/lib/api";
-import type { SubmissionStatus } from "@/lib/types";
+import type { AnalysisProgressEvent } from "@/lib/types";
+
+const POLL_LABELS: Record<string, { label: string; pct: number }> = {
+  pending: { label: "In coda...", pct: 20 },
+  running: { label: "Elaborazione bollette...", pct: 60 },
+  done: { label: "Completato. Reindirizzamento...", pct: 100 },
+  error: { label: "Si è verificato un errore. Riprova dalla pagina di upload.", pct: 100 },
+};
 
 function ProcessingInner() {
   const searchParams = useSearchParams();
   const jobId = searchParams.get("job_id");
   const sessionId = searchParams.get("session_id");
-  const [status, setStatus] = useState<SubmissionStatus | "">("");
-  const [sessionStatus, setSessionStatus] = useState<string | null>(null);
+  const [label, setLabel] = useState(POLL_LABELS.pending.label);
+  const [pct, setPct] = useState(POLL_LABELS.pending.pct);
+  const [failed, setFailed] = useState(false);
 
   useEffect(() => {
     if (!jobId || !sessionId) return;
-    const t = setInterval(async () => {
-      const res = await api.analyzeStatus(jobId, sessionId);
-      setStatus(res.status);
-      setSessionStatus(res.session_status ?? null);
-      const phase = res.status.analysis_state;
-      if (phase === "done" && res.session_status === "verified") {
-        clearInterval(t);
-        window.location.href = `/result/${sessionId}`;
-      }
-      if (phase === "error") {
-        clearInterval(t);
-      }
-    }, 2000);
-    return () => clearInterval(t);
-  }, [jobId, sessionId]);
+    let timer: ReturnType<typeof setInterval> | undefined;
+
+    const goToResult = () => {
+      window.location.href = `/result/${sessionId}`;
+    };
 
-  const displayStatus =
-    typeof status === "object" && status !== null && "analysis_state" in status
-      ? status.analysis_state
-      : (status || "pending");
+    // Fallback: polling dello stato (browser senza EventSource o stream non raggiungibile)
+    const startPolling = () => {
+      timer = setInterval(async () => {
+        const res = await api.analyzeStatus(jobId, sessionId);
+        const phase = res.status.analysis_state;
+        setLabel(POLL_LABELS[phase].label);
+        setPct(POLL_LABELS[phase].pct);
+        if (phase === "done" && res.session_status === "verified") {
+          clearInterval(timer);
+          goToResult();
+        }
+        if (phase === "error") {
+          clearInterval(timer);
+          setFailed(true);
+        }
+      }, 2000);
+    };
+
+    const close = api.analyzeEvents(
+      sessionId,
+      (event: AnalysisProgressEvent) => {
+        setLabel(event.stage === "error" ? POLL_LABELS.error.label : event.label);
+        setPct(event.pct);
+        if (event.stage === "verified") goToResult();
+        if (event.stage === "error") setFailed(true);
+      },
+      startPolling
+    );
+    return () => {
+      close();
+      if (timer) clearInterval(timer);
+    };
+  }, [jobId, sessionId]);
 
   return (
     <main className="min-h-screen bg-zinc-950 text-zinc-100 p-6">
       <TrustBar />
       <div className="max-w-xl mx-auto pt-12 text-center space-y-4">
         <h1 className="text-xl font-semibold">Analisi in corso</h1>
-        <p className="text-zinc-400">
-          {displayStatus === "pending" && "In coda..."}
-          {displayStatus === "running" && "Elaborazione bollette..."}
-          {displayStatus === "done" && "Completato. Reindirizzamento..."}
-          {displayStatus === "error" && "Si è verificato un errore. Riprova dalla pagina di upload."}
-        </p>
+        <p className={failed ? "text-red-400" : "text-zinc-400"}>{label}</p>
         <div className="h-2 w-full bg-zinc-800 rounded-full overflow-hidden">
           <div
-            className="h-full bg-emerald-500 transition-all duration-500"
-            style={{
-              width:
-                displayStatus === "done"
-                  ? "100%"
-                  : displayStatus === "running"
-                  ? "60%"
-                  : "20%",
-            }}
+            className={`h-full transition-all duration-500 ${failed ? "bg-red-500" : "bg-emerald-500"}`}
+            style={{ width: `${pct}%` }}
           />
         </div>
       </div>
@@ -50,7 +50,7 @@ export default function ResultPage() {
           <p className="font-medium capitalize">{data.position === "green" ? "In linea" : data.position === "yellow" ? "In scostamento" : "Fuori trend"}</p>
           <p className="text-sm text-zinc-300 mt-1">{data.explanation_short}</p>
         </div>
-        <TrendChart userTrend={data.user_trend_json} zoneTrend={data.zone_trend_json} />
+        <TrendChart userTrend={data.user_trend_json} zoneTrend={data.zone_trend_json} zoneLevel={data.zone_level} zoneSeries={data.zone_series} />
         <div className="flex flex-wrap gap-3">
           <PassportCard sessionId={sessionId} />
           <Link
@@ -1,13 +1,72 @@
 "use client";
 
+import type { ZoneSeriesPoint } from "@/lib/types";
+
 interface TrendChartProps {
   userTrend: Record<string, unknown>;
   zoneTrend: Record<string, unknown>;
+  zoneLevel?: string | null;
+  zoneSeries?: Record<string, ZoneSeriesPoint[]>;
+}
+
+const SERIES_STYLE: Record<string, { color: string; label: string }> = {
+  "3": { color: "#a1a1aa", label: "3 mesi" },
+  "12": { color: "#10b981", label: "12 mesi" },
+};
+
+function zoneLabel(level: string | null | undefined, zone: unknown): string {
+  if (level === "prefix" && zone) return `Area ${zone}xx`;
+  if (level === "region" && zone) return `${zone}`;
+  return "Zona";
+}
+
+function ZoneCurves({ series }: { series: Record<string, ZoneSeriesPoint[]> }) {
+  const lines = Object.entries(SERIES_STYLE)
+    .map(([window, style]) => ({ ...style, points: (series[window] ?? []).filter((p) => p.median != null) }))
+    .filter((l) => l.points.length > 1);
+  if (!lines.length) return null;
+  const months = Array.from(new Set(lines.flatMap((l) => l.points.map((p) => p.month)))).sort();
+  const values = lines.flatMap((l) => l.points.map((p) => p.median as number));
+  const lo = Math.min(0, ...values);
+  const hi = Math.max(0, ...values);
+  const x = (month: string) => (months.length > 1 ? (months.indexOf(month) / (months.length - 1)) * 100 : 50);
+  const y = (v: number) => (hi === lo ? 20 : 38 - ((v - lo) / (hi - lo)) * 36);
+
+  return (
+    <div className="mt-4">
+      <svg viewBox="0 0 100 40" preserveAspectRatio="none" className="w-full h-24">
+        <line x1="0" x2="100" y1={y(0)} y2={y(0)} stroke="#3f3f46" strokeWidth="0.3" />
+        {lines.map((l) => (
+          <polyline
+            key={l.label}
+            fill="none"
+            stroke={l.color}
+            strokeWidth="0.8"
+            vectorEffect="non-scaling-stroke"
+            points={l.points.map((p) => `${x(p.month)},${y(p.median as number)}`).join(" ")}
+          />
+        ))}
+      </svg>
+      <div className="flex justify-between text-xs text-zinc-500 mt-1">
+        <span>{months[0]}</span>
+        <span>
+          {lines.map((l) => (
+            <span key={l.label} className="ml-3" style={{ color: l.color }}>
+              Zona {l.label}
+            </span>
+          ))}
+        </span>
+        <span>{months[months.length - 1]}</span>
+      </div>
+    </div>
+  );
 }
 
-export function TrendChart({ userTrend, zoneTrend }: TrendChartProps) {
+export function TrendChart({ userTrend, zoneTrend, zoneLevel, zoneSeries }: TrendChartProps) {
   const userDelta = (userTrend?.eur_per_kwh_delta_pct as number) ?? 0;
   const zoneDelta = (zoneTrend?.eur_per_kwh_delta_pct as number) ?? 0;
+  const label = zoneLabel(zoneLevel ?? (zoneTrend?.level as string | undefined), zoneTrend?.zone);
+  const count = zoneTrend?.count as number | undefined;
 
   return (
     <div className="p-4 rounded-lg bg-zinc-900 border border-zinc-800">
@@ -25,12 +84,15 @@ export function TrendChart({ userTrend, zoneTrend }: TrendChartProps) {
             className="w-full bg-zinc-500 rounded-t min-h-[4px] max-h-full"
             style={{ height: `${Math.min(100, Math.max(0, 50 + zoneDelta))}%` }}
           />
-          <span className="text-xs text-zinc-500 mt-2">Zona</span>
+          <span className="text-xs text-zinc-500 mt-2">{label}</span>
         </div>
       </div>
       <p className="text-xs text-zinc-500 mt-4">
-        Variazione % €/kWh: Tu {userDelta.toFixed(1)}% · Zona {zoneDelta.toFixed(1)}%
+        Variazione % €/kWh: Tu {userDelta.toFixed(1)}% · {label} {zoneDelta.toFixed(1)}%
+        {count ? ` (${count} bollette)` : ""}
+        {zoneTrend?.window_months ? `, ultimi ${zoneTrend.window_months} mesi` : ""}
       </p>
+      {zoneSeries && <ZoneCurves series={zoneSeries} />}
     </div>
   );
 }
@@ -1,4 +1,5 @@
 import type {
+  AnalysisProgressEvent,
   AdminSubmissionDetail,
   AdminSubmissionListItem,
   AnalyzeStartResponse,
@@ -83,6 +84,53 @@ export async function analyzeStatus(jobId: string, sessionId: string): Promise<A
   };
 }
 
+/**
+ * Stream analysis progress (SSE). Returns a function that closes the stream.
+ * `onError` fires when the stream cannot be used (caller falls back to polling).
+ */
+function progressEvents(
+  path: string,
+  onEvent: (event: AnalysisProgressEvent) => void,
+  onError: () => void
+): () => void {
+  if (typeof window === "undefined" || typeof EventSource === "undefined") {
+    onError();
+    return () => {};
+  }
+  const source = new EventSource(`${API_BASE}${path}`);
+  let failures = 0;
+  source.onopen = () => {
+    failures = 0;
+  };
+  source.addEventListener("progress", (e) => {
+    failures = 0;
+    const event = JSON.parse((e as MessageEvent).data) as AnalysisProgressEvent;
+    onEvent(event);
+    if (event.terminal) source.close();
+  });
+  source.onerror = () => {
+    // EventSource riconnette da solo dopo un errore di rete; una risposta HTTP di errore
+    // (404, 502/503 durante un deploy) la chiude definitivamente: polling subito.
+    // Dopo qualche riconnessione fallita si passa comunque al polling
+    failures += 1;
+    if (source.readyState === EventSource.CLOSED || failures >= 3) {
+      source.close();
+      onError();
+    }
+  };
+  return () => source.close();
+}
+
+// session flow: GET /api/analyze/events/:session_id
+export function analyzeEvents(sessionId: string, onEvent: (event: AnalysisProgressEvent) => void, onError: () => void) {
+  return progressEvents(`/analyze/events/${encodeURIComponent(sessionId)}`, onEvent, onError);
+}
+
+// submission flow: GET /api/submissions/:id/events
+export function submissionEvents(submissionId: string, onEvent: (event: AnalysisProgressEvent) => void, onError: () => void) {
+  return progressEvents(`/submissions/${encodeURIComponent(submissionId)}/events`, onEvent, onError);
+}
+
 export async function getReport(token: string): Promise<Report> {
   return apiFetch<Report>(`/report/${token}`, { cache: "no-store" as any });
 }
@@ -192,6 +240,7 @@ export const api = {
   uploadFile,
   analyze,
   getStatus,
+  submissionEvents,
   getReport,
   requestCorrection,
 
@@ -201,6 +250,7 @@ export const api = {
   upload: sessionUpload,
   analyzeStart,
   analyzeStatus,
+  analyzeEvents,
   getResult,
   shareGenerate,
   passportGenerate,
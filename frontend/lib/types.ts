@@ -21,6 +21,15 @@ export type Report = {
   comparison_warning?: string | null;
 };
 
+/** One month of a rolling-window zone curve. */
+export interface ZoneSeriesPoint {
+  month: string;
+  median: number | null;
+  p10: number | null;
+  p90: number | null;
+  count: number;
+}
+
 /** Response from GET /api/result/:session_id (session flow). */
 export interface ResultResponse {
   session_id: string;
@@ -28,6 +37,10 @@ export interface ResultResponse {
   explanation_short: string;
   user_trend_json: Record<string, unknown>;
   zone_trend_json: Record<string, unknown>;
+  /** Zone level used for the comparison (smallest with enough samples); null for older results. */
+  zone_level?: "cap" | "prefix" | "region" | null;
+  /** Rolling-window (3/6/12 bill months) zone medians up to the user's bill month, keyed by window length. */
+  zone_series?: Record<string, ZoneSeriesPoint[]>;
   passport_pdf_url: string | null;
   share_image_url: string | null;
   share_token: string | null;
@@ -91,6 +104,19 @@ export interface AnalyzeStatusResponse {
   session_id?: string;
 }
 
+/** Progress event streamed by GET /api/analyze/events/:session_id (SSE). */
+export interface AnalysisProgressEvent {
+  stage: string;
+  label: string;
+  pct: number;
+  terminal: boolean;
+  ts: number;
+  doc?: string;
+  page?: number;
+  pages?: number;
+  detail?: string | null;
+}
+
 /** Admin workflow status (string union for UI + validation). */
 export type AdminWorkflowStatus = "new" | "reviewed" | "contacted" | "closed";
 